@@ -0,0 +1,39 @@
+"""要抓取的微博账号列表
+
+账号列表保存在 config/accounts.json, crawl.py 按它并行抓取, generate_json.py
+按它合并各账号的抓取结果:
+
+    {"version": 1,
+     "accounts": [{"id": "7716940453", "name": "地下偶像相关揭示板", "kind": "board"},
+                  {"id": "1234567890", "name": "某场地", "kind": "post", "venue": "育音堂"}, ...]}
+
+kind 决定 generate_json.py 如何筛选该账号的微博:
+- board: 情报汇总号, 只取以 #live演出情报 开头的转发, 正文为其中的转发内容;
+- post: 场地、主办、团体的账号, 原创与转发都取, 正文提到上海的场地才保留。
+  给出 venue 时 (场地自己的账号), 正文没有提到场地也按该场地处理。
+
+since_date 可选, 覆盖 config.json 中的 since_date。
+"""
+import json
+import os
+
+ACCOUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "accounts.json")
+KINDS = ("board", "post")
+
+
+def load_accounts(path=ACCOUNTS_FILE) -> list:
+    """读取账号列表, 按 id 去重并检查 kind"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    accounts = {}
+    for account in data.get("accounts", []):
+        account = {"kind": "board", **account, "id": str(account["id"])}
+        if account["kind"] not in KINDS:
+            raise ValueError(f"账号 {account['id']} 的 kind 不支持: {account['kind']}")
+        accounts.setdefault(account["id"], account)
+    return list(accounts.values())
+
+
+def dump_path(weibo_dir: str, user_id: str) -> str:
+    """爬虫 (result_dir_name 为 1) 为该账号生成的 json 文件"""
+    return os.path.join(weibo_dir, user_id, f"{user_id}.json")
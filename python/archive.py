@@ -0,0 +1,297 @@
+"""筛选结果与提取结果的压缩归档
+
+database/json 每天一个未压缩的 result_*.jsonl, database/tinydb 中的中文全部
+转义为 \\uXXXX, 历史越积越多。归档按种类各放一个目录, 只追加不改写:
+
+    database/archive/raw/      generate_json.py 筛选出的微博, 按发布日期索引
+    database/archive/events/   llm.py 提取出的演出, 按演出日期 (store.day_for) 索引
+
+每个目录由若干段组成, 段写满 SEGMENT_BYTES 后换下一段:
+
+    000001.gz   gzip 成员依次拼接, 每个成员是一个块 (约 BLOCK_BYTES 的 JSON Lines),
+                整个文件仍可以直接 zcat
+    000001.idx  每个块一行 [偏移, 长度, [[weibo_id, 日期, 哈希], ...]]
+
+打开归档时只读 .idx, 在内存中建立 weibo_id -> 块、日期 -> 块 的索引。按 ID 或
+日期查询时用 mmap 取出对应的块单独解压, 不解压无关的数据; scan 按块顺序流式
+读取, 给出日期范围时跳过范围外的块。同一 weibo_id 再次写入时追加新版本, 读取
+时以最后一次为准, 内容没变 (哈希相同) 的记录不重复写入。
+
+先写块再写 .idx, 写入中断时段尾多出的半个块在下次写入前截掉。
+
+导入已有的 database/json 与 database/tinydb:
+    python python/archive.py pack
+查询:
+    python python/archive.py get Q0ScChq00 --kind events
+    python python/archive.py scan --kind raw --since 2025-09-01 --until 2025-09-30
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import zlib
+
+from store import day_for
+
+ARCHIVE_DIR = "database/archive"
+# 块解压前的大小, 按 ID 查询一条记录最多解压这么多
+BLOCK_BYTES = 1 << 16
+SEGMENT_BYTES = 8 << 20
+# scan 不限结束日期时的上界, 大于任何日期字符串
+MAX_DAY = "\uffff"
+
+
+def publish_day(record: dict) -> str:
+    return str(record.get("date", ""))[:10]
+
+
+# 种类 -> 索引用的日期
+KINDS = {"raw": publish_day, "events": day_for}
+
+
+def record_hash(line: bytes) -> str:
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+
+class Archive:
+    """一种记录的归档, 写入在块写满、flush() 或 close() 时落盘"""
+
+    def __init__(self, path: str, date_of=publish_day, block_bytes=BLOCK_BYTES, segment_bytes=SEGMENT_BYTES):
+        self.path = path
+        self.date_of = date_of
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        # 块号 -> (段号, 偏移, 长度, [[weibo_id, 日期, 哈希], ...])
+        self.blocks = []
+        # weibo_id -> (块号, 块内序号, 哈希), 只记最后一次写入的版本
+        self.ids = {}
+        self.dates = {}
+        self.segment_ends = {}
+        self.pending = {}
+        self.pending_bytes = 0
+        # 本次打开以来实际写入的行数
+        self.written = 0
+        self.maps = {}
+        self.cached = (None, None)
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.ids.keys() | self.pending.keys())
+
+    def __contains__(self, weibo_id):
+        return weibo_id in self.pending or weibo_id in self.ids
+
+    def segment_path(self, segment: int, ext: str) -> str:
+        return os.path.join(self.path, f"{segment:06d}.{ext}")
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            return
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith(".idx"))
+        for segment in segments:
+            size = os.path.getsize(self.segment_path(segment, "gz")) if os.path.isfile(
+                self.segment_path(segment, "gz")) else 0
+            self.segment_ends[segment] = 0
+            with open(self.segment_path(segment, "idx"), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        offset, length, entries = json.loads(line)
+                    except ValueError:
+                        break
+                    # .idx 写完而段文件不完整的块不可用
+                    if offset + length > size:
+                        break
+                    self.index_block(segment, offset, length, entries)
+
+    def index_block(self, segment, offset, length, entries):
+        block = len(self.blocks)
+        self.blocks.append((segment, offset, length, entries))
+        self.segment_ends[segment] = offset + length
+        for i, (weibo_id, day, digest) in enumerate(entries):
+            self.ids[weibo_id] = (block, i, digest)
+            blocks = self.dates.setdefault(day, [])
+            if not blocks or blocks[-1] != block:
+                blocks.append(block)
+
+    # -------- 写入 --------
+    def append(self, record: dict) -> bool:
+        """追加一条记录, 与已归档的版本完全相同时跳过, 返回是否写入"""
+        weibo_id = str(record["weibo_id"])
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = record_hash(line)
+        if weibo_id in self.pending:
+            self.pending_bytes -= len(self.pending.pop(weibo_id)[0]) + 1
+        if self.ids.get(weibo_id, (None, None, None))[2] == digest:
+            return False
+        self.pending[weibo_id] = (line, [weibo_id, self.date_of(record), digest])
+        self.pending_bytes += len(line) + 1
+        if self.pending_bytes >= self.block_bytes:
+            self.flush()
+        return True
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        if not self.pending:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        segment = max(self.segment_ends, default=1)
+        end = self.segment_ends.get(segment, 0)
+        if end >= self.segment_bytes:
+            segment, end = segment + 1, 0
+        lines, entries = zip(*self.pending.values())
+        data = gzip.compress(b"\n".join(lines) + b"\n", compresslevel=6, mtime=0)
+        self.close_map(segment)
+        with open(self.segment_path(segment, "gz"), "ab") as f:
+            # 截掉上次写入中断时留下的半个块
+            f.truncate(end)
+            f.write(data)
+        with open(self.segment_path(segment, "idx"), "a", encoding="utf-8") as f:
+            f.write(json.dumps([end, len(data), entries], ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.index_block(segment, end, len(data), list(entries))
+        self.written += len(entries)
+        self.pending = {}
+        self.pending_bytes = 0
+
+    # -------- 读取 --------
+    def close_map(self, segment):
+        handle = self.maps.pop(segment, None)
+        if handle is not None:
+            handle[1].close()
+            handle[0].close()
+
+    def read_block(self, block: int) -> list:
+        """解压一个块, 返回其中各行 (bytes), 最近读过的一个块留在内存中"""
+        if self.cached[0] == block:
+            return self.cached[1]
+        segment, offset, length, _ = self.blocks[block]
+        if segment not in self.maps:
+            f = open(self.segment_path(segment, "gz"), "rb")
+            self.maps[segment] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        data = zlib.decompress(self.maps[segment][1][offset:offset + length], wbits=31)
+        lines = data.split(b"\n")[:-1]
+        self.cached = (block, lines)
+        return lines
+
+    def get(self, weibo_id: str):
+        """weibo_id 最后一次写入的记录, 不存在时为 None"""
+        if weibo_id in self.pending:
+            return json.loads(self.pending[weibo_id][0])
+        location = self.ids.get(weibo_id)
+        if location is None:
+            return None
+        return json.loads(self.read_block(location[0])[location[1]])
+
+    def blocks_between(self, since: str, until: str) -> list:
+        return sorted({block for day, blocks in self.dates.items() if since <= day <= until for block in blocks})
+
+    def scan(self, since: str = "", until: str = MAX_DAY):
+        """按写入顺序逐条给出 since <= 日期 <= until 的记录 (每个 weibo_id 只给最后一个版本)"""
+        everything = not since and until == MAX_DAY
+        blocks = range(len(self.blocks)) if everything else self.blocks_between(since, until)
+        for block in blocks:
+            entries = self.blocks[block][3]
+            for i, line in enumerate(self.read_block(block)):
+                weibo_id, day, _ = entries[i]
+                if since <= day <= until and self.ids[weibo_id][:2] == (block, i) and weibo_id not in self.pending:
+                    yield json.loads(line)
+        for line, (_, day, _) in list(self.pending.values()):
+            if since <= day <= until:
+                yield json.loads(line)
+
+    def __iter__(self):
+        return self.scan()
+
+    def on(self, day: str) -> list:
+        """某一天的记录"""
+        return list(self.scan(day, day))
+
+    def close(self):
+        self.flush()
+        for segment in list(self.maps):
+            self.close_map(segment)
+        self.cached = (None, None)
+
+
+def open_archive(kind: str, root: str = ARCHIVE_DIR) -> Archive:
+    return Archive(os.path.join(root, kind), KINDS[kind])
+
+
+def archive_records(kind: str, records, root: str = ARCHIVE_DIR) -> int:
+    """把 records 追加到 root 下的 kind 归档, root 为空时不归档, 返回写入的条数"""
+    if not root:
+        return 0
+    with open_archive(kind, root) as archive:
+        archive.extend(records)
+    return archive.written
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(path) for name in names)
+
+
+def pack(json_dir: str, tinydb_dir: str, root: str = ARCHIVE_DIR) -> dict:
+    """把 database/json 与 database/tinydb 中已有的记录导入归档, 可重复执行"""
+    written = {"raw": 0, "events": 0}
+    if json_dir and os.path.isdir(json_dir):
+        with open_archive("raw", root) as archive:
+            for fname in sorted(os.listdir(json_dir)):
+                if fname.startswith("result_") and fname.endswith(".jsonl"):
+                    with open(os.path.join(json_dir, fname), "r", encoding="utf-8") as f:
+                        archive.extend(json.loads(line) for line in f if line.strip())
+        written["raw"] = archive.written
+    if tinydb_dir and os.path.isdir(tinydb_dir):
+        with open_archive("events", root) as archive:
+            for fname in sorted(os.listdir(tinydb_dir)):
+                if fname.endswith(".json"):
+                    with open(os.path.join(tinydb_dir, fname), "r", encoding="utf-8") as f:
+                        docs = json.load(f).get("_default", {})
+                    archive.extend(docs[k] for k in sorted(docs, key=int))
+        written["events"] = archive.written
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="筛选结果与提取结果的压缩归档")
+    parser.add_argument("--root", default=ARCHIVE_DIR, help="归档目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("pack", help="导入 database/json 与 database/tinydb 中已有的记录")
+    p.add_argument("--json", default="database/json")
+    p.add_argument("--tinydb", default="database/tinydb")
+    p = sub.add_parser("get", help="按 weibo_id 查询")
+    p.add_argument("weibo_id")
+    p.add_argument("--kind", choices=KINDS, default="events")
+    p = sub.add_parser("scan", help="按日期范围输出 JSON Lines")
+    p.add_argument("--kind", choices=KINDS, default="events")
+    p.add_argument("--since", default="")
+    p.add_argument("--until", default=MAX_DAY)
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        written = pack(args.json, args.tinydb, args.root)
+        before = sum(dir_size(d) for d in (args.json, args.tinydb) if os.path.isdir(d))
+        after = dir_size(args.root)
+        print(f"写入 raw {written['raw']} 条, events {written['events']} 条; "
+              f"原目录 {before / 1024:.0f}KB, 归档 {after / 1024:.0f}KB")
+    elif args.command == "get":
+        with open_archive(args.kind, args.root) as archive:
+            record = archive.get(args.weibo_id)
+        print(json.dumps(record, ensure_ascii=False, indent=2) if record else f"{args.weibo_id} 不存在")
+    else:
+        with open_archive(args.kind, args.root) as archive:
+            for record in archive.scan(args.since, args.until):
+                print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1119 @@
+"""性能压测脚本, 不访问真实接口
+
+用法 (在仓库根目录运行):
+    python python/benchmark.py llm --records 40 --latency 0.5 --workers 8
+    python python/benchmark.py llm --records 40 --latency 0.1 --malformed_rate 0.3
+    python python/benchmark.py sink --records 2000 --dates 10
+    python python/benchmark.py store --records 20000 --dates 365
+    python python/benchmark.py fetch --pages 200
+    python python/benchmark.py crawl --accounts 8 --workers 4
+    python python/benchmark.py parse --pages 50 --save parse.json
+    python python/benchmark.py parse --data tests/testdata --baseline parse.json
+    python python/benchmark.py generate --posts 100000
+    python python/benchmark.py venues --posts 20000
+    python python/benchmark.py render --events 10000
+    python python/benchmark.py search --records 20000 --dates 730
+    python python/benchmark.py archive --records 20000 --dates 365
+    python python/benchmark.py rules --data database/json --llm database/tinydb
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# -------- 本地 LLM 桩服务 --------
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """模拟千帆 chat/completions, 可按比例返回 429
+
+    延迟 = latency + per_post_latency * 条数, 近似真实接口中输出长度带来的耗时;
+    批量 prompt (正文为 JSON 数组) 返回带 id 的 JSON 数组, 否则返回单个 json。
+    """
+    latency = 0.5
+    per_post_latency = 0.0
+    error_rate = 0.0
+    malformed_rate = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        prompt = json.loads(self.rfile.read(length))["messages"][0]["content"]
+        posts = prompt.rsplit("内容如下：\n", 1)[-1].strip()
+        batch = json.loads(posts) if posts.startswith("[") else None
+        time.sleep(self.latency + self.per_post_latency * (len(batch) if batch else 1))
+        if random.random() < self.error_rate:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        answer = {
+            "live_date": "2025-09-06",
+            "live_location": "上海 育音堂",
+            "groups": ["STARWINK", "STARLIGHT"],
+            "main_text": "stub",
+        }
+        if batch:
+            answer = [{"id": post["id"], **answer} for post in batch]
+        text = json.dumps(answer, ensure_ascii=False)
+        if random.random() < self.malformed_rate:
+            text = malform(answer)
+        body = json.dumps({"choices": [{"message": {"content": text}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def malform(answer):
+    """模仿 LLM 常见的不合规回答: 前后的说明文字、单引号、全角标点、换行未转义、缺字段"""
+    kind = random.randrange(4)
+    if kind == 0:
+        return "好的，以下是提取结果：\n" + json.dumps(answer, ensure_ascii=False) + "\n希望对你有帮助。"
+    if kind == 1:
+        return repr(answer)
+    if kind == 2:
+        return (json.dumps(answer, ensure_ascii=False).replace('"', "“", 1).replace(": ", "：")
+                .replace("stub", "第一行\n第二行"))
+    items = answer if isinstance(answer, list) else [answer]
+    dropped = [{k: v for k, v in item.items() if k != "live_location"} for item in items]
+    return json.dumps(dropped if isinstance(answer, list) else dropped[0], ensure_ascii=False)
+
+
+@contextlib.contextmanager
+def stub_server(latency, error_rate=0.0, per_post_latency=0.0, malformed_rate=0.0):
+    handler = type("Handler", (StubLLMHandler,), {
+        "latency": latency, "error_rate": error_rate, "per_post_latency": per_post_latency,
+        "malformed_rate": malformed_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/v2/chat/completions"
+    finally:
+        server.shutdown()
+
+
+def synthetic_records(n):
+    return [
+        {
+            "weibo_id": f"bench{i:06d}",
+            "url": f"https://weibo.cn/comment/bench{i:06d}",
+            "date": "2025-09-01 12:00",
+            "content": f"9／6（六）📍育音堂 第{i}场",
+        }
+        for i in range(n)
+    ]
+
+
+# -------- 模拟 weibo.cn 页面 --------
+PAGE_HEAD = ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"/>'
+             '</head><body>')
+PAGE_TAIL = '<div class="c"><form><input name="mp" value="%d"/></form></div></body></html>'
+
+
+def synthetic_post(i, retweet=True, long_text=False, picture=False, pic_all=False):
+    """按 weibo.cn 个人主页的结构生成一条微博的 div.c"""
+    wid = "B%08d" % i
+    full = '&nbsp;<a href="https://weibo.cn/comment/%s">全文</a>' % wid if long_text else ""
+    pic = ('<a href="https://weibo.cn/mblog/pic/%s?rl=1"><img src="https://wx1.sinaimg.cn/wap180/%s.jpg"/></a>'
+           % (wid, wid)) if picture else ""
+    if pic_all:
+        pic += '<a href="https://weibo.cn/mblog/picAll/%s?rl=1">组图共4张</a>' % wid
+    text = "【活动情报】第%d场 8／31（日）📍聚一场/上海广场⏰OP17:45 / ST18:00 演出团体 STARWINK（18:00～18:25）" % i
+    if retweet:
+        return ('<div class="c" id="M_%s"><div><span class="cmt">转发了&nbsp;<a href="https://weibo.cn/u/1">某团体</a>'
+                '&nbsp;的微博:</span><span class="ctt">%s</span>%s</div>'
+                '<div>%s<span class="cmt">赞[5]</span>&nbsp;<span class="cmt">原文转发[3]</span>&nbsp;'
+                '<a href="https://weibo.cn/comment/%s?rl=1#cmtfrm" class="cc">原文评论[1]</a></div>'
+                '<div><span class="cmt">转发理由:</span>#live演出情报#&nbsp;&nbsp;<a href="/attitude/%s">赞[0]</a>&nbsp;'
+                '<a href="/repost/%s">转发[0]</a>&nbsp;<a href="/comment/%s" class="cc">评论[0]</a>&nbsp;'
+                '<span class="ct">08月30日 23:55&nbsp;来自微博 weibo.com</span></div></div>'
+                ) % (wid, text, full, pic, wid, wid, wid, wid)
+    return ('<div class="c" id="M_%s"><div><span class="ctt">%s</span>%s</div>'
+            '<div>%s<a href="/attitude/%s">赞[1]</a>&nbsp;<a href="/repost/%s">转发[2]</a>&nbsp;'
+            '<a href="/comment/%s" class="cc">评论[3]</a>&nbsp;<span class="ct">08月30日 23:55&nbsp;来自iPhone</span>'
+            '</div></div>') % (wid, text, full, pic, wid, wid, wid)
+
+
+def synthetic_page(page, per_page=10, pages=100):
+    """第 page 页的个人主页 html
+
+    奇数条为原创, 偶数条为转发; 每 3 条有一条需要展开全文, 每 4 条有一条带图片,
+    其中一半是需要另行请求的组图。
+    """
+    start = (page - 1) * per_page
+    posts = "".join(
+        synthetic_post(i, retweet=(i % 2 == 0), long_text=(i % 3 == 0),
+                       picture=(i % 4 == 0), pic_all=(i % 8 == 0))
+        for i in range(start, start + per_page))
+    return PAGE_HEAD + posts + PAGE_TAIL % pages
+
+
+def synthetic_comment_page(weibo_id):
+    """微博详情页: 长微博全文与视频链接"""
+    return (PAGE_HEAD + '<div class="c">用户信息</div><div class="c" id="M_%s"><div>某团体:'
+            '<span class="ctt">完整的长微博正文 %s 演出团体 STARWINK STARLIGHT</span>原文转发[1]&nbsp;'
+            '<a href="https://m.weibo.cn/s/video/show?object_id=1">视频</a>'
+            '<span class="ct">08月30日 23:55</span></div></div></body></html>') % (weibo_id, weibo_id)
+
+
+def synthetic_pic_all_page(weibo_id):
+    return PAGE_HEAD + "".join(
+        '<img src="https://wx1.sinaimg.cn/thumb180/%s_%d.jpg"/>' % (weibo_id, k) for k in range(4)
+    ) + "</body></html>"
+
+
+def load_spider_modules():
+    """把本仓库的 metrics.py / util.py / page_parser.py 作为 weibo_spider.parser 的子模块加载
+
+    与 workflow 中覆盖 site-packages 的效果相同, 但不修改已安装的包。
+    """
+    import importlib.util
+
+    import weibo_spider.parser  # noqa: F401  先初始化父包
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    modules = {}
+    for name in ("metrics", "util", "page_parser"):
+        full_name = f"weibo_spider.parser.{name}"
+        spec = importlib.util.spec_from_file_location(full_name, os.path.join(here, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[full_name] = module
+        setattr(weibo_spider.parser, name, module)
+        spec.loader.exec_module(module)
+        modules[name] = module
+    return modules["util"], modules["page_parser"]
+
+
+class StubWeiboHandler(BaseHTTPRequestHandler):
+    """按 ?page=N 返回模拟页面, 使用 HTTP/1.1 以便客户端保持长连接
+
+    handshake 为每个新连接额外等待的时间, 用来模拟真实站点的 TCP+TLS 握手。
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    handshake = 0.0
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.handshake)
+
+    def do_GET(self):
+        page = int(self.path.rsplit("page=", 1)[-1]) if "page=" in self.path else 1
+        body = synthetic_page(page).encode("utf-8")
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def weibo_server(latency=0.0, handshake=0.0):
+    handler = type("Handler", (StubWeiboHandler,), {"latency": latency, "handshake": handshake})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+
+
+def run_quietly(func, *args, **kwargs):
+    """屏蔽被测脚本的逐条打印, 只保留耗时"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+# -------- llm.py 串行 / 批量 / 并发 / 缓存 --------
+def bench_llm(args):
+    import llm
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            stub_server(args.latency, args.error_rate, args.per_post_latency, args.malformed_rate) as url:
+        input_file = os.path.join(tmp, "input.jsonl")
+        with open(input_file, "w", encoding="utf-8") as f:
+            for record in synthetic_records(args.records):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        cache_file = os.path.join(tmp, "llm_cache.json")
+        # 最后一轮复用上一轮写下的缓存, 应当不再请求桩服务
+        runs = [("串行", 1, ["--no_cache"]),
+                ("批量", 1, ["--no_cache", "--batch_size", str(args.batch_size)]),
+                ("并发", args.workers, ["--cache", cache_file]),
+                ("缓存重跑", args.workers, ["--cache", cache_file])]
+        for label, workers, extra in runs:
+            db_file = os.path.join(tmp, f"events_{label}.db")
+            argv = ["--apikey", "stub", "--input", input_file, "--db", db_file,
+                    "--api_url", url, "--workers", str(workers), "--rps", str(args.rps), "--no_rules",
+                    "--metrics", "", "--archive", "", *extra]
+            start = time.perf_counter()
+            records = run_quietly(llm.main, argv)
+            elapsed = time.perf_counter() - start
+            print(f"{label} workers={workers:<3d} 记录 {len(records)} 条, 耗时 {elapsed:.2f}s, "
+                  f"每条 {elapsed / len(records) * 1000:.0f}ms, 请求 {llm.request_stats['calls']} 次, "
+                  f"输入 token {llm.request_stats['prompt_tokens']}, 缓存命中 {llm.cache.hits}")
+            if args.malformed_rate:
+                stats = llm.parse_stats
+                print(f"    回答直接可用 {stats['strict']}, 本地修复 {stats['repaired']}, "
+                      f"补问 {stats['requeried']}, 无法解析 {stats['failed']}")
+
+
+# -------- 演出信息写入: 逐条开关 TinyDB 文件 vs EventStore --------
+def legacy_insert(db_path, record):
+    """改造前 insert_by_date 的写法: 每条记录打开、查询、写回、关闭一次"""
+    from tinydb import Query, TinyDB
+    from tinydb.middlewares import CachingMiddleware
+    from tinydb.storages import JSONStorage
+
+    db = TinyDB(db_path, storage=CachingMiddleware(JSONStorage))
+    weibo = Query()
+    if db.get(weibo.weibo_id == record["weibo_id"]):
+        db.update(record, weibo.weibo_id == record["weibo_id"])
+    else:
+        db.insert(record)
+    db.close()
+
+
+def synthetic_live_events(n, dates, start="2025-10-01"):
+    """n 条分布在 dates 个日期上的演出记录, 场地与团体轮换"""
+    import venues
+
+    venue_names = [v["name"] for v in venues.load_matcher().venues if v["kind"] == "venue"]
+    first = time.mktime(time.strptime(start, "%Y-%m-%d"))
+    records = []
+    for i in range(n):
+        day = time.strftime("%Y-%m-%d", time.localtime(first + (i % dates) * 86400 + 3600))
+        records.append({
+            "weibo_id": f"bench{i:06d}", "url": f"https://weibo.cn/comment/bench{i:06d}",
+            "date": "2025-09-01 12:00", "live_date": day,
+            "live_location": venue_names[i % len(venue_names)] + " 1F",
+            "groups": [f"团体{i % 97:02d}", f"团体{(i * 7) % 97:02d}"],
+            "main_text": "演出情报" * 50,
+        })
+    return records
+
+
+def tinydb_path(directory, record):
+    """改造前 db_path_for 的分库规则"""
+    import store
+
+    day = store.day_for(record)
+    return os.path.join(directory, ("special" if day == store.SPECIAL_DAY else day) + ".json")
+
+
+def bench_sink(args):
+    import store
+
+    records = synthetic_live_events(args.records, args.dates)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for record in records:
+            legacy_insert(tinydb_path(tmp, record), record)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with store.EventStore(os.path.join(tmp, "events.db")) as events:
+            for record in records:
+                events.upsert(record)
+        batched = time.perf_counter() - start
+
+    print(f"{args.records} 条记录, {args.dates} 个日期")
+    print(f"逐条开关 TinyDB: {legacy:.2f}s, EventStore: {batched:.2f}s, 加速 {legacy / batched:.1f}x")
+
+
+def scan_tinydb(directory, keep, first="", last="9999"):
+    """改造前的查询方式: 打开日期范围内的每个 TinyDB 文件, 逐条过滤"""
+    from tinydb import TinyDB
+
+    found = []
+    for fname in sorted(os.listdir(directory)):
+        day = fname[:-len(".json")]
+        if fname == "special.json" or not first <= day <= last:
+            continue
+        db = TinyDB(os.path.join(directory, fname))
+        found += [doc for doc in db.all() if keep(doc)]
+        db.close()
+    return found
+
+
+def bench_store(args):
+    import store
+
+    records = synthetic_live_events(args.records, args.dates)
+    days = sorted({r["live_date"] for r in records})
+    first, last = days[len(days) // 2], days[len(days) // 2 + 6]
+    venue, group = records[0]["live_location"].split()[0], "团体05"
+    with tempfile.TemporaryDirectory() as tmp:
+        tiny_dir = os.path.join(tmp, "tinydb")
+        os.makedirs(tiny_dir)
+        by_path = {}
+        for record in records:
+            by_path.setdefault(tinydb_path(tiny_dir, record), []).append(record)
+        for path, docs in by_path.items():
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"_default": {str(i + 1): d for i, d in enumerate(docs)}}, f, ensure_ascii=False)
+        with store.EventStore(os.path.join(tmp, "events.db")) as events:
+            store.migrate(tiny_dir, events)
+
+            queries = [
+                ("一周内的演出", lambda: scan_tinydb(tiny_dir, lambda d: True, first, last),
+                 lambda: events.events_between(first, last)),
+                (f"{venue} 之后的演出", lambda: scan_tinydb(tiny_dir, lambda d: d["live_location"].startswith(venue), first),
+                 lambda: events.events_at_venue(venue, first)),
+                (f"{group} 之后的演出", lambda: scan_tinydb(tiny_dir, lambda d: group in d["groups"], first),
+                 lambda: events.events_for_group(group, first)),
+            ]
+            print(f"{args.records} 条记录, {len(days)} 个日期文件")
+            for name, scan, query in queries:
+                start = time.perf_counter()
+                scanned = scan()
+                scan_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    found = query()
+                query_seconds = (time.perf_counter() - start) / args.repeat
+                same = sorted(d["weibo_id"] for d in scanned) == sorted(d["weibo_id"] for d in found)
+                print(f"{name}: 扫描目录 {scan_seconds * 1000:.1f}ms, SQLite {query_seconds * 1000:.2f}ms, "
+                      f"{len(found)} 条{'' if same else ' (结果不一致!)'}")
+
+
+# -------- util.py: 每次新建连接 vs 共享连接池 --------
+def bench_fetch(args):
+    import requests
+    from lxml import etree
+
+    util, _ = load_spider_modules()
+
+    with weibo_server(args.latency, args.handshake) as base:
+        urls = [f"{base}/u/1/profile?page={p}" for p in range(1, args.pages + 1)]
+        headers = {"User-Agent": util.USER_AGENT, "Cookie": ""}
+
+        start = time.perf_counter()
+        for url in urls:
+            etree.HTML(requests.get(url, headers=headers).content)
+        bare = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for url in urls:
+            util.handle_html("", url)
+        pooled = time.perf_counter() - start
+
+    print(f"{args.pages} 页: requests.get 每页 {bare / args.pages * 1000:.2f}ms, "
+          f"共享连接池每页 {pooled / args.pages * 1000:.2f}ms")
+    for host, stats in util.request_stats.items():
+        print(f"{host}: 请求 {stats['count']} 次, 平均 {stats['seconds'] / stats['count'] * 1000:.2f}ms, "
+              f"最长 {stats['max_seconds'] * 1000:.2f}ms")
+    fetch = util.metrics.snapshot()["timers"]["http.fetch"]
+    print(f"http.fetch: p50 {fetch['p50'] * 1000:.2f}ms, p90 {fetch['p90'] * 1000:.2f}ms, p99 {fetch['p99'] * 1000:.2f}ms")
+
+
+# -------- PageParser 离线回放基准 --------
+PROFILE_URL = re.compile(r"^https://weibo\.cn/(.+?)/profile\?page=(\d+)$")
+
+
+def write_synthetic_replay(util, data_dir, user_uri, pages, per_page):
+    """生成与 util.GENERATE_TEST_DATA 录制格式相同的模拟回放数据"""
+    import requests
+
+    def record(url, text):
+        resp = requests.Response()
+        resp._content = text.encode("utf-8")
+        resp.encoding = "utf-8"
+        util.record_response(url, resp)
+
+    util.TEST_DATA_DIR = data_dir
+    video = json.dumps({"data": {"object": {"stream": {"hd_url": "https://video.example/1.mp4"}}}})
+    record("https://m.weibo.cn/s/video/object?object_id=1", video)
+    for page in range(1, pages + 1):
+        record("https://weibo.cn/%s/profile?page=%d" % (user_uri, page), synthetic_page(page, per_page, pages))
+        for i in range((page - 1) * per_page, page * per_page):
+            weibo_id = "B%08d" % i
+            if i % 3 == 0:
+                record("https://weibo.cn/comment/" + weibo_id, synthetic_comment_page(weibo_id))
+            if i % 8 == 0:
+                record("https://weibo.cn/mblog/picAll/%s?rl=1" % weibo_id, synthetic_pic_all_page(weibo_id))
+
+
+def recorded_profiles(data_dir):
+    """从 url_map.json 中找出录制过的个人主页, 返回 {user_uri: [页码, ...]}"""
+    with open(os.path.join(data_dir, "url_map.json"), encoding="utf-8") as f:
+        url_map = json.load(f)
+    profiles = {}
+    for url in url_map:
+        match = PROFILE_URL.match(url)
+        if match:
+            profiles.setdefault(match.group(1), []).append(int(match.group(2)))
+    return {user_uri: sorted(pages) for user_uri, pages in profiles.items()}
+
+
+def run_replay(util, page_parser, profiles, label):
+    """按页回放一次, 返回每页耗时、解析耗时与子请求数
+
+    解析耗时拆成两部分: 子请求(全文、组图、视频)的回放与解析, 以及其余的
+    XPath 提取, 后者即每页 div.c 本身的 CPU 开销。
+    """
+    util.request_stats.clear()
+    fetch_seconds = parse_seconds = 0.0
+    sub_seconds = [0.0]
+    resolve_sub_requests = page_parser.PageParser.resolve_sub_requests
+
+    def timed_resolve(self, weibos):
+        start = time.perf_counter()
+        resolve_sub_requests(self, weibos)
+        sub_seconds[0] += time.perf_counter() - start
+
+    page_parser.PageParser.resolve_sub_requests = timed_resolve
+    page_count = weibo_count = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        util.CHECKPOINT_DIR = tmp
+        for user_uri, pages in profiles.items():
+            user_config = {"user_uri": user_uri, "since_date": "2000-01-01", "end_date": "now"}
+            weibo_id_list = []
+            for page in pages:
+                start = time.perf_counter()
+                parser = page_parser.PageParser("", user_config, page, 0)
+                fetched = time.perf_counter()
+                weibos, weibo_id_list, _ = parser.get_one_page(weibo_id_list)
+                fetch_seconds += fetched - start
+                parse_seconds += time.perf_counter() - fetched
+                page_count += 1
+                weibo_count += len(weibos)
+        page_parser.PageParser.prefetcher.cancel()
+    page_parser.PageParser.resolve_sub_requests = resolve_sub_requests
+    requests_total = sum(stats["count"] for stats in util.request_stats.values())
+    total = fetch_seconds + parse_seconds
+    return {
+        "label": label,
+        "pages": page_count,
+        "weibos": weibo_count,
+        "pages_per_sec": page_count / total if total else 0.0,
+        "fetch_ms_per_page": fetch_seconds / page_count * 1000,
+        "parse_ms_per_page": parse_seconds / page_count * 1000,
+        "xpath_ms_per_page": (parse_seconds - sub_seconds[0]) / page_count * 1000,
+        "sub_requests_per_page": (requests_total - page_count) / page_count,
+    }
+
+
+def bench_parse(args):
+    from generate_json import SPIDER_FIELDS
+
+    util, page_parser = load_spider_modules()
+    util.REPLAY_TEST_DATA = True
+    for logger_name in ("spider.page_parser", "spider.util"):
+        logging.getLogger(logger_name).setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data
+        if data_dir is None:
+            data_dir = os.path.join(tmp, "testdata")
+            write_synthetic_replay(util, data_dir, "bench", args.pages, args.per_page)
+        util.TEST_DATA_DIR = data_dir
+        profiles = recorded_profiles(data_dir)
+
+        results = []
+        default_fields = page_parser.FIELDS
+        for label, fields in (("all_fields", None), ("spider_fields", SPIDER_FIELDS)):
+            page_parser.FIELDS = fields
+            for _ in range(args.warmup):
+                run_replay(util, page_parser, profiles, label)
+            results.append(run_replay(util, page_parser, profiles, label))
+        page_parser.FIELDS = default_fields
+
+    for r in results:
+        print(f"{r['label']:<15} {r['pages']} 页 {r['weibos']} 条微博: {r['pages_per_sec']:.1f} 页/s, "
+              f"取页 {r['fetch_ms_per_page']:.2f}ms/页, 解析 {r['parse_ms_per_page']:.2f}ms/页 "
+              f"(XPath {r['xpath_ms_per_page']:.2f}ms), "
+              f"子请求 {r['sub_requests_per_page']:.1f} 次/页")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["label"]: r for r in json.load(f)}
+        regressions = []
+        for r in results:
+            old = baseline.get(r["label"])
+            if old and r["pages_per_sec"] < old["pages_per_sec"] * (1 - args.tolerance):
+                regressions.append(f"{r['label']}: {old['pages_per_sec']:.1f} -> {r['pages_per_sec']:.1f} 页/s")
+            if old and r["sub_requests_per_page"] > old["sub_requests_per_page"]:
+                regressions.append(f"{r['label']}: 子请求 {old['sub_requests_per_page']:.1f} -> "
+                                   f"{r['sub_requests_per_page']:.1f} 次/页")
+        if regressions:
+            print("性能回退:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"与基线 {args.baseline} 相比没有超过 {args.tolerance:.0%} 的回退")
+
+
+# -------- crawl.py: 多账号依次抓取 vs 进程池并行 --------
+def synthetic_index_page(user_uri, pages):
+    """个人主页首页: 资料链接、微博数/关注/粉丝与总页数"""
+    return (PAGE_HEAD + '<div class="u"><a href="/%s/info">资料</a></div>'
+            '<div class="tip2"><span>微博[%d]</span><a>关注[10]</a><a>粉丝[100]</a></div>'
+            % (user_uri, pages * 10)) + PAGE_TAIL % pages
+
+
+def synthetic_info_page(user_uri):
+    head = PAGE_HEAD.replace("</head>", "<title>账号%s的资料</title></head>" % user_uri)
+    return head + '<div class="c">a</div><div class="c">b</div><div class="c">性别:女<br/>地区:上海</div></body></html>'
+
+
+def import_spider():
+    """导入 weibo_spider.spider, 不在当前目录留下日志文件
+
+    weibo_spider.spider 导入时按 logging.conf 在当前目录创建 all.log 与
+    error.log, 这里在临时目录中导入, 再去掉文件日志的 handler。
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            from weibo_spider import spider
+        finally:
+            os.chdir(cwd)
+        for logger in (logging.getLogger(), logging.getLogger("spider")):
+            for handler in list(logger.handlers):
+                if isinstance(handler, logging.FileHandler):
+                    logger.removeHandler(handler)
+                    handler.close()
+    return spider
+
+
+def install_spider_modules():
+    """在 load_spider_modules 的基础上, 让 Spider 和首页、资料页解析器也使用本仓库的 util.py"""
+    import importlib
+
+    spider = import_spider()
+
+    util, page_parser = load_spider_modules()
+    importlib.reload(sys.modules["weibo_spider.parser.info_parser"])
+    index_parser = importlib.reload(sys.modules["weibo_spider.parser.index_parser"])
+    spider.IndexParser = index_parser.IndexParser
+    spider.PageParser = page_parser.PageParser
+    return util, page_parser
+
+
+def bench_crawl(args):
+    import multiprocessing
+
+    import requests
+
+    import crawl
+
+    util, _ = install_spider_modules()
+    util.REPLAY_TEST_DATA = True
+    logging.getLogger("spider").setLevel(logging.CRITICAL)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("spider."):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+    # 回放的响应加上固定延迟, 近似真实请求的耗时
+    replay_response = util.replay_response
+
+    def slow_replay(url):
+        time.sleep(args.latency)
+        return replay_response(url)
+
+    util.replay_response = slow_replay
+    config = {
+        "filter": 0, "since_date": "2000-01-01", "end_date": "now",
+        "random_wait_pages": [1, 3], "random_wait_seconds": [args.wait, args.wait],
+        "global_wait": [[1000, 3600]], "write_mode": ["json"], "pic_download": 0, "video_download": 0,
+        "result_dir_name": 1, "cookie": "",
+    }
+    accounts = [{"id": f"{9000000000 + i}", "name": f"账号{i}", "kind": "post"} for i in range(args.accounts)]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        util.TEST_DATA_DIR = os.path.join(tmp, "testdata")
+        for account in accounts:
+            write_synthetic_replay(util, util.TEST_DATA_DIR, account["id"], args.pages, args.per_page)
+            for url, text in ((f"https://weibo.cn/{account['id']}", synthetic_index_page(account["id"], args.pages)),
+                              (f"https://weibo.cn/{account['id']}/info", synthetic_info_page(account["id"]))):
+                resp = requests.Response()
+                resp._content = text.encode("utf-8")
+                resp.encoding = "utf-8"
+                util.record_response(url, resp)
+
+        # 工作进程需要继承上面替换过的模块, 固定使用 fork
+        context = multiprocessing.get_context("fork")
+        runs = [("依次", accounts, 1)] + [
+            ("并行", accounts[:n], args.workers) for n in sorted({max(1, args.accounts // 4), max(1, args.accounts // 2), args.accounts})
+        ]
+        serial = None
+        for k, (label, subset, workers) in enumerate(runs):
+            run_dir = os.path.join(tmp, f"run{k}")
+            os.makedirs(run_dir)
+            os.chdir(run_dir)
+            try:
+                start = time.perf_counter()
+                # util.handle_garbled 按 sys.stdout.encoding 清洗文本, 不能换成没有编码的 StringIO
+                quiet = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+                with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+                    results = crawl.crawl(subset, config, workers, args.host_limit,
+                                          state_file=os.path.join(run_dir, "state.json"), mp_context=context)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+            if serial is None:
+                serial = elapsed / len(subset)
+            weibos = sum(r.get("weibos", 0) for r in results)
+            failed = sum(not r["ok"] for r in results)
+            print(f"{label} workers={workers} {len(subset):>3d} 个账号: {elapsed:.2f}s, 每账号 {elapsed / len(subset):.2f}s "
+                  f"(依次抓取的 {elapsed / len(subset) / serial:.0%}), {weibos} 条微博"
+                  f"{f', 失败 {failed} 个' if failed else ''}")
+
+
+# -------- generate_json.py: json.load vs 流式读取 --------
+def write_synthetic_dump(path, posts):
+    """生成与 weibo_spider 输出结构相同的结果文件, 约 1/10 为演出情报转发"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"user": {"id": "7716940453", "nickname": "地下偶像相关揭示板"}, "weibo": [')
+        for i in range(posts):
+            if i % 10 == 0:
+                venue = "育音堂" if i % 20 == 0 else "某livehouse"
+                content = (f"转发理由:#live演出情报# 第{i}条\n原始用户: 某团体\n"
+                           f"转发内容: 9／6（六）📍{venue} 演出 " + "详情" * 40)
+            else:
+                content = f"第{i}条日常微博 " + "日常" * 60
+            weibo = {"id": f"G{i:08d}", "content": content, "original": i % 10 != 0,
+                     "publish_time": "2025-09-01 12:00", "up_num": i, "retweet_num": 0,
+                     "comment_num": 0}
+            f.write(("," if i else "") + json.dumps(weibo, ensure_ascii=False, indent=4))
+        f.write("]}")
+
+
+def legacy_generate(path, output_file, generate_json):
+    """改造前 generate_json.py 的写法: json.load 整个文件, 每条命中打开一次输出文件"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for day_data in data["weibo"]:
+        record, _ = generate_json.to_record(day_data)
+        if record:
+            with open(output_file, "a", encoding="utf-8") as f_out:
+                f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def measure(func, *args):
+    """运行两次, 返回(耗时秒, Python 分配的峰值内存 MB, 返回值)
+
+    tracemalloc 会拖慢执行, 耗时取不开启时的那一次。
+    """
+    start = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 1024 / 1024, result
+
+
+def bench_generate(args):
+    import generate_json
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "weibo.json")
+        write_synthetic_dump(dump, args.posts)
+        size = os.path.getsize(dump) / 1024 / 1024
+        legacy_out = os.path.join(tmp, "legacy.jsonl")
+        stream_out = os.path.join(tmp, "stream.jsonl")
+
+        def run_legacy():
+            with open(legacy_out, "w"):
+                pass
+            legacy_generate(dump, legacy_out, generate_json)
+
+        def run_stream():
+            with open(stream_out, "w"):
+                pass
+            return generate_json.generate(generate_json.iter_weibo(dump), stream_out, verbose=False)
+
+        legacy, legacy_peak, _ = measure(run_legacy)
+        stream, stream_peak, summary = measure(run_stream)
+        with open(legacy_out, "rb") as a, open(stream_out, "rb") as b:
+            same = a.read() == b.read()
+
+    print(f"{args.posts} 条微博, 结果文件 {size:.1f}MB, 扫描 {summary['scanned']} 条, "
+          f"演出情报 {summary['matched']} 条, 写入 {summary['written']} 条")
+    print(f"json.load: {legacy:.2f}s, 峰值内存 {legacy_peak:.1f}MB")
+    print(f"流式读取:  {stream:.2f}s, 峰值内存 {stream_peak:.1f}MB")
+    print("输出一致" if same else "输出不一致!")
+    if not same:
+        sys.exit(1)
+
+
+# -------- 场地匹配: 逐个子串查找 vs Aho-Corasick --------
+def synthetic_venues(n):
+    """虚构 n 个外地场地, 用来观察场地数量增长时的耗时"""
+    return [{"name": f"虚构场地{i:05d}号", "city": "外地", "kind": "venue",
+             "aliases": [f"fake{i:05d}"]} for i in range(n)]
+
+
+def bench_venues(args):
+    import venues
+
+    base = venues.load_matcher()
+    texts = [f"9／6（六）📍{v['name']} 演出 第{i}条 " + "详情" * 40
+             for i, v in zip(range(args.posts), base.venues * args.posts)]
+    texts += [f"第{i}条外地演出 " + "详情" * 40 for i in range(args.posts // 2)]
+
+    # 改造前的写法只能区分大小写, 对比时用数据文件里的名称与别名
+    for extra in (0, 500, 5000):
+        venue_list = base.venues + synthetic_venues(extra)
+        keywords = [k for v in venue_list for k in [v["name"], *v.get("aliases", [])]]
+        matcher = venues.VenueMatcher(venue_list, "none")
+
+        start = time.perf_counter()
+        legacy = [[k for k in keywords if k in text] for text in texts]
+        scan = time.perf_counter() - start
+        start = time.perf_counter()
+        found = [[m["keyword"] for m in matcher.find(text)] for text in texts]
+        automaton = time.perf_counter() - start
+
+        same = all(set(a) == set(b) for a, b in zip(legacy, found))
+        print(f"{len(keywords):>6} 个关键词, {len(texts)} 条文本: 逐个查找 {scan:.2f}s, "
+              f"自动机 {automaton:.2f}s{'' if same else ' (结果不一致!)'}")
+
+
+# -------- render.py: 字符串拼接 vs 转义模板流式写入 --------
+def synthetic_events(n):
+    return [
+        {
+            "weibo_id": f"bench{i:06d}",
+            "url": f"https://weibo.cn/comment/bench{i:06d}?a=1&b=2",
+            "live_date": f"2025-09-{i % 28 + 1:02d} 19:00",
+            "live_location": "育音堂 <B1>",
+            "groups": ["团体A", "Team \"B\"", "C&D"],
+            "main_text": "演出情报 第%d场\n票价: 88 & 128\n<注意> 入场须知" % i + "详情" * 40,
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_render(file_date, entries):
+    """改造前 render.py 的写法: f-string 拼接, 不转义"""
+    html_content = f"""
+<h2 style="color: pink;">{file_date} 的Live活动</h2>
+"""
+    for entry in entries:
+        groups = ', '.join(entry.get('groups', [])) if entry.get('groups') else ''
+        main_text = entry.get('main_text', '').replace('\n', '<br>')
+        url = entry.get('url', '')
+        url_html = f'<a href="{url}" target="_blank">🔗 原文链接</a>' if url else ''
+        html_content += f"""
+<div class="card">
+  <h2>{entry.get('live_date', '')} - {entry.get('live_location', '')}</h2>
+  <p class="groups">团体: {groups}</p>
+  <p>{main_text}</p>
+  <p>{url_html}</p>
+</div>
+"""
+    return html_content
+
+
+def bench_render(args):
+    import render
+
+    entries = synthetic_events(args.events)
+    plain_values = [
+        dict(live_date=e["live_date"], live_location=e["live_location"], groups=", ".join(e["groups"]),
+             main_text=e["main_text"], url_html=e["url"])
+        for e in entries
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        with open(os.path.join(tmp, "legacy.html"), "w", encoding="utf-8") as f:
+            f.write(legacy_render("2025-09-01", entries))
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(os.path.join(tmp, "stream.html"), "w", encoding="utf-8", buffering=render.WRITE_BUFFER) as f:
+            render.write_date(f, "2025-09-01", entries)
+        stream = time.perf_counter() - start
+
+        source = render.CARD_TEMPLATE.source
+        start = time.perf_counter()
+        for values in plain_values:
+            source.format(**values)
+        plain = time.perf_counter() - start
+
+        with open(os.path.join(tmp, "stream.html"), encoding="utf-8") as f:
+            escaped = "<注意>" not in f.read()
+
+    per_card = 1e6 / args.events
+    print(f"{args.events} 张卡片: 拼接(不转义) {legacy:.3f}s, 模板流式写入 {stream:.3f}s")
+    print(f"每张卡片: 模板渲染+转义 {stream * per_card:.1f}us, 直接 format(不转义) {plain * per_card:.1f}us")
+    print("正文已转义" if escaped else "正文未转义!")
+
+
+# -------- 压缩归档: 全量扫描与按 ID 查询 --------
+def bench_archive(args):
+    import archive
+
+    records = synthetic_live_events(args.records, args.dates)
+    rng = random.Random(0)
+    chars = "演出情报票价预售入场时间地点团体拼盘专场上海育音堂欢迎大家来玩"
+    for record in records:
+        record["main_text"] = "".join(rng.choice(chars) for _ in range(300))
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir, tiny_dir = os.path.join(tmp, "json"), os.path.join(tmp, "tinydb")
+        os.makedirs(json_dir)
+        os.makedirs(tiny_dir)
+        by_path = {}
+        for record in records:
+            by_path.setdefault(tinydb_path(tiny_dir, record), []).append(record)
+        for path, docs in by_path.items():
+            # TinyDB 默认的写法, 中文转义为 \uXXXX
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"_default": {str(i + 1): d for i, d in enumerate(docs)}}, f)
+            with open(os.path.join(json_dir, "result_" + os.path.basename(path) + "l"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(d, ensure_ascii=False) + "\n" for d in docs)
+        start = time.perf_counter()
+        archive.pack(json_dir, tiny_dir, os.path.join(tmp, "archive"))
+        packed = time.perf_counter() - start
+        sizes = {name: archive.dir_size(os.path.join(tmp, name))
+                 for name in ("json", "tinydb", "archive", os.path.join("archive", "events"))}
+
+        start = time.perf_counter()
+        scanned = 0
+        for fname in os.listdir(tiny_dir):
+            with open(os.path.join(tiny_dir, fname), encoding="utf-8") as f:
+                scanned += len(json.load(f)["_default"])
+        tiny_scan = time.perf_counter() - start
+        with archive.open_archive("events", os.path.join(tmp, "archive")) as events:
+            start = time.perf_counter()
+            same = sum(1 for _ in events.scan()) == scanned
+            archive_scan = time.perf_counter() - start
+
+            ids = [r["weibo_id"] for r in rng.sample(records, min(args.lookups, len(records)))]
+            start = time.perf_counter()
+            for weibo_id in ids:
+                events.cached = (None, None)
+                events.get(weibo_id)
+            lookup = (time.perf_counter() - start) / len(ids)
+            block_bytes = sum(b[2] for b in events.blocks) / len(events.blocks)
+        day_bytes = sizes["tinydb"] / len(by_path)
+
+    print(f"{args.records} 条记录, {args.dates} 天, 导入归档 {packed:.2f}s")
+    print(f"database/json {sizes['json'] / 1024:.0f}KB + database/tinydb {sizes['tinydb'] / 1024:.0f}KB, "
+          f"归档 raw+events {sizes['archive'] / 1024:.0f}KB "
+          f"({sizes['archive'] / (sizes['json'] + sizes['tinydb']):.0%})")
+    events_bytes = sizes[os.path.join("archive", "events")]
+    print(f"全量扫描: TinyDB 目录 {tiny_scan:.3f}s 读取 {sizes['tinydb'] / 1024:.0f}KB, "
+          f"归档 {archive_scan:.3f}s 读取 {events_bytes / 1024:.0f}KB{'' if same else ' (条数不一致!)'}")
+    print(f"按 ID 查询: {lookup * 1e3:.2f}ms, 读取一个压缩块 {block_bytes / 1024:.1f}KB "
+          f"(原来打开整个日期文件平均 {day_bytes / 1024:.1f}KB)")
+
+
+# -------- 搜索索引: 大小与查询需要加载的分片 --------
+def bench_search(args):
+    import search
+    import store
+
+    records = synthetic_live_events(args.records, args.dates)
+    with tempfile.TemporaryDirectory() as tmp:
+        html_dir = os.path.join(tmp, "html")
+        out_dir = os.path.join(html_dir, search.SEARCH_DIR)
+        with store.EventStore(os.path.join(tmp, "events.db")) as events:
+            for record in records:
+                events.upsert(record)
+            events.commit()
+            manifest = {}
+            start = time.perf_counter()
+            shards = search.build_index(events, html_dir, manifest)
+            full = time.perf_counter() - start
+
+            # 改动一条记录后增量重建
+            events.upsert({**records[-1], "main_text": "改期"})
+            events.commit()
+            start = time.perf_counter()
+            changed = search.build_index(events, html_dir, manifest)
+            incremental = time.perf_counter() - start
+
+        sizes = {name: os.path.getsize(os.path.join(out_dir, name))
+                 for name in os.listdir(out_dir) if name.endswith(".json")}
+        with open(os.path.join(out_dir, "terms.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        # "团体下一场在哪": 词典 + 今天及之后第一个出现该团体的月份分片
+        since = records[len(records) // 2]["live_date"][:7]
+        fetched = []
+        for key, (_, mask) in terms["groups"].items():
+            months = [m for i, m in enumerate(terms["months"]) if m >= since and int(mask, 16) >> i & 1]
+            fetched.append(sizes["terms.json"] + (sizes[f"{months[0]}.json"] if months else 0))
+
+    total = sum(sizes.values())
+    print(f"{args.records} 条记录, {args.dates} 天, {shards} 个月份分片: 全量生成 {full:.3f}s, "
+          f"改动一条后重写 {changed} 个分片 {incremental:.3f}s")
+    print(f"索引共 {total / 1024:.0f}KB, 词典 {sizes['terms.json'] / 1024:.1f}KB "
+          f"({len(terms['groups'])} 个团体, {len(terms['venues'])} 个场地)")
+    print(f"查询一个团体的下一场平均下载 {sum(fetched) / len(fetched) / 1024:.1f}KB, "
+          f"占全部索引的 {sum(fetched) / len(fetched) / total:.1%}")
+
+
+# -------- 规则预提取: 免去的 LLM 调用与结果一致性 --------
+def load_dumps(data_dir):
+    """generate_json.py 输出的 result_*.jsonl, 按 weibo_id 去重"""
+    posts = {}
+    for name in sorted(os.listdir(data_dir)):
+        if name.startswith("result_") and name.endswith(".jsonl"):
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    posts.setdefault(record["weibo_id"], record)
+    return list(posts.values())
+
+
+def bench_rules(args):
+    import normalize
+    import rules
+    import store
+
+    posts = load_dumps(args.data)
+    if not posts:
+        sys.exit(f"{args.data} 下没有 result_*.jsonl")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 用 LLM 的历史结果作为参照, 也作为已知团体名
+        event_store = store.EventStore(os.path.join(tmp, "events.db"))
+        store.migrate(args.llm, event_store)
+        answers = {e["weibo_id"]: e for e in event_store.query()}
+        extractor = rules.RuleExtractor(event_store.normalizer, event_store.group_names())
+        normalizer = event_store.normalizer
+        # jieba 的词典在第一次切分时加载, 不计入耗时
+        extractor.cut("")
+        event_store.close()
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        results = [extractor.extract(post) for post in posts]
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    accepted = [(post, fields) for post, (fields, confidence) in zip(posts, results)
+                if confidence >= args.threshold]
+    compared = same_date = same_venue = same_groups = 0
+    for post, fields in accepted:
+        answer = answers.get(post["weibo_id"])
+        if answer is None:
+            continue
+        compared += 1
+        same_date += fields["live_date"] == answer.get("live_date")
+        same_venue += set(normalizer.venues(fields["live_location"])) == set(answer.get("venues", []))
+        expected = {normalize.group_key(g) for g in answer.get("groups", [])}
+        found = {normalize.group_key(g) for g in fields["groups"]}
+        same_groups += found == expected
+
+    print(f"{len(posts)} 条微博, 规则提取耗时 {elapsed * 1e3 / len(posts):.2f}ms/条")
+    print(f"confidence >= {args.threshold}: {len(accepted)} 条, 免去 {len(accepted) / len(posts):.0%} 的 LLM 调用")
+    if compared:
+        print(f"其中 {compared} 条有 LLM 结果可对照: 日期一致 {same_date}, 场地一致 {same_venue}, "
+              f"团体完全一致 {same_groups}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IdolPosts 性能压测")
+    sub = parser.add_subparsers(dest="target", required=True)
+
+    p = sub.add_parser("llm", help="llm.py 串行/批量/并发/缓存模式对比 (本地桩服务)")
+    p.add_argument("--records", type=int, default=40)
+    p.add_argument("--latency", type=float, default=0.5, help="桩服务单次响应延迟(秒)")
+    p.add_argument("--per_post_latency", type=float, default=0.1, help="桩服务每条微博额外延迟(秒)")
+    p.add_argument("--error_rate", type=float, default=0.0, help="桩服务返回 429 的比例")
+    p.add_argument("--malformed_rate", type=float, default=0.0, help="桩服务返回不合规 JSON 的比例")
+    p.add_argument("--batch_size", type=int, default=8)
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--rps", type=float, default=0)
+    p.set_defaults(func=bench_llm)
+
+    p = sub.add_parser("sink", help="TinyDB 逐条写入与 EventStore 写入对比")
+    p.add_argument("--records", type=int, default=2000)
+    p.add_argument("--dates", type=int, default=10)
+    p.set_defaults(func=bench_sink)
+
+    p = sub.add_parser("store", help="按日期/场地/团体查询: 扫描 TinyDB 目录与 SQLite 索引对比")
+    p.add_argument("--records", type=int, default=20000)
+    p.add_argument("--dates", type=int, default=365)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("fetch", help="util.py 连接池与逐次 requests.get 的抓取耗时对比 (本地模拟服务)")
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--latency", type=float, default=0.0, help="模拟服务每页延迟(秒)")
+    p.add_argument("--handshake", type=float, default=0.05, help="模拟服务每个新连接的握手耗时(秒)")
+    p.set_defaults(func=bench_fetch)
+
+    p = sub.add_parser("parse", help="离线回放 PageParser, 统计页/秒、解析耗时与子请求数")
+    p.add_argument("--data", help="util.GENERATE_TEST_DATA 录制的目录, 默认生成模拟页面")
+    p.add_argument("--pages", type=int, default=50, help="模拟页面的页数")
+    p.add_argument("--per_page", type=int, default=10, help="模拟页面每页微博数")
+    p.add_argument("--warmup", type=int, default=1, help="正式计时前的预热轮数")
+    p.add_argument("--save", help="把结果写入 json 文件, 可作为之后的基线")
+    p.add_argument("--baseline", help="与之前保存的结果比较, 有回退时以状态码 1 退出")
+    p.add_argument("--tolerance", type=float, default=0.2, help="允许的页/秒下降比例")
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("crawl", help="crawl.py 多账号依次抓取与进程池并行的耗时对比 (离线回放)")
+    p.add_argument("--accounts", type=int, default=8)
+    p.add_argument("--pages", type=int, default=4, help="每个账号的页数")
+    p.add_argument("--per_page", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.05, help="每个请求的模拟延迟(秒)")
+    p.add_argument("--wait", type=int, default=1, help="Spider 翻页间的随机等待(秒)")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--host_limit", type=int, default=2)
+    p.set_defaults(func=bench_crawl)
+
+    p = sub.add_parser("generate", help="generate_json.py json.load 与流式读取的耗时和内存对比")
+    p.add_argument("--posts", type=int, default=100000)
+    p.set_defaults(func=bench_generate)
+
+    p = sub.add_parser("venues", help="场地关键词逐个查找与 Aho-Corasick 自动机的耗时对比")
+    p.add_argument("--posts", type=int, default=20000)
+    p.set_defaults(func=bench_venues)
+
+    p = sub.add_parser("render", help="render.py 字符串拼接与转义模板流式写入对比")
+    p.add_argument("--events", type=int, default=10000)
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("archive", help="压缩归档与 database/json、TinyDB 目录的大小、全量扫描与按 ID 查询对比")
+    p.add_argument("--records", type=int, default=20000)
+    p.add_argument("--dates", type=int, default=365)
+    p.add_argument("--lookups", type=int, default=200)
+    p.set_defaults(func=bench_archive)
+
+    p = sub.add_parser("search", help="搜索索引的大小、增量重建与查询需要下载的数据量")
+    p.add_argument("--records", type=int, default=20000)
+    p.add_argument("--dates", type=int, default=730)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("rules", help="规则预提取: 可免去的 LLM 调用比例, 以及与 LLM 结果的一致性")
+    p.add_argument("--data", default="database/json", help="generate_json.py 输出的目录")
+    p.add_argument("--llm", default="database/tinydb", help="LLM 提取结果 (TinyDB 目录), 用于对照")
+    p.add_argument("--threshold", type=float, default=0.9)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_rules)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""按 config/accounts.json 并行抓取多个账号
+
+用法 (在 python/ 下运行, 与 generate_json.py 相同):
+    python crawl.py --workers 4 --host_limit 2
+
+每个账号在进程池中由一个独立的 weibo_spider.Spider 抓取。PageParser 的翻页
+状态和预取器都是类属性, 同一进程内只能依次抓取账号, 因此用进程而不是线程
+并行。抓取耗时主要是请求延迟和 random_wait_seconds 的等待, 多个账号的等待
+互相重叠, 总耗时随账号数增长远低于线性。
+
+对 weibo.cn 的压力由 host_limit 控制: 主进程为每个 host 建一个信号量交给
+各工作进程 (util.host_slots), 所有进程合计同时进行的请求数不超过它。
+
+--prefetch N 在解析当前页的同时后台抓取后面 N 页 (page_parser.PREFETCH_PAGES),
+默认不预取。Spider 翻页间的随机等待换成 page_parser.polite_sleep, 等待期间
+不会有预取请求。
+
+断点:
+- 每个账号已抓取到的微博记在 config/checkpoint/<id>.json (util.py), 下次只抓新微博。
+  每一页在 writer 写出之后才记入断点, 写出失败或进程中断时下次会重新抓取;
+- 每个账号最近一次抓取的结果记在 config/checkpoint/accounts.json, 抓完一个写一次。
+  --skip_recent N 跳过 N 小时内已成功抓取的账号, 中断后重跑时不必从头开始;
+  账号按上次耗时从长到短提交, 耗时最长的账号不会拖在最后。
+
+爬虫结果写到 config/weibo/<id>/<id>.json, 由 generate_json.py 合并。
+各进程的指标与请求统计汇总后, 作为 spider 阶段的运行报告写入 --metrics (metrics.py)。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from accounts import ACCOUNTS_FILE, load_accounts
+from generate_json import SPIDER_FIELDS
+
+# 爬虫的工作目录: config.json、checkpoint 与 weibo 输出都在这里
+SPIDER_DIR = "./config"
+# 相对于 SPIDER_DIR
+OUTPUT_DIR = "./weibo"
+STATE_FILE = "./checkpoint/accounts.json"
+# 相对于 python/, 与 generate_json.py 相同
+METRICS_FILE = "../database/metrics.jsonl"
+WORKERS = 4
+# 后台预取的页数, 0 为不预取
+PREFETCH = 0
+# 所有工作进程合计对同一 host 的并发请求数
+HOST_LIMIT = 2
+HOSTS = ("weibo.cn", "m.weibo.cn")
+
+
+def load_state(path=STATE_FILE) -> dict:
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def write_user_id_list(accounts, path="user_id_list.txt"):
+    """同时写出爬虫自带的账号列表, 单独运行 python -m weibo_spider 时使用"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(f"{a['id']} {a.get('name', '')}".strip() for a in accounts))
+
+
+def plan(accounts, state, skip_recent=0.0):
+    """返回 (要抓取的账号, 跳过的账号), 要抓取的按上次耗时从长到短排列"""
+    cutoff = (datetime.now() - timedelta(hours=skip_recent)).isoformat(timespec="seconds")
+    todo, skipped = [], []
+    for account in accounts:
+        last = state.get(account["id"], {})
+        if skip_recent and last.get("ok") and last.get("finished", "") >= cutoff:
+            skipped.append(account)
+        else:
+            todo.append(account)
+    todo.sort(key=lambda a: -state.get(a["id"], {}).get("seconds", 0.0))
+    return todo, skipped
+
+
+# -------- 工作进程 --------
+def init_worker(host_slots, output_dir, fields=None, prefetch=PREFETCH):
+    from absl import flags
+    from weibo_spider import spider
+    from weibo_spider.parser import page_parser, util
+
+    util.host_slots.update(host_slots)
+    page_parser.FIELDS = fields
+    page_parser.PREFETCH_PAGES = prefetch
+    # Spider 翻页、换账号时的随机等待期间不发出预取请求
+    spider.sleep = page_parser.polite_sleep
+    if not flags.FLAGS.is_parsed():
+        # Spider 从命令行参数读取输出目录
+        flags.FLAGS(["crawl", f"--output_dir={output_dir}"])
+
+
+def crawl_account(account, config, delay=0.0):
+    """抓取一个账号, 返回结果摘要以及本进程的指标, 由主进程汇总"""
+    from weibo_spider.parser import metrics, page_parser, util
+    from weibo_spider.spider import Spider
+
+    # 与 Spider.start 在账号之间的随机等待作用相同, 错开各进程的首次请求
+    time.sleep(delay)
+    metrics.reset()
+    util.request_stats.clear()
+    user = {"id": account["id"]}
+    if account.get("since_date"):
+        user["since_date"] = account["since_date"]
+    start = time.perf_counter()
+    spider = Spider({**config, "user_id_list": [user]})
+    write_weibo = spider.write_weibo
+
+    def write_and_checkpoint(weibos):
+        # writer 正常返回后才把这一页记入断点
+        write_weibo(weibos)
+        page_parser.commit_checkpoint(spider.user_config["user_uri"], weibos)
+
+    spider.write_weibo = write_and_checkpoint
+    spider.get_one_user(spider.user_config_list[0])
+    seconds = time.perf_counter() - start
+    metrics.add_time("crawl.account", seconds)
+    metrics.count("crawl.weibos", spider.got_num)
+    return {
+        "id": account["id"],
+        # 账号信息抓取失败时 Spider 不抛出异常, 只是 user 为空
+        "ok": bool(spider.user and spider.user.id),
+        "nickname": spider.user.nickname if spider.user else "",
+        "weibos": spider.got_num,
+        "seconds": round(seconds, 3),
+        "finished": datetime.now().isoformat(timespec="seconds"),
+    }, metrics.export(), dict(util.request_stats)
+
+
+def crawl(accounts, config, workers=WORKERS, host_limit=HOST_LIMIT, output_dir=OUTPUT_DIR,
+          state=None, state_file=STATE_FILE, mp_context=None, fields=SPIDER_FIELDS, prefetch=PREFETCH):
+    """用进程池抓取 accounts, 每完成一个账号更新一次 state, 返回各账号的结果
+
+    fields 为爬虫提取的微博字段 (page_parser.FIELDS), None 为全部字段;
+    prefetch 为后台预取的页数 (page_parser.PREFETCH_PAGES)。
+    """
+    from weibo_spider.parser import metrics, util
+
+    state = {} if state is None else state
+    mp_context = mp_context or multiprocessing.get_context()
+    host_slots = {host: mp_context.BoundedSemaphore(host_limit) for host in HOSTS}
+    wait = config.get("random_wait_seconds", [0, 0])
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=init_worker,
+                             initargs=(host_slots, output_dir, fields, prefetch)) as executor:
+        futures = {
+            executor.submit(crawl_account, account, config,
+                            0.0 if i < workers else random.uniform(min(wait), max(wait))): account
+            for i, account in enumerate(accounts)
+        }
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                result, worker_metrics, request_stats = future.result()
+            except Exception as e:
+                # 工作进程异常退出等, Spider 内部的错误已被它自己记录
+                result, worker_metrics, request_stats = {
+                    "id": account["id"], "ok": False, "error": repr(e),
+                    "finished": datetime.now().isoformat(timespec="seconds"),
+                }, None, {}
+            if worker_metrics is not None:
+                metrics.merge(worker_metrics)
+            for host, stats in request_stats.items():
+                merged = util.request_stats.setdefault(host, dict.fromkeys(stats, 0))
+                for key, value in stats.items():
+                    merged[key] = max(merged[key], value) if key == "max_seconds" else merged[key] + value
+            metrics.count("crawl.accounts")
+            metrics.count("crawl.failed", not result["ok"])
+            state[account["id"]] = {**state.get(account["id"], {}), **result}
+            save_state(state, state_file)
+            status = f"{result.get('weibos', 0)} 条微博" if result["ok"] else f"失败 {result.get('error', '')}"
+            print(f"{account['id']} {account.get('name', '')}: {status}, 耗时 {result.get('seconds', 0):.1f}s")
+            results.append(result)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="按账号列表并行抓取微博")
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE, help="账号列表, 见 accounts.py")
+    parser.add_argument("--spider_dir", default=SPIDER_DIR, help="爬虫的工作目录")
+    parser.add_argument("--output_dir", default=OUTPUT_DIR, help="爬虫结果目录, 相对于 spider_dir")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="同时抓取的账号数")
+    parser.add_argument("--host_limit", type=int, default=HOST_LIMIT, help="同一 host 的并发请求上限")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH,
+                        help="解析当前页时后台预取后面 N 页, 0 为不预取")
+    parser.add_argument("--skip_recent", type=float, default=0.0,
+                        help="跳过最近 N 小时内已成功抓取的账号, 0 为不跳过")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="运行报告 (JSONL) 路径, 为空时不写")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    accounts = load_accounts(args.accounts)
+    metrics_file = args.metrics and os.path.abspath(args.metrics)
+    os.chdir(args.spider_dir)
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    write_user_id_list(accounts)
+
+    from weibo_spider import config_util
+    from weibo_spider.parser import metrics, util
+
+    config_util.validate_config(config)
+    state = load_state()
+    todo, skipped = plan(accounts, state, args.skip_recent)
+    if skipped:
+        print(f"跳过 {len(skipped)} 个最近已抓取的账号: {' '.join(a['id'] for a in skipped)}")
+    start = time.perf_counter()
+    results = crawl(todo, config, args.workers, args.host_limit, args.output_dir, state,
+                    prefetch=args.prefetch)
+    failed = [r["id"] for r in results if not r["ok"]]
+    metrics.count("crawl.skipped", len(skipped))
+    print(f"抓取 {len(results)} 个账号, 失败 {len(failed)} 个{(': ' + ' '.join(failed)) if failed else ''}, "
+          f"共 {sum(r.get('weibos', 0) for r in results)} 条微博, 耗时 {time.perf_counter() - start:.1f}s")
+    util.write_run_report(metrics_file)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,42 @@
+import argparse
+import hashlib
+import heapq
 import json
 import re
 import jieba
 import os
-from datetime import datetime
-
-with open("./config/user_id_list.txt", "w", encoding="utf-8") as f:
-    f.write("7716940453 地下偶像相关揭示板")
-
-# 地点列表, 用来判断是否位于上海
-cities = [
-    "上海",
-    "育音堂",
-    "新歌空间",
-    "世界树", "第一百货"
-    "聚一场", "上海广场",
-    "瓦肆",
-    "MAO", "mao", "Mao"
-    "cave", "Cave", "CAVE",
-    "星偶界",
-    "theboxx", "the boxx", "城市乐园",
-    "九六广场", "九六",
-    "环球港",
-    "万代南梦宫", "未来剧场", "梦想剧场", "浅水湾",
-    "rojo", "ROJO", "Rojo",
-    "安可空间", "意空间见",
-    "次乐园", "小南门",
-    "长宁", "虹口", "杨浦", "黄浦", "徐汇", "浦东", "静安", 
-    "可游米",
-    "上滨",
-
-    ]
+from datetime import datetime, timedelta
+
+import archive
+import metrics
+from accounts import ACCOUNTS_FILE, dump_path, load_accounts
+from venues import load_matcher
+
+# 爬虫结果目录, 每个账号一个子目录, 见 crawl.py
+WEIBO_DIR = "./config/weibo"
+# 输出文件目录
+OUTPUT_DIR = "../database/json"
+# 已入库微博的索引, 跨天去重用, 不存在时从 OUTPUT_DIR 下已有的结果文件重建。
+# 由 llm.py 在记录入库之后写入, 本脚本只读取
+EMITTED_INDEX = "../database/emitted_index.json"
+# 最近这么多天的结果文件中没有入库的记录 (LLM 请求失败、回答无法解析) 重新输出
+RETRY_DAYS = 7
+# 索引最多保留的微博数, 超出时淘汰最早输出的, 文件大小约 30 字节/条
+MAX_EMITTED_IDS = 20000
+# 运行报告, 每次运行追加一行, 见 metrics.py
+METRICS_FILE = "../database/metrics.jsonl"
+# 压缩归档, 筛选结果同时追加到其中的 raw, 见 archive.py
+ARCHIVE_DIR = "../database/archive"
+# to_record 只用到微博的这些字段, crawl.py、watch.py 让爬虫只提取它们 (page_parser.FIELDS)
+SPIDER_FIELDS = ("id", "content", "publish_time")
+# 流式读取爬虫结果时每次读入的字符数, 内存占用只与它和单条微博的大小有关
+CHUNK_SIZE = 1 << 16
+
+# 只保留这个城市的演出, 场地列表见 config/venues.json
+CITY = "上海"
+venue_matcher = load_matcher()
+# 场地、主办、团体账号 (kind 为 post) 的微博只保留带有这些词的, 排除日常微博
+LIVE_KEYWORDS = re.compile(r"演出|公演|出演|拼盘|专场|门票|票价|预售|live|OP\s*\d|ST\s*\d", re.I)
 
 def extract_repost_content(text: str) -> str | None:
     """
@@ -40,34 +47,316 @@ def extract_repost_content(text: str) -> str | None:
         return match.group(1).strip()
     return None
 
-# 文件路径
-filename = "./config/weibo/7716940453/7716940453.json"
-with open(filename, "r", encoding="utf-8") as f:
-    data = json.load(f)
 
-# 输出文件目录
-os.makedirs("../database/json", exist_ok=True)
+class JSONStream:
+    """按块读取文件, 逐个解码其中的 JSON 值, 不把整个文件读入内存"""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def read_more(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白, 返回下一个字符, 文件结束时返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.read_more():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"位置 {self.pos} 处应为 {char!r}")
+        self.pos += 1
+
+    def value(self):
+        """解码下一个完整的 JSON 值, 缓冲区里不完整时继续读入"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.read_more():
+                    raise
+                continue
+            # 数字可能被块边界截断, 后面还有内容时才算完整
+            if end == len(self.buf) and self.read_more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_weibo(path, chunk_size=CHUNK_SIZE):
+    """流式遍历爬虫结果 {"user": {...}, "weibo": [...]} 中的 weibo 数组"""
+    with open(path, "r", encoding="utf-8") as f:
+        stream = JSONStream(f, chunk_size)
+        stream.expect("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key != "weibo":
+                stream.value()
+            else:
+                stream.expect("[")
+                while stream.peek() != "]":
+                    yield stream.value()
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                stream.pos += 1
+            if stream.peek() == ",":
+                stream.pos += 1
+
+
+def content_hash(text):
+    """转发内容的短哈希, 忽略空白差异"""
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class EmittedIndex:
+    """已入库微博的 weibo_id -> 内容哈希, 只让新的或内容改过的微博进入下游
+
+    generate_json.py 在内存中把本次输出的微博加入索引 (同一次运行中去重), 但
+    不保存; llm.py 在提取结果入库之后才把这些微博记入索引并保存, 提取失败的
+    微博不在索引中, 下次运行时重新输出。
+    """
+
+    def __init__(self, path=EMITTED_INDEX, max_ids=MAX_EMITTED_IDS):
+        self.path = path
+        self.max_ids = max_ids
+        self.ids = {}
+        # 内容哈希 -> 出现次数, 不同账号发出的同一条情报只输出一次
+        self.hashes = {}
+
+    def load(self, seed_dir=None):
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.ids = json.load(f).get("ids", {})
+            for digest in self.ids.values():
+                self.hashes[digest] = self.hashes.get(digest, 0) + 1
+        elif seed_dir and os.path.isdir(seed_dir):
+            for fname in sorted(os.listdir(seed_dir)):
+                if fname.startswith("result_") and fname.endswith(".jsonl"):
+                    with open(os.path.join(seed_dir, fname), "r", encoding="utf-8") as f:
+                        for line in f:
+                            if line.strip():
+                                self.add(json.loads(line))
+        return self
+
+    def check(self, record):
+        """返回 "new"、"changed", 已输出过且内容相同 (包括其他账号的同文微博) 时返回 None"""
+        digest = content_hash(record["content"])
+        old = self.ids.get(record["weibo_id"])
+        if old == digest or digest in self.hashes:
+            return None
+        return "new" if old is None else "changed"
+
+    def add(self, record):
+        # 先删后插, 字典顺序即输出顺序, 淘汰时从头部删除
+        self.forget(self.ids.pop(record["weibo_id"], None))
+        digest = content_hash(record["content"])
+        self.ids[record["weibo_id"]] = digest
+        self.hashes[digest] = self.hashes.get(digest, 0) + 1
+        while len(self.ids) > self.max_ids:
+            self.forget(self.ids.pop(next(iter(self.ids))))
+
+    def forget(self, digest):
+        if digest is None:
+            return
+        self.hashes[digest] -= 1
+        if not self.hashes[digest]:
+            del self.hashes[digest]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "ids": self.ids}, f, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
 
-# 根据脚本运行日期生成文件名，例如 result_2025-08-19.jsonl
-today = datetime.now().strftime("%Y-%m-%d")
-output_file = f"../database/json/result_{today}.jsonl"
 
-for day_data in data["weibo"]:
+def to_record(day_data, account=None):
+    """返回(要写入的记录或None, 是否为演出情报)
+
+    account 为 accounts.json 中的账号, 默认按情报汇总号 (board) 筛选。
+    """
+    account = account or {"kind": "board"}
     content = day_data["content"]
-    lenth, start = 9, 5
-    if content[start: start + lenth] == "#live演出情报":
+    if account["kind"] == "board":
+        lenth, start = 9, 5
+        if content[start: start + lenth] != "#live演出情报":
+            return None, False
         main_text = extract_repost_content(content)
-        if not main_text:
+    else:
+        main_text = extract_repost_content(content) or content.strip()
+        if not LIVE_KEYWORDS.search(main_text):
+            return None, False
+    if not main_text:
+        return None, True
+    found_venues = [m["venue"] for m in venue_matcher.find(main_text) if m["city"] == CITY]
+    if not found_venues and account.get("venue"):
+        found_venues = [account["venue"]]
+    if not found_venues:
+        return None, account["kind"] == "board"
+    return {
+        "weibo_id": day_data.get("id", ""),       # 微博 ID
+        "url": "https://weibo.cn/comment/" + day_data.get("id", ""),  # 微博 URL
+        "date": day_data.get("publish_time", ""),   # 微博创建日期
+        "content": main_text,                     # 转发内容
+        "venues": list(dict.fromkeys(found_venues)),  # 命中的场地, 按出现顺序
+        "source": account.get("id", ""),          # 来源账号
+    }, True
+
+
+def merge_accounts(accounts, weibo_dir=WEIBO_DIR, chunk_size=CHUNK_SIZE):
+    """把各账号的爬虫结果合并为一个按发布时间从新到旧的流, 元素为 (微博, 账号)
+
+    每个账号的结果本身从新到旧排列, 用 heapq.merge 归并, 同时只读入各文件的一个块。
+    还没有结果文件的账号 (新加入或没有新微博) 跳过。
+    """
+    def tagged(path, account):
+        for weibo in iter_weibo(path, chunk_size):
+            yield weibo, account
+
+    streams = []
+    for account in accounts:
+        path = dump_path(weibo_dir, account["id"])
+        if os.path.isfile(path):
+            streams.append(tagged(path, account))
+    return heapq.merge(*streams, key=lambda item: item[0].get("publish_time", ""), reverse=True)
+
+
+def unstored_records(output_dir, index, exclude="", days=RETRY_DAYS):
+    """最近 days 天的结果文件中还没有入库 (不在 index 中) 的记录, 同一微博只取最后一次"""
+    if not os.path.isdir(output_dir):
+        return []
+    cutoff = f"result_{datetime.now() - timedelta(days=days):%Y-%m-%d}.jsonl"
+    records = {}
+    for fname in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, fname)
+        if not (fname.startswith("result_") and fname.endswith(".jsonl")) or fname < cutoff:
             continue
-        found_cities = [city for city in cities if city in main_text]
-        if found_cities:
-            print(main_text)
-            record = {
-                "weibo_id": day_data.get("id", ""),       # 微博 ID
-                "url": "https://weibo.cn/comment/" + day_data.get("id", ""),  # 微博 URL
-                "date": day_data.get("publish_time", ""),   # 微博创建日期
-                "content": main_text                      # 转发内容
-            }
-            # 写入 JSON Lines 文件
-            with open(output_file, "a", encoding="utf-8") as f_out:
-                f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if exclude and os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["weibo_id"]] = record
+    return [record for record in records.values() if index.check(record) is not None]
+
+
+def generate(weibos, output_file, index=None, verbose=True, retry=()):
+    """把筛选出的记录追加写入 output_file, 返回各环节的条数
+
+    weibos 的元素为微博, 或 merge_accounts 给出的 (微博, 账号)。给出 index 时
+    跳过已入库且内容未变的微博, 写入的记录同时加入 index (只在内存中, 入库后
+    由 llm.py 保存)。retry 为之前输出过但没有入库的记录, 先原样重新写入。
+    """
+    summary = {"scanned": 0, "matched": 0, "duplicate": 0, "changed": 0, "retried": 0, "written": 0}
+    f_out = None
+    try:
+        if retry:
+            f_out = open(output_file, "a", encoding="utf-8")
+        for record in retry:
+            if index is not None:
+                index.add(record)
+            f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            summary["retried"] += 1
+            summary["written"] += 1
+        for day_data in weibos:
+            account = None
+            if isinstance(day_data, tuple):
+                day_data, account = day_data
+            summary["scanned"] += 1
+            with metrics.timer("generate.to_record"):
+                record, matched = to_record(day_data, account)
+            summary["matched"] += matched
+            if record is None:
+                continue
+            if index is not None:
+                status = index.check(record)
+                if status is None:
+                    summary["duplicate"] += 1
+                    continue
+                summary["changed"] += status == "changed"
+                index.add(record)
+            if verbose:
+                print(record["content"])
+            # 写入 JSON Lines 文件, 有结果时才创建
+            if f_out is None:
+                f_out = open(output_file, "a", encoding="utf-8")
+            f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            summary["written"] += 1
+    finally:
+        if f_out is not None:
+            f_out.close()
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="合并各账号的爬虫结果, 筛选上海的演出情报")
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE, help="账号列表, 见 accounts.py")
+    parser.add_argument("--weibo_dir", default=WEIBO_DIR, help="爬虫结果目录")
+    parser.add_argument("--input", default="", help="只处理这一个爬虫生成的 json 文件, 按情报汇总号筛选")
+    parser.add_argument("--output_dir", default=OUTPUT_DIR)
+    parser.add_argument("--index", default=EMITTED_INDEX, help="跨天去重索引文件, 由 llm.py 在入库后写入")
+    parser.add_argument("--no_index", action="store_true", help="不去重, 输出全部命中的微博")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="运行报告 (JSONL) 路径, 为空时不写")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="压缩归档目录, 为空时不归档")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.input:
+        inputs = [args.input]
+        weibos = iter_weibo(args.input)
+    else:
+        accounts = load_accounts(args.accounts)
+        inputs = [dump_path(args.weibo_dir, a["id"]) for a in accounts]
+        weibos = merge_accounts(accounts, args.weibo_dir)
+
+    # 增量抓取没有新微博时爬虫不会生成结果文件, 仍要重新输出之前没有入库的记录
+    if not any(os.path.isfile(path) for path in inputs):
+        print(f"没有新抓取的微博: {' '.join(inputs)} 不存在")
+        weibos = []
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    # 根据脚本运行日期生成文件名，例如 result_2025-08-19.jsonl
+    today = datetime.now().strftime("%Y-%m-%d")
+    output_file = os.path.join(args.output_dir, f"result_{today}.jsonl")
+
+    metrics.reset()
+    with metrics.timer("generate.index_load"):
+        index = None if args.no_index else EmittedIndex(args.index).load(seed_dir=args.output_dir)
+    # 之前输出过但 LLM 提取失败、没有入库的记录, 写入今天的结果文件再提取一次
+    retry = [] if index is None else unstored_records(args.output_dir, index, exclude=output_file)
+    with metrics.timer("generate.scan"):
+        summary = generate(weibos, output_file, index, retry=retry)
+    if summary["written"] and args.archive:
+        # 当天的结果文件可能是多次运行追加的, 归档会跳过已有的记录
+        with metrics.timer("generate.archive"), open(output_file, "r", encoding="utf-8") as f:
+            summary["archived"] = archive.archive_records("raw", map(json.loads, f), args.archive)
+    for key, value in summary.items():
+        metrics.count(f"generate.{key}", value)
+    metrics.write_report("generate", args.metrics, output=output_file,
+                         inputs=sum(os.path.isfile(path) for path in inputs))
+    print(f"扫描 {summary['scanned']} 条微博, 演出情报 {summary['matched']} 条, "
+          f"已入库 {summary['duplicate']} 条, 内容有改动 {summary['changed']} 条, "
+          f"重新输出之前未入库的 {summary['retried']} 条, 写入 {summary['written']} 条 -> {output_file}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
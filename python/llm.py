@@ -1,89 +1,249 @@
+import hashlib
 import json
+import random
+import threading
+import time
 import requests
-from tinydb import TinyDB, Query
-from tinydb.storages import JSONStorage
-from tinydb.middlewares import CachingMiddleware
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import argparse
 import os
 
+import metrics
+from archive import ARCHIVE_DIR, archive_records
+from generate_json import EmittedIndex
+from repair import EVENT_FIELDS, REQUIRED_FIELDS, build_field_prompt, canonical, loads_objects, validate
+from rules import CONFIDENCE_THRESHOLD, RuleExtractor
+from store import DB_PATH, EventStore
+
+API_URL = "https://qianfan.baidubce.com/v2/chat/completions"
+MODEL = "ernie-4.0-8k"
+# 修改 build_prompt 的模板后请递增, 使旧的缓存结果失效
+PROMPT_VERSION = 1
+
+# 以下全局变量由 main() 根据命令行参数设置
+API_KEY = ""
+DB_FILE = DB_PATH
+MAX_RETRIES = 4          # 遇到 429/5xx 时的最大重试次数
+BACKOFF_BASE = 1.0       # 退避基数(秒), 第 n 次重试等待 BACKOFF_BASE * 2**n 加随机抖动
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 运行报告, 每次运行追加一行, 见 metrics.py
+METRICS_FILE = "database/metrics.jsonl"
+# 已入库微博的索引, 与 generate_json.EMITTED_INDEX 是同一个文件
+EMITTED_INDEX = "database/emitted_index.json"
+
+
 # -------- 参数设置 --------
-parser = argparse.ArgumentParser()
-parser.add_argument("--apikey", required=True, help="百度 LLM API Key")
-parser.add_argument("--input", required=True, help="输入 JSONL 文件路径")
-parser.add_argument("--output_dir", default="database/tinydb", help="生成 JSONL 文件目录")
-args = parser.parse_args()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apikey", required=True, help="百度 LLM API Key")
+    parser.add_argument("--input", required=True, help="输入 JSONL 文件路径")
+    parser.add_argument("--db", default=DB_PATH, help="演出信息库 (SQLite) 路径")
+    parser.add_argument("--api_url", default=API_URL, help="LLM 接口地址 (压测时可指向本地桩服务)")
+    parser.add_argument("--workers", type=int, default=1, help="同时在途的 LLM 请求数, 1 为串行")
+    parser.add_argument("--rps", type=float, default=0, help="每秒最多发起的请求数, 0 为不限速")
+    parser.add_argument("--max_retries", type=int, default=MAX_RETRIES, help="429/5xx 时的最大重试次数")
+    parser.add_argument("--batch_size", type=int, default=1, help="每次请求最多打包的微博条数, 1 为逐条请求")
+    parser.add_argument("--batch_tokens", type=int, default=1800, help="批量请求中微博正文的 token 预算")
+    parser.add_argument("--flush_every", type=int, default=1000, help="累计多少条写入后提交一次事务, 0 为只在结束时提交")
+    parser.add_argument("--cache", default="database/llm_cache.json", help="LLM 结果缓存文件")
+    parser.add_argument("--no_cache", action="store_true", help="不读写缓存, 全部重新请求")
+    parser.add_argument("--cache_max_age_days", type=float, default=90, help="缓存条目最长保留天数")
+    parser.add_argument("--no_rules", action="store_true", help="不做规则预提取, 全部交给 LLM")
+    parser.add_argument("--rule_threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="规则预提取的 confidence 不低于该值时不再调用 LLM")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="运行报告 (JSONL) 路径, 为空时不写")
+    parser.add_argument("--index", default=EMITTED_INDEX,
+                        help="跨天去重索引文件, 入库成功的微博记入其中, 为空时不写")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="压缩归档目录, 新记录追加到其中的 events, 为空时不归档")
+    parser.add_argument("--cache_max_entries", type=int, default=5000, help="缓存最多保留条目数, 超出时淘汰最久未用的")
+    return parser.parse_args(argv)
 
-API_KEY = args.apikey
-INPUT_FILE = args.input
-OUTPUT_DIR = args.output_dir
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+class TokenBucket:
+    """令牌桶限速, 多线程共享; rate 为每秒补充的令牌数, rate <= 0 表示不限速"""
 
-# -------- 工具函数 --------
-def parse_date(date_str: str):
-    """尝试解析 live_date，成功返回 datetime，失败返回 None"""
-    try:
-        return datetime.strptime(date_str, "%Y-%m-%d")
-    except Exception:
-        return None
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-def insert_by_date(record: dict):
-    """根据 live_date 建立/写入对应数据库"""
-    live_date = record.get("live_date", "")
-    dt = parse_date(live_date)
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-    if dt is None:
-        db_path = os.path.join(OUTPUT_DIR, "special.json")
-    else:
-        db_path = os.path.join(OUTPUT_DIR, f"{dt.strftime('%Y-%m-%d')}.json")
 
-    # 打开对应日期的数据库
-    db = TinyDB(db_path, storage=CachingMiddleware(JSONStorage))
-    Weibo = Query()
+class LLMCache:
+    """LLM 结果的磁盘缓存, 以 (模型, 模板版本, weibo_id, 正文, 发布时间) 的哈希为键
+
+    发布时间也写在提示词里, 没写年份的日期按它推断, 因此同样的正文换了发布
+    时间 (编辑、重发) 不能沿用旧的结果。
+
+    启动时整体读入内存, 结束时一次性写回; 写回前按存活时间和条目数淘汰。
+    path 为空时不读写磁盘, 仅作为空缓存使用。
+    """
+
+    def __init__(self, path: str = "", max_age_days: float = 90, max_entries: int = 5000):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def make_key(weibo_id: str, content: str, publish_time: str) -> str:
+        raw = json.dumps([MODEL, PROMPT_VERSION, weibo_id, content, publish_time], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["created"] > self.max_age:
+                self.misses += 1
+                return None
+            entry["used"] = time.time()
+            self.hits += 1
+            return entry["text"]
+
+    def put(self, key: str, text: str):
+        now = time.time()
+        with self.lock:
+            self.entries[key] = {"created": now, "used": now, "text": text}
+
+    def evict(self):
+        """删除过期条目, 再按最近使用时间只保留 max_entries 条"""
+        now = time.time()
+        entries = {k: v for k, v in self.entries.items() if now - v["created"] <= self.max_age}
+        if len(entries) > self.max_entries:
+            newest = sorted(entries.items(), key=lambda kv: kv[1]["used"], reverse=True)
+            entries = dict(newest[:self.max_entries])
+        evicted = len(self.entries) - len(entries)
+        self.entries = entries
+        return evicted
+
+    def save(self):
+        if not self.path:
+            return 0
+        evicted = self.evict()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return evicted
+
+
+cache = LLMCache()
+
+
+# 所有 LLM 请求共用一个连接池, 避免每次重新握手
+session = requests.Session()
+rate_limiter = TokenBucket(0)
+
+
+def configure_pool(workers: int, rps: float):
+    """按并发数调整连接池大小, 并设置全局限速"""
+    global rate_limiter
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    rate_limiter = TokenBucket(rps)
+
+
+def retry_delay(attempt: int, resp=None) -> float:
+    """计算第 attempt 次重试前的等待时间, 优先遵守 Retry-After"""
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    return BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random())
 
-    # 如果已存在则覆盖，否则插入
-    weibo_id = record.get("weibo_id", "")
-    existing = db.get(Weibo.weibo_id == weibo_id)
-    if existing:
-        db.update(record, Weibo.weibo_id == weibo_id)
-        print(f"微博 {weibo_id} 已存在 {db_path}，已覆盖")
-    else:
-        db.insert(record)
-        print(f"✅ 插入微博 {weibo_id} 到 {db_path}")
-    db.close()
 
 # -------- 百度 LLM 调用函数 --------
+# 本次运行的请求统计, 用于对比单条与批量模式的开销
+request_stats = {"calls": 0, "prompt_tokens": 0}
+# LLM 回答的解析结果: 直接可用 / 本地修复 / 补问了缺失字段 / 完全解析不出
+parse_stats = {"strict": 0, "repaired": 0, "requeried": 0, "failed": 0}
+stats_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数: 中文约一字一个 token, 其余字符约四个一个"""
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return len(text) - ascii_count + ascii_count // 4 + 1
+
+
 def call_baidu_llm(prompt: str) -> dict:
-    url = "https://qianfan.baidubce.com/v2/chat/completions"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {API_KEY}"
     }
     data = {
-        "model": "ernie-4.0-8k",
+        "model": MODEL,
         "messages": [
             {"role": "user", "content": prompt}
         ]
     }
-    resp = requests.post(url, headers=headers, json=data)
-    resp.raise_for_status()
-    return resp.json()
+    start = time.perf_counter()
+    attempt = 0
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            with metrics.timer("llm.rate_limit_wait"):
+                rate_limiter.acquire()
+            try:
+                with metrics.timer("llm.request"):
+                    resp = session.post(API_URL, headers=headers, json=data, timeout=(10, 120))
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(retry_delay(attempt))
+                continue
+            if resp.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+                delay = retry_delay(attempt, resp)
+                print(f"LLM 接口返回 {resp.status_code}，{delay:.1f} 秒后重试")
+                time.sleep(delay)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+    finally:
+        tokens = estimate_tokens(prompt)
+        with stats_lock:
+            request_stats["calls"] += 1
+            request_stats["prompt_tokens"] += tokens
+        # llm.call 包含重试和退避等待, llm.request 只是单次 HTTP 请求
+        metrics.add_time("llm.call", time.perf_counter() - start)
+        metrics.count("llm.calls")
+        metrics.count("llm.retries", attempt)
+        metrics.observe("llm.prompt_tokens", tokens)
 
-# -------- 读取 JSONL 输入 --------
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    input_records = [json.loads(line) for line in f]
 
-# -------- 处理每条记录 --------
-new_records = []
+def ask_llm(prompt: str) -> str:
+    """发送 prompt, 返回去掉代码块标记后的回答文本"""
+    llm_result = call_baidu_llm(prompt)
+    # 百度 LLM 输出文本通常在 choices[0].message.content
+    llm_text = llm_result.get("choices", [{}])[0].get("message", {}).get("content", "")
+    return llm_text.replace("```json", "").replace("```", "").strip()
 
-for record in input_records:
-    print(record)
-    content = record.get("content", "")
-    weibo_id = record.get("weibo_id", "")
-    publish_time = record.get("date", "")
 
-    prompt = f"""
+def build_prompt(content: str, publish_time: str) -> str:
+    return f"""
 提取微博内容中的以下字段:
 1. live日期 (输出的json中对应的key用 live_date 替换) 请注意日期请按照%Y-%m-%d格式输出, 如xxxx-xx-xx
 2. live地点 (输出的json中对应的key用 live_location 替换)
@@ -99,38 +259,332 @@ for record in input_records:
 如果没有某个字段，请留空。内容如下：
 {content}
 """
+
+
+def build_batch_prompt(batch) -> str:
+    posts = [
+        {"id": r.get("weibo_id", ""), "publish_time": r.get("date", ""), "content": r.get("content", "")}
+        for r in batch
+    ]
+    return f"""
+下面是一个 JSON 数组, 每个元素是一条微博, 包含 id、publish_time、content。
+请对每条微博分别提取以下字段:
+1. live日期 (输出的json中对应的key用 live_date 替换) 请注意日期请按照%Y-%m-%d格式输出, 如xxxx-xx-xx
+2. live地点 (输出的json中对应的key用 live_location 替换)
+3. 团体全员 (输出的json中对应的key用 groups 替换)
+4. 正文(输出的json中对应的key用 main_text 替换) (保持换行美观)
+**请只输出一个 JSON 数组, 每条微博对应数组中的一个对象, 对象中必须原样带上该微博的 id**!!!
+请不要在开头和结尾生成形如```,json 的字符, 以正常的中括号作为开头结尾
+请一定注意年份不要错了, 时间准确是最重要的内容,
+如果原文没有写年份, 请自行根据该条微博的 publish_time 推断
+我希望你对content进行排版, 让它尽可能美观, 保持段落和格式的清晰
+同一条微博只要一个对象, 如果有多场, 日期就用最早的, 其他都放在正文,地点合在一起
+
+如果没有某个字段，请留空。内容如下：
+{json.dumps(posts, ensure_ascii=False)}
+"""
+
+
+def count_parse(outcome: str):
+    with stats_lock:
+        parse_stats[outcome] += 1
+    metrics.count(f"llm.answers_{outcome}")
+
+
+def requery(record: dict, event: dict, missing: list) -> list:
+    """只就缺失的字段再问一次, 补到 event 中, 返回仍然缺失的字段"""
     try:
-        llm_result = call_baidu_llm(prompt)
-        # 百度 LLM 输出文本通常在 choices[0].message.content
-        llm_text = llm_result.get("choices", [{}])[0].get("message", {}).get("content", "")
-        llm_text = llm_text.replace("```json", "").replace("```", "").strip()
+        objects, _ = loads_objects(ask_llm(build_field_prompt(
+            record.get("content", ""), record.get("date", ""), missing)))
+    except Exception as e:
+        print(f"补问微博 {record.get('weibo_id', '')} 出错:", e)
+        return missing
+    patch, _ = validate(objects, record.get("date", ""))
+    for field in missing:
+        if patch[field]:
+            event[field] = patch[field]
+    return [field for field in missing if not event[field]]
+
+
+def finish_record(record: dict, llm_text: str, from_cache: bool, repaired: bool = False) -> dict:
+    """解析 LLM 回答并与原始信息合并
+
+    回答先经 repair.py 容错解析和校验, 缺失的字段补问一次。解析出了对象时缓存
+    规范化后的结果 (全部字段都有, 下次直接可用), 完全解析不出时不缓存, 回答
+    原文放进 main_text, 下次运行再请求。repaired 表示 llm_text 取自已经修复过的批量回答。
+    """
+    objects, fixed = loads_objects(llm_text)
+    repaired = repaired or fixed
+    event, missing = validate(objects, record.get("date", ""))
+    if missing:
+        outcome = "requeried"
+        missing = requery(record, event, missing)
+    elif repaired or len(objects) != 1 or any(
+            value != event[key] for key, value in canonical(objects[0]).items() if key in EVENT_FIELDS):
+        outcome = "repaired"
+    else:
+        outcome = "strict"
+    if missing:
+        print(f"微博 {record.get('weibo_id', '')} 补问后仍缺少: {', '.join(missing)}")
+    # 每条回答只计入一种结果, 最终没有可用字段的算作解析失败
+    if not objects and (outcome != "requeried" or len(missing) == len(REQUIRED_FIELDS)):
+        outcome = "failed"
+    count_parse(outcome)
+
+    if outcome != "failed":
+        event["main_text"] = event["main_text"] or record.get("content", "")
+        if not from_cache or outcome != "strict":
+            cache.put(LLMCache.make_key(record.get("weibo_id", ""), record.get("content", ""),
+                                        record.get("date", "")),
+                      json.dumps(event, ensure_ascii=False))
+    else:
+        event["main_text"] = event["main_text"] or llm_text.strip()
+
+    # 合并原始信息
+    return {
+        "weibo_id": record.get("weibo_id", ""),
+        "url": record.get("url", ""),
+        "date": record.get("date", ""),
+        **event
+    }
+
+
+def extract_record(record: dict, lookup: bool = True):
+    """调用 LLM 提取单条微博, 返回合并后的记录, 出错时返回 None
+
+    lookup=False 时跳过缓存查询 (批量模式已经查过一次)
+    """
+    print(record)
+    content = record.get("content", "")
+    weibo_id = record.get("weibo_id", "")
+    publish_time = record.get("date", "")
+
+    try:
+        llm_text = cache.get(LLMCache.make_key(weibo_id, content, publish_time)) if lookup else None
+        from_cache = llm_text is not None
+        if not from_cache:
+            llm_text = ask_llm(build_prompt(content, publish_time))
         print(llm_text)
+        return finish_record(record, llm_text, from_cache)
 
-        # 尝试解析为 JSON
-        try:
-            extracted = json.loads(llm_text)
-        except json.JSONDecodeError:
-            extracted = {
-                "live_date": "",
-                "live_location": "",
-                "groups": "",
-                "main_text": llm_text.strip()
-            }
-
-        # 合并原始信息
-        final_record = {
-            "weibo_id": weibo_id,
+    except Exception as e:
+        print(f"处理微博 {weibo_id} 出错:", e)
+        return None
+
+
+def parse_batch_answer(llm_text: str):
+    """把批量回答解析为 {id: 字段} 映射, 返回 (映射, 是否经过修复), 无法解析时映射为空"""
+    items, repaired = loads_objects(llm_text)
+    answers = {}
+    for item in items:
+        if "id" in item:
+            answers[str(item.pop("id"))] = item
+    return answers, repaired
+
+
+def extract_batch(batch):
+    """一次请求提取多条微博, 未能从回答中解析出的条目回退为单条请求"""
+    if len(batch) == 1:
+        return [extract_record(batch[0], lookup=False)]
+    try:
+        answers, repaired = parse_batch_answer(ask_llm(build_batch_prompt(batch)))
+    except Exception as e:
+        print(f"批量请求 {len(batch)} 条出错, 改为逐条请求:", e)
+        answers, repaired = {}, False
+
+    results = []
+    for record in batch:
+        item = answers.get(record.get("weibo_id", ""))
+        if item is None:
+            results.append(extract_record(record, lookup=False))
+            continue
+        llm_text = json.dumps(item, ensure_ascii=False)
+        print(record)
+        print(llm_text)
+        results.append(finish_record(record, llm_text, from_cache=False, repaired=repaired))
+    return results
+
+
+def make_batches(records, batch_size: int, batch_tokens: int):
+    """按条数上限和 token 预算把记录顺序切分成批"""
+    batches, current, tokens = [], [], 0
+    for record in records:
+        cost = estimate_tokens(record.get("content", ""))
+        if current and (len(current) >= batch_size or tokens + cost > batch_tokens):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(record)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def extract_all(input_records, workers: int = 1, batch_size: int = 1, batch_tokens: int = 1800):
+    """按输入顺序逐条产出提取结果; workers > 1 时并发请求, 但结果顺序与输入一致
+
+    batch_size > 1 时先查缓存, 未命中的记录按 token 预算打包成批量请求。
+    """
+    if batch_size <= 1:
+        if workers <= 1:
+            for record in input_records:
+                yield extract_record(record)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # executor.map 按提交顺序返回结果, 保证写库顺序确定
+            yield from executor.map(extract_record, input_records)
+        return
+
+    results = [None] * len(input_records)
+    pending = []
+    for i, record in enumerate(input_records):
+        llm_text = cache.get(LLMCache.make_key(record.get("weibo_id", ""), record.get("content", ""),
+                                               record.get("date", "")))
+        if llm_text is None:
+            pending.append(i)
+        else:
+            results[i] = finish_record(record, llm_text, from_cache=True)
+
+    batches = make_batches([input_records[i] for i in pending], batch_size, batch_tokens)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        batch_results = [r for rs in executor.map(extract_batch, batches) for r in rs]
+    for i, final_record in zip(pending, batch_results):
+        results[i] = final_record
+    yield from results
+
+
+def pre_extract(input_records, extractor, threshold: float) -> dict:
+    """先用规则提取, 返回 {输入序号: 记录}; 不够可靠的微博不在其中, 交给 LLM"""
+    results = {}
+    for i, record in enumerate(input_records):
+        with metrics.timer("rules.extract"):
+            fields, confidence = extractor.extract(record)
+        metrics.observe("rules.confidence", confidence)
+        if confidence < threshold:
+            continue
+        print(f"规则提取微博 {record.get('weibo_id', '')} (confidence {confidence})")
+        results[i] = {
+            "weibo_id": record.get("weibo_id", ""),
             "url": record.get("url", ""),
             "date": record.get("date", ""),
-            **extracted
+            **fields
         }
+    return results
+
+
+def process_records(input_records, store, extractor=None, threshold: float = CONFIDENCE_THRESHOLD,
+                    workers: int = 1, batch_size: int = 1, batch_tokens: int = 1800, flush_every: int = 1000):
+    """规则预提取后把其余微博交给 LLM, 结果按输入顺序写入 store
+
+    extractor 为 None 时不做规则预提取。返回 (写入的记录, 规则提取的条数),
+    LLM 请求失败或写入出错的微博不在写入的记录中。
+    """
+    new_records = []
+    ruled = pre_extract(input_records, extractor, threshold) if extractor is not None else {}
+    pending = [r for i, r in enumerate(input_records) if i not in ruled]
+    llm_results = extract_all(pending, workers, batch_size, batch_tokens)
+    # 按输入顺序合并规则结果与 LLM 结果
+    for i in range(len(input_records)):
+        final_record = ruled[i] if i in ruled else next(llm_results)
+        if final_record is None:
+            continue
+        weibo_id = final_record.get("weibo_id", "")
+        # 写入演出信息库, 已存在则覆盖
+        try:
+            with metrics.timer("store.upsert"):
+                existed = store.upsert(final_record)
+            if existed:
+                print(f"微博 {weibo_id} 已存在，已覆盖")
+            else:
+                print(f"✅ 插入微博 {weibo_id}")
+        except Exception as e:
+            print(f"写入微博 {weibo_id} 出错:", e)
+            continue
         new_records.append(final_record)
+        if flush_every > 0 and len(new_records) % flush_every == 0:
+            with metrics.timer("store.commit"):
+                store.commit()
+    return new_records, len(ruled)
 
-        # 写入按 live_date 分库
-        insert_by_date(final_record)
 
-    except Exception as e:
-        print(f"处理微博 {weibo_id} 出错:", e)
+def mark_stored(index, input_records, new_records) -> int:
+    """把已入库且取到了字段的微博记入跨天去重索引, 返回记入的条数
+
+    回答无法解析时记录的字段全部为空, 与请求失败的微博一样不记入,
+    下次 generate_json.py 会重新输出。
+    """
+    stored = {r.get("weibo_id") for r in new_records if any(r.get(f) for f in REQUIRED_FIELDS)}
+    marked = 0
+    for record in input_records:
+        if record.get("weibo_id") in stored:
+            index.add(record)
+            marked += 1
+    return marked
+
+
+def main(argv=None):
+    global API_KEY, API_URL, DB_FILE, MAX_RETRIES, cache
+    args = parse_args(argv)
+    API_KEY = args.apikey
+    API_URL = args.api_url
+    DB_FILE = args.db
+    MAX_RETRIES = args.max_retries
+
+    configure_pool(args.workers, args.rps)
+    request_stats.update(calls=0, prompt_tokens=0)
+    parse_stats.update(dict.fromkeys(parse_stats, 0))
+    metrics.reset()
+    cache = LLMCache("" if args.no_cache else args.cache,
+                     args.cache_max_age_days, args.cache_max_entries)
+
+    # -------- 读取 JSONL 输入 --------
+    if not os.path.isfile(args.input):
+        print(f"输入文件 {args.input} 不存在，今天没有需要处理的微博")
+        return []
+    with open(args.input, "r", encoding="utf-8") as f:
+        input_records = [json.loads(line) for line in f]
+
+    # -------- 处理每条记录 --------
+    store = EventStore(DB_FILE)
+    start = time.perf_counter()
+    try:
+        extractor = None if args.no_rules else RuleExtractor(store.normalizer, store.group_names())
+        new_records, ruled = process_records(input_records, store, extractor, args.rule_threshold,
+                                             args.workers, args.batch_size, args.batch_tokens,
+                                             args.flush_every)
+    finally:
+        with metrics.timer("store.commit"):
+            store.close()
+
+    elapsed = time.perf_counter() - start
+    if args.index:
+        # 事务已提交, 此时才把入库的微博记为已输出
+        index = EmittedIndex(args.index).load(seed_dir=os.path.dirname(args.input))
+        marked = mark_stored(index, input_records, new_records)
+        index.save()
+        if marked < len(input_records):
+            print(f"{len(input_records) - marked} 条微博没有成功入库, 下次运行时重新提取")
+    with metrics.timer("llm.archive"):
+        archive_records("events", new_records, args.archive)
+    evicted = cache.save()
+    print(f"处理完成，新记录 {len(new_records)} 条")
+    print(f"规则提取 {ruled} 条，免去 {ruled / max(len(input_records), 1):.0%} 的微博调用 LLM")
+    print(f"LLM 缓存命中 {cache.hits} 次，未命中 {cache.misses} 次，淘汰 {evicted} 条")
+    print(f"LLM 回答直接可用 {parse_stats['strict']} 条，本地修复 {parse_stats['repaired']} 条，"
+          f"补问缺失字段 {parse_stats['requeried']} 条，仍无法解析 {parse_stats['failed']} 条")
+    posts = max(len(input_records), 1)
+    print(f"LLM 请求 {request_stats['calls']} 次，估算输入 token {request_stats['prompt_tokens']}，"
+          f"平均每条微博 {request_stats['prompt_tokens'] / posts:.0f} token、耗时 {elapsed / posts:.2f} 秒")
+    print(f"演出信息库: {DB_FILE}")
+    metrics.count("llm.posts", len(input_records))
+    metrics.count("llm.records", len(new_records))
+    metrics.count("llm.cache_hits", cache.hits)
+    metrics.count("llm.cache_misses", cache.misses)
+    metrics.count("rules.accepted", ruled)
+    metrics.write_report("llm", args.metrics, input=args.input, workers=args.workers,
+                         batch_size=args.batch_size, rule_threshold=None if args.no_rules else args.rule_threshold)
+    return new_records
+
 
-print(f"处理完成，新记录 {len(new_records)} 条")
-print(f"数据库存放目录: {OUTPUT_DIR}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""流水线各阶段的计数器、计时器与直方图
+
+爬虫 → generate_json.py → llm.py → render.py 每个阶段在同一个进程里累计指标,
+结束时用 write_report 把本阶段的汇总追加为 JSONL 文件中的一行:
+
+    {"stage": "llm", "run_id": "...", "started": "...", "elapsed": 12.3,
+     "counters": {"llm.calls": 20, ...},
+     "timers": {"llm.call": {"count": 20, "total": 9.1, "mean": ..., "p50": ..., "p90": ..., "p99": ..., "max": ...}},
+     "histograms": {"llm.prompt_tokens": {...}},
+     "info": {...}}
+
+run_id 取环境变量 METRICS_RUN_ID 或 GITHUB_RUN_ID, 同一次 workflow 的各阶段
+可以据此归到一起。报告文件优先取环境变量 METRICS_FILE, 其次是调用方给出的
+路径, 两者都为空时不写文件。每个阶段只保留最近 MAX_RUNS 次的报告, 文件随
+workflow 提交到仓库, 不会无限增长。
+
+本文件只依赖标准库, workflow 会把它和 util.py、page_parser.py 一起复制到
+weibo_spider/parser 下供爬虫使用。比较最近两次运行:
+
+    python python/metrics.py diff --file database/metrics.jsonl
+
+只在有指标回退时以非零状态退出, 文件不存在或只有一次运行时只给出提示。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_ENV = "METRICS_FILE"
+# 每个直方图最多保留的样本数, 超出后按蓄水池抽样替换, 分位数为近似值
+MAX_SAMPLES = 10000
+# 报告文件中每个阶段保留的运行次数
+MAX_RUNS = 60
+# diff 时耗时增长超过该比例, 且绝对值超过 MIN_REGRESSION_SECONDS 视为回退
+REGRESSION_RATIO = 0.2
+MIN_REGRESSION_SECONDS = 0.001
+
+
+class Histogram:
+    """记录样本的数量、总和、最值, 并保留有限的样本用于计算分位数"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = value
+
+    def merge(self, other):
+        """并入另一个进程的直方图, 样本超出上限时按两边的数量比例抽取"""
+        if not other.count:
+            return
+        total_count = self.count + other.count
+        samples = self.samples + other.samples
+        if len(samples) > MAX_SAMPLES:
+            keep = round(MAX_SAMPLES * self.count / total_count)
+            samples = (random.sample(self.samples, min(keep, len(self.samples)))
+                       + random.sample(other.samples, min(MAX_SAMPLES - keep, len(other.samples))))
+        self.count = total_count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.samples = samples
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples)
+
+        def quantile(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {
+            "count": self.count,
+            "total": round(self.total, 6),
+            "mean": round(self.total / self.count, 6),
+            "min": round(self.min, 6),
+            "p50": round(quantile(0.5), 6),
+            "p90": round(quantile(0.9), 6),
+            "p99": round(quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Registry:
+    """一个进程内的全部指标, 多线程共享"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.timers = {}
+            self.histograms = {}
+
+    def count(self, name: str, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).add(value)
+
+    def add_time(self, name: str, seconds: float):
+        with self.lock:
+            self.timers.setdefault(name, Histogram()).add(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """with timer("llm.call"): ... 记录一次耗时, 出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def export(self) -> dict:
+        """可 pickle 的原始数据, 供多进程时由子进程交给主进程 merge"""
+        with self.lock:
+            return {"counters": dict(self.counters), "timers": dict(self.timers),
+                    "histograms": dict(self.histograms)}
+
+    def merge(self, state: dict):
+        with self.lock:
+            for name, n in state["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for kind in ("timers", "histograms"):
+                target = getattr(self, kind)
+                for name, histogram in state[kind].items():
+                    target.setdefault(name, Histogram()).merge(histogram)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "timers": {k: v.summary() for k, v in sorted(self.timers.items())},
+                "histograms": {k: v.summary() for k, v in sorted(self.histograms.items())},
+            }
+
+    def report(self, stage: str, **info) -> dict:
+        return {
+            "stage": stage,
+            "run_id": os.environ.get("METRICS_RUN_ID") or os.environ.get("GITHUB_RUN_ID") or "",
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "elapsed": round(time.time() - self.started, 3),
+            **self.snapshot(),
+            "info": info,
+        }
+
+    def write_report(self, stage: str, path: str = "", **info):
+        """把本阶段的报告追加到 METRICS_FILE 或 path, 返回写入的路径"""
+        path = os.environ.get(REPORT_ENV) or path
+        if not path:
+            return None
+        line = json.dumps(self.report(stage, **info), ensure_ascii=False)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        trim_reports(path, MAX_RUNS)
+        return path
+
+
+registry = Registry()
+count = registry.count
+observe = registry.observe
+add_time = registry.add_time
+timer = registry.timer
+snapshot = registry.snapshot
+export = registry.export
+merge = registry.merge
+write_report = registry.write_report
+reset = registry.reset
+
+
+# -------- 比较两次运行 --------
+def load_reports(path: str, stage: str = "") -> dict:
+    """{阶段: [报告, ...]}, 按写入顺序"""
+    reports = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            report = json.loads(line)
+            if stage and report["stage"] != stage:
+                continue
+            reports.setdefault(report["stage"], []).append(report)
+    return reports
+
+
+def trim_reports(path: str, max_runs: int = MAX_RUNS) -> int:
+    """每个阶段只保留最近 max_runs 次的报告, 返回删去的行数"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    kept, runs = [], {}
+    for line in reversed(lines):
+        stage = json.loads(line)["stage"]
+        runs[stage] = runs.get(stage, 0) + 1
+        if runs[stage] <= max_runs:
+            kept.append(line)
+    if len(kept) == len(lines):
+        return 0
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.writelines(reversed(kept))
+    os.replace(path + ".tmp", path)
+    return len(lines) - len(kept)
+
+
+def ratio(old, new):
+    return (new - old) / old if old else (0.0 if new == old else float("inf"))
+
+
+def diff_reports(old: dict, new: dict, threshold: float = REGRESSION_RATIO) -> list:
+    """返回 [(指标, 旧值, 新值, 变化比例, 是否回退), ...]"""
+    rows = [("elapsed", old["elapsed"], new["elapsed"], ratio(old["elapsed"], new["elapsed"]), False)]
+    for name in sorted(set(old["timers"]) | set(new["timers"])):
+        a, b = old["timers"].get(name), new["timers"].get(name)
+        if a is None or b is None:
+            rows.append((name, a and a["mean"], b and b["mean"], None, False))
+            continue
+        for key in ("mean", "p90"):
+            change = ratio(a[key], b[key])
+            regressed = change > threshold and b[key] - a[key] > MIN_REGRESSION_SECONDS
+            rows.append((f"{name}.{key}", a[key], b[key], change, regressed))
+    for name in sorted(set(old["counters"]) | set(new["counters"])):
+        a, b = old["counters"].get(name, 0), new["counters"].get(name, 0)
+        if a != b:
+            rows.append((name, a, b, ratio(a, b), False))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看、比较流水线运行报告")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("show", "diff"):
+        p = sub.add_parser(name)
+        p.add_argument("--file", default=os.environ.get(REPORT_ENV) or "database/metrics.jsonl")
+        p.add_argument("--stage", default="", help="只看某个阶段")
+    sub.choices["diff"].add_argument("--threshold", type=float, default=REGRESSION_RATIO,
+                                     help="耗时增长超过该比例视为回退")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.file):
+        print(f"{args.file} 不存在, 还没有运行报告")
+        return
+    regressed = False
+    for stage, reports in load_reports(args.file, args.stage).items():
+        new = reports[-1]
+        if args.command == "show":
+            print(json.dumps(new, ensure_ascii=False, indent=2))
+            continue
+        if len(reports) < 2:
+            print(f"[{stage}] 只有一次运行, 无法比较")
+            continue
+        old = reports[-2]
+        print(f"[{stage}] {old['started']} ({old['run_id']}) → {new['started']} ({new['run_id']})")
+        for name, a, b, change, bad in diff_reports(old, new, args.threshold):
+            change = "" if change is None else f"{change:+.0%}"
+            print(f"  {'!' if bad else ' '} {name:<40} {a!s:>12} → {b!s:<12} {change}")
+            regressed |= bad
+    if regressed:
+        print("有指标回退")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
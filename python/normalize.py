@@ -0,0 +1,89 @@
+"""团体与场地名称的规范化
+
+LLM 给出的 groups 有时是列表, 有时是用 / 、 , 等分隔的字符串, 同一个团体
+还会写成 @StarWinK、STARWINK、StarWink_official 等不同形式。这里把它拆开并
+统一成规范名称:
+
+1. 去掉首尾空白、开头的 @、首尾的 _ 与 -, 以及末尾的 _official/_info/公式
+   等后缀和 (陕西)、（Guest：...） 之类的括号注释;
+2. 用 NFKC + casefold 并去掉空白和 ._-· 得到比较用的 key, 大小写、全半角、
+   分隔符不同的写法视为同一个团体;
+3. config/groups.json 中的别名 (例如繁简体不同的写法) 映射到指定的名称,
+   ignore 中的词 (and more... 等) 直接丢弃。
+
+场地名称由 venues.py 从 live_location 中匹配。规范名称到稳定 ID 的分配和
+倒排索引由 store.py 维护。
+"""
+import json
+import os
+import re
+import unicodedata
+
+from venues import load_matcher
+
+GROUPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "groups.json")
+# 团体字段为字符串时的分隔符
+GROUP_SEPARATORS = re.compile(r"[/／、,，;；|\n]+")
+GROUP_SUFFIX = re.compile(r"[_\-\s]*(official|offical|officail|info|公式)$", re.I)
+GROUP_NOTE = re.compile(r"\s*[（(][^（()）]*[)）]$")
+KEY_PUNCTUATION = re.compile(r"[\s._\-·・]+")
+
+
+def group_key(name: str) -> str:
+    """比较用的 key, 写法上的差异 (大小写、全半角、分隔符) 不影响结果"""
+    return KEY_PUNCTUATION.sub("", unicodedata.normalize("NFKC", name).casefold())
+
+
+def clean_group(name: str) -> str:
+    """去掉 @、官方号后缀与括号注释, 得到展示用的团体名"""
+    name = name.strip().lstrip("@").strip()
+    while True:
+        cleaned = GROUP_NOTE.sub("", GROUP_SUFFIX.sub("", name)).strip().strip("_-").strip()
+        if cleaned == name:
+            return name
+        name = cleaned
+
+
+class Normalizer:
+    """按别名表把团体、场地统一为规范名称"""
+
+    def __init__(self, groups=(), ignore=(), venue_matcher=None, version=None):
+        self.version = version
+        self.venue_matcher = venue_matcher
+        self.ignore = {group_key(word) for word in ignore}
+        self.aliases = {}
+        for group in groups:
+            for alias in [group["name"], *group.get("aliases", [])]:
+                self.aliases[group_key(alias)] = group["name"]
+
+    def groups(self, raw) -> list:
+        """把 groups 字段拆成 [(key, 规范名称), ...], 按出现顺序去重"""
+        if isinstance(raw, str):
+            raw = GROUP_SEPARATORS.split(raw)
+        found = {}
+        for item in raw or []:
+            if not isinstance(item, str):
+                continue
+            name = clean_group(item)
+            key = group_key(name)
+            if not key or key in self.ignore:
+                continue
+            name = self.aliases.get(key, name)
+            key = group_key(name)
+            found.setdefault(key, name)
+        return list(found.items())
+
+    def venues(self, location: str) -> list:
+        """live_location 中出现的场地规范名称, 按出现顺序去重; 只有城市、区名时为空"""
+        if not location or self.venue_matcher is None:
+            return []
+        matches = self.venue_matcher.find(str(location))
+        return list(dict.fromkeys(m["venue"] for m in matches if m["kind"] == "venue"))
+
+
+def load_normalizer(path=GROUPS_FILE) -> Normalizer:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    matcher = load_matcher()
+    version = f"groups:{data.get('version')}/venues:{matcher.version}"
+    return Normalizer(data.get("groups", []), data.get("ignore", []), matcher, version)
@@ -1,23 +1,243 @@
 import logging
 import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import cached_property
 
 from .. import datetime_util
 from ..weibo import Weibo
-from .comment_parser import CommentParser
-from .mblog_picAll_parser import MblogPicAllParser
+from . import metrics
 from .parser import Parser
-from .util import handle_garbled, handle_html, to_video_download_url
+from .util import (handle_garbled, handle_html, load_checkpoint,
+                   save_checkpoint, to_video_download_url)
 
 logger = logging.getLogger('spider.page_parser')
 
+# 后台预取的页数, 0 为不预取 (crawl.py --prefetch)。第 N 页解析完、确认还要
+# 继续翻页 (没有遇到断点、since_date 且不是最后一页) 时预取第 N+1 页起的
+# PREFETCH_PAGES 页; N+1 页一定会请求, 再往后的页在 N+1 页遇到停止条件时
+# 会白白请求。Spider 的 random_wait_seconds 等待用 polite_sleep 代替, 等待
+# 前先取消尚未开始的预取并等进行中的请求结束, 等待期间不会发出请求。
+PREFETCH_PAGES = 0
+# 每页的全文、组图、视频子请求并发数, 实际同时连接数还受 util.POOL_MAXSIZE 限制
+SUB_REQUEST_WORKERS = 4
+# 需要提取的 Weibo 字段, None 表示全部提取。未列出的字段保持 Weibo 的默认值,
+# 对应的 XPath 和子请求(全文、组图、视频)都会跳过。id 与 publish_time
+# 是翻页判断所必需的, 总会提取。只用到部分字段的调用方 (crawl.py、watch.py)
+# 自行设置为 generate_json.SPIDER_FIELDS。
+FIELDS = None
+COMMENT_URL = 'https://weibo.cn/comment/%s'
+PIC_ALL_URL = 'https://weibo.cn/mblog/picAll/%s?rl=1'
+
+
+def parse_long_weibo(selector):
+    """从微博详情页解析长原创微博, 同 CommentParser.get_long_weibo"""
+    info = selector.xpath("//div[@class='c']")[1]
+    wb_content = handle_garbled(info)
+    wb_time = info.xpath("//span[@class='ct']/text()")[0]
+    return wb_content[wb_content.find(':') + 1:wb_content.rfind(wb_time)]
+
+
+def parse_long_retweet(selector):
+    """从微博详情页解析长转发微博, 同 CommentParser.get_long_retweet"""
+    wb_content = parse_long_weibo(selector)
+    return wb_content[:wb_content.rfind(u'原文转发')]
+
+
+def parse_video_page_url(selector):
+    """从微博详情页解析视频页面链接, 同 CommentParser.get_video_page_url"""
+    # 来自微博视频号的格式与普通格式不一致，不加 span 层级
+    links = selector.xpath("body/div[@class='c' and @id][1]/div//a")
+    for a in links:
+        if 'm.weibo.cn/s/video/show?object_id=' in a.xpath('@href')[0]:
+            return a.xpath('@href')[0]
+    return ''
+
+
+def parse_picture_list(selector):
+    """从组图页解析全部原图链接, 同 MblogPicAllParser"""
+    preview_picture_list = selector.xpath('//img/@src')
+    return ','.join(
+        p.replace('/thumb180/', '/large/') for p in preview_picture_list)
+
+
+def child_elements(element, tag, cls=None):
+    """element 中标签为tag的直接子节点, 指定cls时等价于 tag[@class='cls']"""
+    return [
+        child for child in element
+        if child.tag == tag and (cls is None or child.get('class') == cls)
+    ]
+
+
+def element_texts(element):
+    """element 的直接文本节点, 等价于 text()"""
+    texts = [element.text] + [child.tail for child in element]
+    return [text for text in texts if text]
+
+
+class WeiboNode:
+    """一条微博(div.c)的解析上下文
+
+    构造时遍历一次子 div, 记下 id、各 span 与直接链接; 后代链接和
+    handle_garbled 清洗后的文本在第一次用到时计算并缓存, 各提取函数共用。
+    """
+    def __init__(self, info):
+        self.info = info
+        self.id = (info.get('id') or '')[2:]
+        self.divs = child_elements(info, 'div')
+        self.spans = {}  # 子 div 下直接 span, 按 class 分组
+        self.links = []  # 子 div 下直接 a, 即 div/a
+        for div in self.divs:
+            for child in div:
+                if child.tag == 'span':
+                    self.spans.setdefault(child.get('class'), []).append(child)
+                elif child.tag == 'a':
+                    self.links.append(child)
+
+    def span_list(self, cls):
+        return self.spans.get(cls, [])
+
+    @cached_property
+    def anchors(self):
+        """每个子 div 下的全部后代链接, 即按 div 分组的 div//a"""
+        return [list(div.iter('a')) for div in self.divs]
+
+    @cached_property
+    def anchor_texts(self):
+        """div//a/text()"""
+        return [text for group in self.anchors for a in group
+                for text in element_texts(a)]
+
+    @cached_property
+    def first_div_anchor_texts(self):
+        """div[1]//a/text()"""
+        if not self.anchors:
+            return []
+        return [text for a in self.anchors[0] for text in element_texts(a)]
+
+    @cached_property
+    def link_hrefs(self):
+        """div/a/@href"""
+        return [a.get('href') for a in self.links if a.get('href') is not None]
+
+    @cached_property
+    def text(self):
+        return handle_garbled(self.info)
+
+    @cached_property
+    def last_div_text(self):
+        return handle_garbled(self.divs[-1])
+
+    @cached_property
+    def ct_text(self):
+        """发布时间与发布工具所在的 span.ct"""
+        return handle_garbled(self.span_list('ct')[0])
+
+    @cached_property
+    def has_images(self):
+        return any(img.get('src') is not None for img in self.info.iter('img'))
+
+    @cached_property
+    def is_pinned(self):
+        for span in self.info.iter('span'):
+            texts = element_texts(span) if span.get('class') == 'kt' else []
+            if texts:
+                return texts[0] == u'置顶'
+        return False
+
+
+def commit_checkpoint(user_uri, weibos):
+    """把已写出的微博记入断点, 下次抓取遇到它们即停止翻页
+
+    PageParser 只读取断点, 不在解析时写入: 微博要等 Spider 的 writer 写出
+    (或 watch.py 入库) 之后才算处理过, 否则中途出错时这些微博下次不会再抓。
+    由调用方在写出成功后调用。
+    """
+    if not weibos:
+        return
+    try:
+        checkpoint = load_checkpoint(user_uri)
+        new_ids = [w.id for w in weibos if w.id not in checkpoint['seen_ids']]
+        checkpoint['seen_ids'] = new_ids + checkpoint['seen_ids']
+        newest = max(weibos, key=lambda w: w.publish_time)
+        if newest.publish_time > checkpoint['newest_time']:
+            checkpoint['newest_id'] = newest.id
+            checkpoint['newest_time'] = newest.publish_time
+        save_checkpoint(user_uri, checkpoint)
+    except Exception as e:
+        logger.exception(e)
+
+
+class PagePrefetcher:
+    """后台抓取并解析后续页面, 按url交给对应页的 PageParser"""
+    def __init__(self):
+        self.executor = None
+        self.futures = {}
+        self.user_uri = None
+        self.lock = threading.Lock()
+
+    def schedule(self, cookie, user_uri, urls):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            if user_uri != self.user_uri:
+                self._cancel()
+                self.user_uri = user_uri
+            for url in urls:
+                if url not in self.futures:
+                    self.futures[url] = self.executor.submit(
+                        handle_html, cookie, url)
+
+    def get(self, cookie, user_uri, url):
+        """取预取结果, 没有预取过则直接请求"""
+        with self.lock:
+            future = (self.futures.pop(url, None)
+                      if user_uri == self.user_uri else None)
+        if future is not None and not future.cancelled():
+            return future.result()
+        return handle_html(cookie, url)
+
+    def cancel(self):
+        with self.lock:
+            self._cancel()
+
+    def pause(self):
+        """取消尚未开始的预取, 并等进行中的请求结束; 已取到的页面保留"""
+        with self.lock:
+            running = []
+            for url, future in list(self.futures.items()):
+                if future.cancel():
+                    del self.futures[url]
+                else:
+                    running.append(future)
+        for future in running:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def _cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+
+def polite_sleep(seconds):
+    """代替 weibo_spider.spider 中的 sleep: 等待期间没有预取请求, 间隔从最后一个请求结束时算起"""
+    PageParser.prefetcher.pause()
+    time.sleep(seconds)
+
 
 class PageParser(Parser):
     empty_count = 0
+    prefetcher = PagePrefetcher()
 
-    def __init__(self, cookie, user_config, page, filter):
+    def __init__(self, cookie, user_config, page, filter, fields=None):
         self.cookie = cookie
+        self.fields = FIELDS if fields is None else fields
         if hasattr(PageParser,
                    'user_uri') and self.user_uri != user_config['user_uri']:
             PageParser.empty_count = 0
@@ -25,27 +245,23 @@ class PageParser(Parser):
         self.since_date = user_config['since_date']
         self.end_date = user_config['end_date']
         self.page = page
-        self.url = 'https://weibo.cn/%s?page=%d' % (self.user_uri, page)
-        self.url = "https://weibo.cn/%s/profile?page=%d" % (self.user_uri,
-                                                            page)
-        if self.end_date != 'now':
-            since_date = self.since_date.split(' ')[0].split('-')
-            end_date = self.end_date.split(' ')[0].split('-')
-            for date in [since_date, end_date]:
-                for i in [1, 2]:
-                    if len(date[i]) == 1:
-                        date[i] = '0' + date[i]
-            starttime = ''.join(since_date)
-            endtime = ''.join(end_date)
-            self.url = 'https://weibo.cn/%s/profile?starttime=%s&endtime=%s&advancedfilter=1&page=%d' % (
-                self.user_uri, starttime, endtime, page)
+        self.url = self.get_page_url(page)
+        self.checkpoint = load_checkpoint(self.user_uri)
+        self.sub_requests = []
         self.selector = ''
         self.to_continue = True
         is_exist = ''
         for i in range(3):
-            self.selector = handle_html(self.cookie, self.url)
+            if i == 0:
+                self.selector = PageParser.prefetcher.get(
+                    self.cookie, self.user_uri, self.url)
+            else:
+                self.selector = handle_html(self.cookie, self.url)
+            if self.selector is None:
+                # 网络错误已在 fetch 中按退避策略重试过, 不再重复请求
+                break
             info = self.selector.xpath("//div[@class='c']")
-            is_exist = info[0].xpath("div/span[@class='ctt']")
+            is_exist = info[0].xpath("div/span[@class='ctt']") if info else ''
             if is_exist:
                 PageParser.empty_count = 0
                 break
@@ -56,127 +272,227 @@ class PageParser(Parser):
             PageParser.empty_count = 0
         self.filter = filter
 
+    def get_page_url(self, page):
+        """获取第page页的url"""
+        url = "https://weibo.cn/%s/profile?page=%d" % (self.user_uri, page)
+        if self.end_date != 'now':
+            since_date = self.since_date.split(' ')[0].split('-')
+            end_date = self.end_date.split(' ')[0].split('-')
+            for date in [since_date, end_date]:
+                for i in [1, 2]:
+                    if len(date[i]) == 1:
+                        date[i] = '0' + date[i]
+            starttime = ''.join(since_date)
+            endtime = ''.join(end_date)
+            url = 'https://weibo.cn/%s/profile?starttime=%s&endtime=%s&advancedfilter=1&page=%d' % (
+                self.user_uri, starttime, endtime, page)
+        return url
+
+    def prefetch_next_pages(self):
+        """在后台预取后面 PREFETCH_PAGES 页, 不超过总页数"""
+        if PREFETCH_PAGES <= 0 or self.selector is None:
+            return
+        page_num = self.selector.xpath("//input[@name='mp']/@value")
+        page_num = int(page_num[0]) if page_num else self.page
+        last = min(self.page + PREFETCH_PAGES, page_num)
+        if self.page < last:
+            PageParser.prefetcher.schedule(self.cookie, self.user_uri, [
+                self.get_page_url(page)
+                for page in range(self.page + 1, last + 1)
+            ])
+
     def get_one_page(self, weibo_id_list):
         """获取第page页的全部微博"""
+        with metrics.timer('parse.page'):
+            result = self.parse_one_page(weibo_id_list)
+        metrics.count('parse.pages')
+        if result and result[2]:
+            # 本页没有遇到停止条件, 下一页一定会请求, 可以提前取
+            self.prefetch_next_pages()
+        else:
+            PageParser.prefetcher.cancel()
+        if result:
+            metrics.observe('parse.weibos_per_page', len(result[0]))
+            with metrics.timer('parse.sub_requests'):
+                self.resolve_sub_requests(result[0])
+            for weibo in result[0]:
+                logger.info(weibo)
+                logger.info('-' * 100)
+        return result
+
+    def add_sub_request(self, weibo_id, field, url, resolver):
+        """登记一个子请求: 抓取url(可为None)后由resolver算出weibo_id对应微博的field值"""
+        self.sub_requests.append((weibo_id, field, url, resolver))
+
+    def resolve_sub_requests(self, weibos):
+        """并发完成本页微博的全文、组图、视频子请求, 并写回对应字段
+
+        同一url只请求一次, 例如长微博的全文与视频链接共用一次详情页请求;
+        已被过滤掉的微博的子请求直接丢弃。
+        """
+        wanted = {weibo.id: weibo for weibo in weibos}
+        sub_requests = [r for r in self.sub_requests if r[0] in wanted]
+        self.sub_requests = []
+        if not sub_requests:
+            return
+        urls = list({r[2] for r in sub_requests if r[2]})
+        with ThreadPoolExecutor(max_workers=SUB_REQUEST_WORKERS) as executor:
+            selectors = dict(
+                zip(urls,
+                    executor.map(lambda url: handle_html(self.cookie, url),
+                                 urls)))
+            values = executor.map(
+                lambda r: self.run_resolver(r, selectors.get(r[2])),
+                sub_requests)
+            for (weibo_id, field, _, _), value in zip(sub_requests, values):
+                if value:
+                    setattr(wanted[weibo_id], field, value)
+
+    def run_resolver(self, sub_request, selector):
+        weibo_id, field, url, resolver = sub_request
+        if url and selector is None:
+            return None
+        try:
+            return resolver(selector)
+        except Exception as e:
+            logger.exception(e)
+
+    def parse_one_page(self, weibo_id_list):
+        """解析第page页, 返回(微博列表, 已获取的微博id, 是否继续翻页)"""
         try:
             idx_dio = 0
+            if self.selector is None:
+                return [], weibo_id_list, self.to_continue
             info = self.selector.xpath("//div[@class='c']")
-            is_exist = info[0].xpath("div/span[@class='ctt']")
+            is_exist = info[0].xpath("div/span[@class='ctt']") if info else ''
             weibos = []
             if is_exist:
                 since_date = datetime_util.str_to_time(self.since_date)
+                seen_ids = set(self.checkpoint['seen_ids'])
                 for i in range(0, len(info) - 1):
-                    weibo = self.get_one_weibo(info[i])
-                    if weibo:
-                        if weibo.id in weibo_id_list:
+                    node = WeiboNode(info[i])
+                    # 先取id判断是否已处理, 避免为旧微博解析全文、图片等子请求
+                    if node.id in weibo_id_list:
+                        continue
+                    if node.id in seen_ids:
+                        if self.is_pinned_weibo(node):
                             continue
+                        logger.info(u'微博%s已在之前的抓取中处理过，停止翻页', node.id)
+                        return weibos, weibo_id_list, False
+                    weibo = self.get_one_weibo(node)
+                    if weibo:
                         publish_time = datetime_util.str_to_time(
                             weibo.publish_time)
 
                         if publish_time < since_date:
                             idx_dio += 1
-                            if self.is_pinned_weibo(info[i]):
+                            if self.is_pinned_weibo(node):
                                 continue
                             else:
                                 if idx_dio == 2:
                                     continue
                                 else:
                                     return weibos, weibo_id_list, False
-                        logger.info(weibo)
-                        logger.info('-' * 100)
                         weibos.append(weibo)
                         weibo_id_list.append(weibo.id)
             return weibos, weibo_id_list, self.to_continue
         except Exception as e:
             logger.exception(e)
 
-    def is_original(self, info):
+    def is_original(self, node):
         """判断微博是否为原创微博"""
-        is_original = info.xpath("div/span[@class='cmt']")
-        if len(is_original) > 3:
+        if len(node.span_list('cmt')) > 3:
             return False
         else:
             return True
 
-    def get_original_weibo(self, info, weibo_id):
+    def get_original_weibo(self, node):
         """获取原创微博"""
         try:
-            weibo_content = handle_garbled(info)
+            weibo_content = node.text
             weibo_content = weibo_content[:weibo_content.rfind(u'赞')]
-            a_text = info.xpath('div//a/text()')
-            if u'全文' in a_text:
-                wb_content = CommentParser(self.cookie,
-                                           weibo_id).get_long_weibo()
-                if wb_content:
-                    weibo_content = wb_content
+            if u'全文' in node.anchor_texts:
+                self.add_sub_request(node.id, 'content',
+                                     COMMENT_URL % node.id, parse_long_weibo)
             return weibo_content
         except Exception as e:
             logger.exception(e)
 
-    def get_retweet(self, info, weibo_id):
+    def get_retweet(self, node):
         """获取转发微博"""
         try:
-            weibo_content = handle_garbled(info)
+            weibo_content = node.text
             weibo_content = weibo_content[weibo_content.find(':') +
                                           1:weibo_content.rfind(u'赞')]
             weibo_content = weibo_content[:weibo_content.rfind(u'赞')]
-            a_text = info.xpath('div//a/text()')
-            if u'全文' in a_text:
-                wb_content = CommentParser(self.cookie,
-                                           weibo_id).get_long_retweet()
-                if wb_content:
-                    weibo_content = wb_content
-            retweet_reason = handle_garbled(info.xpath('div')[-1])
+            retweet_reason = node.last_div_text
             retweet_reason = retweet_reason[:retweet_reason.rindex(u'赞')]
-            original_user = info.xpath("div/span[@class='cmt']/a/text()")
+            original_user = [
+                text for span in node.span_list('cmt')
+                for a in child_elements(span, 'a') for text in element_texts(a)
+            ]
             if original_user:
                 original_user = original_user[0]
-                weibo_content = (retweet_reason + '\n' + u'原始用户: ' +
-                                 original_user + '\n' + u'转发内容: ' +
-                                 weibo_content)
+                prefix = (retweet_reason + '\n' + u'原始用户: ' +
+                          original_user + '\n' + u'转发内容: ')
             else:
-                weibo_content = (retweet_reason + '\n' + u'转发内容: ' +
-                                 weibo_content)
-            return weibo_content
+                prefix = retweet_reason + '\n' + u'转发内容: '
+            if u'全文' in node.anchor_texts:
+
+                def resolve_long_retweet(selector):
+                    wb_content = parse_long_retweet(selector)
+                    return prefix + wb_content if wb_content else None
+
+                self.add_sub_request(node.id, 'content',
+                                     COMMENT_URL % node.id,
+                                     resolve_long_retweet)
+            return prefix + weibo_content
         except Exception as e:
             logger.exception(e)
 
-    def get_weibo_content(self, info, is_original):
+    def get_weibo_content(self, node, is_original):
         """获取微博内容"""
         try:
-            weibo_id = info.xpath('@id')[0][2:]
             if is_original:
-                weibo_content = self.get_original_weibo(info, weibo_id)
+                weibo_content = self.get_original_weibo(node)
             else:
-                weibo_content = self.get_retweet(info, weibo_id)
+                weibo_content = self.get_retweet(node)
             return weibo_content
         except Exception as e:
             logger.exception(e)
 
-    def get_article_url(self, info):
+    def get_article_url(self, node):
         """获取微博头条文章的url"""
         article_url = ''
-        text = handle_garbled(info)
-        if text.startswith(u'发布了头条文章'):
-            url = info.xpath('.//a/@href')
+        if node.text.startswith(u'发布了头条文章'):
+            url = [
+                a.get('href') for a in node.info.iter('a')
+                if a.get('href') is not None
+            ]
             if url and url[0].startswith('https://weibo.cn/sinaurl'):
                 article_url = url[0]
         return article_url
 
-    def get_publish_place(self, info):
+    def get_publish_place(self, node):
         """获取微博发布位置"""
         try:
-            div_first = info.xpath('div')[0]
-            a_list = div_first.xpath('a')
+            div_first = node.divs[0]
             publish_place = u'无'
-            for a in a_list:
-                if ('place.weibo.com' in a.xpath('@href')[0]
-                        and a.xpath('text()')[0] == u'显示地图'):
-                    weibo_a = div_first.xpath("span[@class='ctt']/a")
+            for a in child_elements(div_first, 'a'):
+                texts = element_texts(a)
+                if ('place.weibo.com' in a.get('href')
+                        and texts and texts[0] == u'显示地图'):
+                    weibo_a = [
+                        link for span in child_elements(div_first, 'span', 'ctt')
+                        for link in child_elements(span, 'a')
+                    ]
                     if len(weibo_a) >= 1:
                         publish_place = weibo_a[-1]
-                        if (u'视频' == div_first.xpath(
-                                "span[@class='ctt']/a/text()")[-1][-2:]):
+                        link_texts = [
+                            text for link in weibo_a
+                            for text in element_texts(link)
+                        ]
+                        if (u'视频' == link_texts[-1][-2:]):
                             if len(weibo_a) >= 2:
                                 publish_place = weibo_a[-2]
                             else:
@@ -187,12 +503,10 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_publish_time(self, info):
+    def get_publish_time(self, node):
         """获取微博发布时间"""
         try:
-            str_time = info.xpath("div/span[@class='ct']")
-            str_time = handle_garbled(str_time[0])
-            publish_time = str_time.split(u'来自')[0]
+            publish_time = node.ct_text.split(u'来自')[0]
             if u'刚刚' in publish_time:
                 publish_time = datetime.now().strftime('%Y-%m-%d %H:%M')
             elif u'分钟' in publish_time:
@@ -218,11 +532,10 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_publish_tool(self, info):
+    def get_publish_tool(self, node):
         """获取微博发布工具"""
         try:
-            str_time = info.xpath("div/span[@class='ct']")
-            str_time = handle_garbled(str_time[0])
+            str_time = node.ct_text
             if len(str_time.split(u'来自')) > 1:
                 publish_tool = str_time.split(u'来自')[1]
             else:
@@ -231,13 +544,12 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_weibo_footer(self, info):
+    def get_weibo_footer(self, node):
         """获取微博点赞数、转发数、评论数"""
         try:
             footer = {}
             pattern = r'\d+'
-            str_footer = info.xpath('div')[-1]
-            str_footer = handle_garbled(str_footer)
+            str_footer = node.last_div_text
             str_footer = str_footer[str_footer.rfind(u'赞'):]
             weibo_footer = re.findall(pattern, str_footer, re.M)
 
@@ -253,22 +565,29 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_picture_urls(self, info, is_original):
+    def get_picture_urls(self, node, is_original):
         """获取微博原始图片url"""
         try:
-            weibo_id = info.xpath('@id')[0][2:]
             picture_urls = {}
             if is_original:
-                original_pictures = self.extract_picture_urls(info, weibo_id)
+                original_pictures = self.extract_picture_urls(
+                    node, node.id, 'original_pictures')
                 picture_urls['original_pictures'] = original_pictures
                 if not self.filter:
                     picture_urls['retweet_pictures'] = u'无'
             else:
-                retweet_url = info.xpath("div/a[@class='cc']/@href")[0]
+                retweet_url = [
+                    a.get('href') for a in node.links
+                    if a.get('class') == 'cc' and a.get('href') is not None
+                ][0]
                 retweet_id = retweet_url.split('/')[-1].split('?')[0]
-                retweet_pictures = self.extract_picture_urls(info, retweet_id)
+                retweet_pictures = self.extract_picture_urls(
+                    node, retweet_id, 'retweet_pictures')
                 picture_urls['retweet_pictures'] = retweet_pictures
-                a_list = info.xpath('div[last()]/a/@href')
+                a_list = [
+                    a.get('href') for a in child_elements(node.divs[-1], 'a')
+                    if a.get('href') is not None
+                ]
                 original_picture = u'无'
                 for a in a_list:
                     if a.endswith(('.gif', '.jpeg', '.jpg', '.png')):
@@ -279,66 +598,79 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_video_url(self, info):
+    def get_video_url(self, node):
         """获取微博视频url"""
         video_url = u'无'
 
-        weibo_id = info.xpath('@id')[0][2:]
         try:
-            video_page_url = ''
-            a_text = info.xpath('./div[1]//a/text()')
-            if u'全文' in a_text:
-                video_page_url = CommentParser(self.cookie,
-                                               weibo_id).get_video_page_url()
+            if u'全文' in node.first_div_anchor_texts:
+
+                def resolve_video_url(selector):
+                    video_page_url = parse_video_page_url(selector)
+                    if video_page_url != '':
+                        return to_video_download_url(self.cookie,
+                                                     video_page_url)
+
+                self.add_sub_request(node.id, 'video_url',
+                                     COMMENT_URL % node.id, resolve_video_url)
             else:
                 # 来自微博视频号的格式与普通格式不一致，不加 span 层级
-                a_list = info.xpath('./div[1]//a')
+                a_list = node.anchors[0] if node.anchors else []
                 for a in a_list:
-                    if 'm.weibo.cn/s/video/show?object_id=' in a.xpath(
-                            '@href')[0]:
-                        video_page_url = a.xpath('@href')[0]
+                    if 'm.weibo.cn/s/video/show?object_id=' in a.get('href'):
+                        video_page_url = a.get('href')
+                        self.add_sub_request(
+                            node.id, 'video_url', None,
+                            lambda selector: to_video_download_url(
+                                self.cookie, video_page_url))
                         break
-
-            if video_page_url != '':
-                video_url = to_video_download_url(self.cookie, video_page_url)
         except Exception as e:
             logger.exception(e)
 
         return video_url
 
-    def is_pinned_weibo(self, info):
+    def is_pinned_weibo(self, node):
         """判断微博是否为置顶微博"""
-        kt = info.xpath(".//span[@class='kt']/text()")
-        if kt and kt[0] == u'置顶':
-            return True
-        else:
-            return False
+        return node.is_pinned
+
+    def wants(self, *fields):
+        """是否需要提取fields中的任一字段"""
+        return self.fields is None or any(f in self.fields for f in fields)
 
-    def get_one_weibo(self, info):
+    def get_one_weibo(self, node):
         """获取一条微博的全部信息"""
         try:
             weibo = Weibo()
-            is_original = self.is_original(info)
+            is_original = self.is_original(node)
             weibo.original = is_original  # 是否原创微博
             if (not self.filter) or is_original:
-                weibo.id = info.xpath('@id')[0][2:]
-                weibo.content = self.get_weibo_content(info,
-                                                       is_original)  # 微博内容
-                weibo.article_url = self.get_article_url(info)  # 头条文章url
-                picture_urls = self.get_picture_urls(info, is_original)
-                weibo.original_pictures = picture_urls[
-                    'original_pictures']  # 原创图片url
-                if not self.filter:
-                    weibo.retweet_pictures = picture_urls[
-                        'retweet_pictures']  # 转发图片url
-                weibo.video_url = self.get_video_url(info)  # 微博视频url
-                weibo.publish_place = self.get_publish_place(info)  # 微博发布位置
-                weibo.publish_time = self.get_publish_time(info)  # 微博发布时间
-                weibo.publish_tool = self.get_publish_tool(info)  # 微博发布工具
-                footer = self.get_weibo_footer(info)
-                weibo.up_num = footer['up_num']  # 微博点赞数
-                weibo.retweet_num = footer['retweet_num']  # 转发数
-                weibo.comment_num = footer['comment_num']  # 评论数
+                weibo.id = node.id
+                if self.wants('content'):
+                    weibo.content = self.get_weibo_content(
+                        node, is_original)  # 微博内容
+                if self.wants('article_url'):
+                    weibo.article_url = self.get_article_url(node)  # 头条文章url
+                if self.wants('original_pictures', 'retweet_pictures'):
+                    picture_urls = self.get_picture_urls(node, is_original)
+                    weibo.original_pictures = picture_urls[
+                        'original_pictures']  # 原创图片url
+                    if not self.filter:
+                        weibo.retweet_pictures = picture_urls[
+                            'retweet_pictures']  # 转发图片url
+                if self.wants('video_url'):
+                    weibo.video_url = self.get_video_url(node)  # 微博视频url
+                if self.wants('publish_place'):
+                    weibo.publish_place = self.get_publish_place(
+                        node)  # 微博发布位置
+                weibo.publish_time = self.get_publish_time(node)  # 微博发布时间
+                if self.wants('publish_tool'):
+                    weibo.publish_tool = self.get_publish_tool(
+                        node)  # 微博发布工具
+                if self.wants('up_num', 'retweet_num', 'comment_num'):
+                    footer = self.get_weibo_footer(node)
+                    weibo.up_num = footer['up_num']  # 微博点赞数
+                    weibo.retweet_num = footer['retweet_num']  # 转发数
+                    weibo.comment_num = footer['comment_num']  # 评论数
             else:
                 weibo = None
                 logger.info(u'正在过滤转发微博')
@@ -346,33 +678,31 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def extract_picture_urls(self, info, weibo_id):
-        """提取微博原始图片url"""
+    def extract_picture_urls(self, node, weibo_id, field='original_pictures'):
+        """提取微博原始图片url, 组图需另行请求时登记为field字段的子请求"""
         try:
-            a_list = info.xpath('div/a/@href')
+            hrefs = ''.join(node.link_hrefs)
             first_pic = 'https://weibo.cn/mblog/pic/' + weibo_id
             all_pic = 'https://weibo.cn/mblog/picAll/' + weibo_id
             picture_urls = u'无'
-            if first_pic in ''.join(a_list):
-                if all_pic in ''.join(a_list):
-                    preview_picture_list = MblogPicAllParser(
-                        self.cookie, weibo_id).extract_preview_picture_list()
-                    picture_list = [
-                        p.replace('/thumb180/', '/large/')
-                        for p in preview_picture_list
-                    ]
-                    picture_urls = ','.join(picture_list)
+            if first_pic in hrefs:
+                if all_pic in hrefs:
+                    self.add_sub_request(node.id, field,
+                                         PIC_ALL_URL % weibo_id,
+                                         parse_picture_list)
                 else:
-                    if info.xpath('.//img/@src'):
-                        for link in info.xpath('div/a'):
-                            if len(link.xpath('@href')) > 0:
-                                if first_pic in link.xpath('@href')[0]:
-                                    if len(link.xpath('img/@src')) > 0:
-                                        preview_picture = link.xpath(
-                                            'img/@src')[0]
-                                        picture_urls = preview_picture.replace(
-                                            '/wap180/', '/large/')
-                                        break
+                    if node.has_images:
+                        for link in node.links:
+                            if first_pic in link.get('href', ''):
+                                img = [
+                                    i.get('src')
+                                    for i in child_elements(link, 'img')
+                                    if i.get('src') is not None
+                                ]
+                                if img:
+                                    picture_urls = img[0].replace(
+                                        '/wap180/', '/large/')
+                                    break
                     else:
                         logger.warning(
                             u'爬虫微博可能被设置成了"不显示图片"，请前往'
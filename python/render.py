@@ -1,83 +1,223 @@
+import hashlib
+import html
+import json
 import os
-from tinydb import TinyDB
+import string
 from datetime import datetime
 
+import metrics
+import search
+from store import DB_PATH, EventStore
+
 # 路径
-db_dir = 'database/tinydb'
 html_dir = 'database/html'
-os.makedirs(html_dir, exist_ok=True)
-
-today = datetime.today().date()
-summary_html = os.path.join(html_dir, f"recent_lives_{today.strftime('%Y-%m-%d')}.html")
-today_html = os.path.join(html_dir, "today.html")
-
-# 收集今天及之后的日期（保证排序）
-valid_dates = []
-
-for fname in os.listdir(db_dir):
-    if not fname.endswith(".json"):
-        continue
-
-    try:
-        file_date = datetime.strptime(fname.replace(".json", ""), "%Y-%m-%d").date()
-    except ValueError:
-        continue  # 跳过不是日期命名的文件
-
-    if file_date >= today:
-        valid_dates.append(file_date)
-
-# 排序
-valid_dates.sort()
-
-# 逐日生成模块化 HTML 文件
-for file_date in reversed(valid_dates):
-    db_path = os.path.join(db_dir, f"{file_date}.json")
-    db = TinyDB(db_path)
-
-    entries = db.all()
-    entries.sort(key=lambda e: e.get("live_date", ""))  # 按 live_date 排序
-
-    html_content = f"""
-<h2 style="color: pink;">{file_date} 的Live活动</h2>
-"""
-
-    for entry in entries:
-        groups = ', '.join(entry.get('groups', [])) if entry.get('groups') else ''
-        main_text = entry.get('main_text', '').replace('\n', '<br>')
-        url = entry.get('url', '')
-        url_html = f'<a href="{url}" target="_blank">🔗 原文链接</a>' if url else ''
-
-        html_content += f"""
+# 渲染清单: 记录每个日期上次渲染时全部记录的哈希, 输入没变的日期不再重新生成
+manifest_path = 'database/render_manifest.json'
+# 运行报告, 每次运行追加一行, 见 metrics.py
+metrics_path = 'database/metrics.jsonl'
+
+# 写 HTML 文件时的缓冲区大小
+WRITE_BUFFER = 1 << 16
+# 转义规则的版本, 与模板一起计入 TEMPLATE_HASH, 改动后全部日期重新生成
+ESCAPE_VERSION = 1
+
+
+def escape_text(value):
+    """转义为 HTML 文本"""
+    return html.escape(str(value), quote=False)
+
+
+def escape_multiline(value):
+    """转义为 HTML 文本, 换行保留为 <br>"""
+    return escape_text(value).replace('\n', '<br>')
+
+
+def escape_attr(value):
+    """转义为 HTML 属性值"""
+    return html.escape(str(value), quote=True)
+
+
+class Template:
+    """页面模板
+
+    构造时检查一次 {字段} 并为每个字段确定转义函数 (默认按 HTML 文本转义,
+    filters 中可为字段指定其他函数, None 表示已是 HTML 片段, 原样填入)。
+    render 先逐个字段转义, 再用 str.format 填入模板。
+    """
+
+    def __init__(self, source, filters=None):
+        self.source = source
+        filters = filters or {}
+        names = []
+        for _, name, spec, conversion in string.Formatter().parse(source):
+            if name is None:
+                continue
+            if spec or conversion or not name.isidentifier():
+                raise ValueError(f"模板字段只支持 {{name}}: {name}")
+            names.append(name)
+        unknown = set(filters) - set(names)
+        if unknown:
+            raise ValueError(f"模板中没有字段: {sorted(unknown)}")
+        self.fields = list(dict.fromkeys(names))
+        self.filters = {name: filters.get(name, escape_text) for name in self.fields}
+
+    def render(self, **values):
+        escaped = {}
+        for name, escape in self.filters.items():
+            escaped[name] = values[name] if escape is None else escape(values[name])
+        return self.source.format(**escaped)
+
+
+# 页面模板, 修改任何一个都会让全部日期重新生成
+DAY_TEMPLATE = Template("""
+<h2 style="color: pink;">{date} 的Live活动</h2>
+""")
+CARD_TEMPLATE = Template("""
 <div class="card">
-  <h2>{entry.get('live_date', '')} - {entry.get('live_location', '')}</h2>
+  <h2>{live_date} - {live_location}</h2>
   <p class="groups">团体: {groups}</p>
   <p>{main_text}</p>
   <p>{url_html}</p>
 </div>
-"""
-
-    # 写入独立日期文件
-    out_path = os.path.join(html_dir, f"{file_date}.html")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
-    print(f"生成模块化文件: {out_path}")
+""", filters={"main_text": escape_multiline, "url_html": None})
+LINK_TEMPLATE = Template('<a href="{url}" target="_blank">🔗 原文链接</a>', filters={"url": escape_attr})
+SUMMARY_TEMPLATE = Template("""
+<h1>最近的Live活动</h1>
+""")
+INCLUDE_TEMPLATE = Template("""
+{{% include live/{date}.html %}}
+""")
+TEMPLATE_HASH = hashlib.sha256(
+    "\0".join(
+        [str(ESCAPE_VERSION)] + [t.source for t in (DAY_TEMPLATE, CARD_TEMPLATE, LINK_TEMPLATE,
+                                                    SUMMARY_TEMPLATE, INCLUDE_TEMPLATE)]
+    ).encode("utf-8")
+).hexdigest()[:16]
+
+
+def load_manifest():
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get("template") != TEMPLATE_HASH:
+        # 模板变了, 之前的记录全部作废
+        manifest = {"template": TEMPLATE_HASH}
+    manifest.setdefault("dates", {})
+    manifest.setdefault("summaries", {})
+    return manifest
+
+
+def save_manifest(manifest):
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def input_changed(manifest, key, digest, out_path):
+    """该日期的记录与上次渲染时相同且页面还在时返回 False"""
+    old = manifest["dates"].get(key)
+    return old is None or old.get("hash") != digest or not os.path.isfile(out_path)
+
+
+def render_card(entry):
+    groups = ', '.join(entry.get('groups', [])) if entry.get('groups') else ''
+    url = entry.get('url', '')
+    url_html = LINK_TEMPLATE.render(url=url) if url else ''
+    return CARD_TEMPLATE.render(
+        live_date=entry.get('live_date', ''),
+        live_location=entry.get('live_location', ''),
+        groups=groups,
+        main_text=entry.get('main_text', ''),
+        url_html=url_html,
+    )
+
+
+def write_date(f, file_date, entries):
+    """把一天的活动逐个卡片写入 f"""
+    f.write(DAY_TEMPLATE.render(date=file_date))
+    for entry in entries:
+        f.write(render_card(entry))
 
 
 # 生成总文件 (today.html 和 recent_lives_xxx.html)
 def make_summary_html(output_path, dates):
-    summary = f"""
-<h1>最近的Live活动</h1>
-"""
-
-    for d in dates:
-        summary += f"""
-{{% include live/{d}.html %}}
-"""
-
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write(summary)
+        f.write(SUMMARY_TEMPLATE.render())
+        for d in dates:
+            f.write(INCLUDE_TEMPLATE.render(date=d))
     print(f"生成总汇总文件: {output_path}")
 
 
-make_summary_html(summary_html, valid_dates)
-make_summary_html(today_html, valid_dates)
+def render(store):
+    """按 store 中今天及之后的演出生成页面, 只重建记录有变化的日期, 返回 (重建数, 跳过数)"""
+    os.makedirs(html_dir, exist_ok=True)
+
+    today = datetime.today().date()
+    summary_html = os.path.join(html_dir, f"recent_lives_{today.strftime('%Y-%m-%d')}.html")
+    today_html = os.path.join(html_dir, "today.html")
+
+    # 收集今天及之后的日期（保证排序）
+    valid_dates = store.days(since=str(today))
+    manifest = load_manifest()
+    rebuilt = skipped = 0
+
+    # 逐日生成模块化 HTML 文件, 只重建输入有变化的日期
+    for file_date in reversed(valid_dates):
+        out_path = os.path.join(html_dir, f"{file_date}.html")
+        digest = store.day_digest(file_date)
+        if not input_changed(manifest, file_date, digest, out_path):
+            skipped += 1
+            continue
+
+        # 写入独立日期文件
+        with metrics.timer("render.date"):
+            entries = store.events_on(file_date)
+            with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+                write_date(f, file_date, entries)
+        metrics.observe("render.cards_per_date", len(entries))
+        manifest["dates"][file_date] = {"hash": digest}
+        rebuilt += 1
+        print(f"生成模块化文件: {out_path}")
+
+    # 已经过去的日期不会再渲染, 从清单中移除
+    keys = set(valid_dates)
+    manifest["dates"] = {k: v for k, v in manifest["dates"].items() if k in keys}
+
+    # 日期集合没变且文件还在时不重写汇总文件
+    date_list = list(valid_dates)
+    for path in (summary_html, today_html):
+        if manifest["summaries"].get(os.path.basename(path)) == date_list and os.path.isfile(path):
+            continue
+        with metrics.timer("render.summary"):
+            make_summary_html(path, valid_dates)
+        manifest["summaries"][os.path.basename(path)] = date_list
+    manifest["summaries"] = {
+        k: v for k, v in manifest["summaries"].items() if k in (os.path.basename(summary_html), "today.html")
+    }
+
+    # 搜索索引包含过去的演出, 按月份分片, 只重写记录有变化的月份
+    with metrics.timer("render.search"):
+        shards = search.build_index(store, html_dir, manifest)
+    metrics.count("render.search_shards_rebuilt", shards)
+
+    save_manifest(manifest)
+    metrics.count("render.dates_rebuilt", rebuilt)
+    metrics.count("render.dates_skipped", skipped)
+    return rebuilt, skipped
+
+
+def main(db_path=DB_PATH):
+    metrics.reset()
+    store = EventStore(db_path)
+    try:
+        rebuilt, skipped = render(store)
+    finally:
+        store.close()
+    print(f"渲染完成: 重新生成 {rebuilt} 个日期, 跳过 {skipped} 个未变化的日期")
+    metrics.write_report("render", metrics_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""LLM 回答的容错解析与字段校验
+
+LLM 的回答并不总是合法的 JSON: 前后带说明文字、一次给出多个对象、用单引号或
+中文引号、冒号逗号写成全角、正文里有未转义的换行或引号、末尾多一个逗号。
+原来 json.loads 失败时整段回答被放进 main_text, live_date 为空, 记录进了
+special, 只能重新请求。这里先在本地修复:
+
+- loads_objects 逐字符扫描, 只在大括号/中括号内部把全角标点、各种引号、
+  True/None 和没加引号的值改写为标准 JSON, 括号外的文字原样跳过, 然后取出
+  其中所有的对象 (数组中的对象展开);
+- validate 按 EVENT_FIELDS 校验并规范化: 多个对象按提示词的约定合并, 日期
+  统一为 %Y-%m-%d (没写年份时按发布时间推断, 同 rules.py), groups 转为列表。
+
+返回缺失的字段: 回答中没有这个键, 或者值无法规范化 (例如日期写成 "周六")。
+LLM 明确留空的字段视为原文没有, 不算缺失。llm.py 只就缺失的字段用一个很短的
+提示词补问一次。
+"""
+import json
+import re
+from datetime import date, datetime
+from typing import TypedDict
+
+from normalize import GROUP_SEPARATORS
+from rules import find_dates
+
+
+class Event(TypedDict):
+    live_date: str
+    live_location: str
+    groups: list
+    main_text: str
+
+
+EVENT_FIELDS = tuple(Event.__annotations__)
+# 缺失时值得补问的字段, main_text 缺失时用微博原文
+REQUIRED_FIELDS = ("live_date", "live_location", "groups")
+# LLM 有时不按要求的键名输出
+FIELD_ALIASES = {
+    "date": "live_date", "live日期": "live_date", "日期": "live_date", "演出日期": "live_date",
+    "location": "live_location", "live地点": "live_location", "地点": "live_location", "场地": "live_location",
+    "group": "groups", "团体": "groups", "团体全员": "groups", "出演团体": "groups",
+    "text": "main_text", "content": "main_text", "正文": "main_text",
+}
+
+# 括号内部的全角结构符号
+FULL_WIDTH = {"｛": "{", "｝": "}", "［": "[", "］": "]", "：": ":", "，": ","}
+OPENERS = {"{": "}", "[": "]", "｛": "}", "［": "]"}
+QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’", "「": "」"}
+# 开闭引号混用很常见 (“key" 或 "key”), 双引号类的开引号都接受这些闭引号
+DOUBLE_CLOSERS = frozenset('"”」')
+# 字符串结束引号后面应当紧跟这些字符之一, 否则视为正文中的引号
+AFTER_STRING = set(",:}]，：｝］\n")
+BARE_END = set(",:}]，：｝］\n\r") | set(QUOTES)
+KEYWORDS = {"true": "true", "false": "false", "null": "null", "none": "null"}
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def read_string(text: str, i: int, closer: str):
+    """从开引号之后的 i 读到结束引号, 返回 (字符串值, 结束引号之后的位置)"""
+    chars = []
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n:
+            nxt = text[i + 1]
+            if nxt == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[i + 2:i + 6]):
+                chars.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                chars.append(ESCAPES.get(nxt, nxt))
+                i += 2
+            continue
+        if ch == closer or closer in DOUBLE_CLOSERS and ch in DOUBLE_CLOSERS:
+            j = i + 1
+            while j < n and text[j] in " \t\r":
+                j += 1
+            if j >= n or text[j] in AFTER_STRING:
+                return "".join(chars), i + 1
+        chars.append(ch)
+        i += 1
+    return "".join(chars), n
+
+
+def to_json(text: str) -> str:
+    """把括号内部改写为标准 JSON, 括号外的说明文字原样保留"""
+    out = []
+    stack = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if not stack:
+            if ch in OPENERS:
+                stack.append(OPENERS[ch])
+                out.append(FULL_WIDTH.get(ch, ch))
+            else:
+                out.append(ch)
+            i += 1
+        elif ch in QUOTES:
+            value, i = read_string(text, i + 1, QUOTES[ch])
+            out.append(json.dumps(value, ensure_ascii=False))
+        elif ch in OPENERS:
+            stack.append(OPENERS[ch])
+            out.append(FULL_WIDTH.get(ch, ch))
+            i += 1
+        elif FULL_WIDTH.get(ch, ch) in "}]":
+            # 去掉末尾多余的逗号
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            out.append(stack.pop())
+            i += 1
+        elif FULL_WIDTH.get(ch, ch) in ",:" or ch.isspace():
+            out.append(FULL_WIDTH.get(ch, ch))
+            i += 1
+        else:
+            # 没加引号的键或值, 读到下一个结构符号为止; 值中的冒号 (如 18:00) 不算
+            last = next((t for t in reversed(out) if not t.isspace()), "")
+            ends = BARE_END if last in ("{", ",") else BARE_END - {":", "："}
+            j = i
+            while j < n and text[j] not in ends and FULL_WIDTH.get(text[j], text[j]) not in "}]":
+                j += 1
+            token = text[i:j].strip()
+            if NUMBER.fullmatch(token):
+                out.append(token)
+            else:
+                out.append(KEYWORDS.get(token.lower()) or json.dumps(token, ensure_ascii=False))
+            i = j
+    # 回答被截断时补齐括号
+    while stack:
+        while out and (out[-1].isspace() or out[-1] == ","):
+            out.pop()
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def loads_objects(text: str):
+    """取出回答中的全部 JSON 对象, 返回 (对象列表, 是否经过修复)"""
+    try:
+        value = json.loads(text)
+        repaired = False
+    except ValueError:
+        value = None
+        repaired = True
+    if value is None:
+        text = to_json(text)
+        decoder = json.JSONDecoder(strict=False)
+        values, i = [], 0
+        while True:
+            starts = [pos for pos in (text.find("{", i), text.find("[", i)) if pos != -1]
+            if not starts:
+                break
+            i = min(starts)
+            try:
+                item, i = decoder.raw_decode(text, i)
+            except ValueError:
+                i += 1
+                continue
+            values.append(item)
+        value = values
+    objects = []
+    for item in value if isinstance(value, list) else [value]:
+        if isinstance(item, dict):
+            objects.append(item)
+        elif isinstance(item, list):
+            objects += [x for x in item if isinstance(x, dict)]
+    return objects, repaired
+
+
+def as_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return " / ".join(as_text(v) for v in value if as_text(v))
+    return str(value).strip()
+
+
+def as_groups(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [g.strip() for g in GROUP_SEPARATORS.split(value) if g.strip()]
+    if isinstance(value, (list, tuple)):
+        return [g for v in value for g in as_groups(v)]
+    return as_groups(str(value))
+
+
+def normalize_date(value, published: date):
+    """统一为 %Y-%m-%d, 无法识别时返回 None, 空值返回 "" """
+    text = as_text(value)
+    if not text:
+        return ""
+    try:
+        return datetime.strptime(text[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        pass
+    found = find_dates(text.replace("-", "/") if text.count("-") == 1 else text, published)
+    return min(found).strftime("%Y-%m-%d") if found else None
+
+
+def parse_published(publish_time: str) -> date:
+    try:
+        return datetime.strptime(str(publish_time)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return date.today()
+
+
+def canonical(obj: dict) -> dict:
+    """键名统一为 EVENT_FIELDS, 其他键原样保留"""
+    result = {}
+    for key, value in obj.items():
+        key = FIELD_ALIASES.get(str(key).strip().lower(), str(key).strip())
+        result.setdefault(key, value)
+    return result
+
+
+def validate(objects: list, publish_time: str = ""):
+    """把对象列表规范化为一个 Event, 返回 (Event, 缺失的字段)
+
+    多个对象时按提示词的约定合并: 日期取最早的, 地点合在一起, 团体取并集,
+    正文依次拼接。
+    """
+    published = parse_published(publish_time)
+    objects = [canonical(obj) for obj in objects] or [{}]
+    present = set().union(*objects)
+    dates, invalid = [], False
+    for obj in objects:
+        day = normalize_date(obj.get("live_date"), published)
+        invalid |= day is None
+        if day:
+            dates.append(day)
+    event = Event(
+        live_date=min(dates) if dates else "",
+        live_location=" / ".join(dict.fromkeys(as_text(o.get("live_location")) for o in objects
+                                               if as_text(o.get("live_location")))),
+        groups=list(dict.fromkeys(g for o in objects for g in as_groups(o.get("groups")))),
+        main_text="\n\n".join(as_text(o.get("main_text")) for o in objects if as_text(o.get("main_text"))),
+    )
+    missing = [f for f in REQUIRED_FIELDS if f not in present and not event[f]]
+    if invalid and not dates:
+        missing = ["live_date"] + [f for f in missing if f != "live_date"]
+    return event, missing
+
+
+def build_field_prompt(content: str, publish_time: str, fields) -> str:
+    """只补问缺失字段的短提示词"""
+    hints = {
+        "live_date": "live_date: live 日期, 格式 %Y-%m-%d, 没写年份时按 publish_time 推断",
+        "live_location": "live_location: live 地点",
+        "groups": "groups: 出演团体名称的列表",
+    }
+    lines = "\n".join(hints[f] for f in fields)
+    return f"""从下面的微博中提取以下字段, 只输出一个 JSON 对象, 没有的字段留空:
+{lines}
+publish_time={publish_time}
+{content}
+"""
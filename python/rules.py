@@ -0,0 +1,311 @@
+"""规则预提取
+
+很多演出情报按固定的格式书写, 例如:
+
+    8／31（日）📍聚一场/上海广场⏰OP17:45 / ST18:00 ... 💃演出团体💃
+    STARWINK（18:00～18:25）STARLIGHT（18:25～18:50）...
+
+这类微博不需要 LLM, 用正则就能取出 live 日期 (没写年份时按发布时间推断)、
+地点、开场/开演时间和团体出演时间表; 团体名连写在一起时用 jieba 按库中
+已知的团体名切分。每个字段按取得的把握计分, 总分为 confidence, 只有
+低于阈值的微博才交给 LLM。
+"""
+import logging
+import re
+from datetime import date, datetime, timedelta
+
+import jieba
+
+from normalize import GROUP_SEPARATORS
+
+# 修改规则后请递增, 写入记录的 extractor 字段, 便于之后按版本重新提取
+RULES_VERSION = 2
+# confidence 不低于该值时直接采用规则结果, 否则交给 LLM
+CONFIDENCE_THRESHOLD = 0.9
+# 各字段满分时的权重, 合计为 1
+WEIGHTS = {"date": 0.35, "location": 0.3, "groups": 0.25, "time": 0.1}
+# 超过这个长度的"团体名"多半是没切开的正文
+MAX_GROUP_NAME = 30
+
+EMOJI = "‼⌀-⏿☀-➿⬀-⯿\U0001f000-\U0001faff"
+WEEKDAY = re.compile(r"\s*[（(]\s*(?:周|星期)?[一二三四五六日天月火水木金土]\s*[)）]")
+# 2025年8月29日 / 2025.08.29 / 8月29日 / 8／31 / 8.31（日）
+DATE = re.compile(
+    r"(?<![\d.])(?:(?P<year>20\d{2})\s*[年.\-/／]\s*)?(?P<month>\d{1,2})\s*"
+    r"(?:月\s*(?P<d1>\d{1,2})\s*[日号]?|[/／]\s*(?P<d2>\d{1,2})|(?P<sep>[.\-])\s*(?P<d3>\d{1,2}))(?![\d:：])"
+)
+# 紧跟在日期后面的开票、开售时间不是演出日期
+SALE_AFTER = re.compile(r"\s*(?:[上中下]午|晚上?)?\s*(?:\d{1,2}\s*[:：]\s*\d{2})?\s*(?:开票|开售|开抢|开(?![场演始]))")
+
+# 开场/开演时间: 标签写在时间前 (OPEN: 11:45) 或时间后 (13:00 OPEN) 都可以
+TIME = re.compile(r"(?<![\d:：])(\d{1,2})\s*[:：]\s*(\d{2})(?!\d)")
+TIME_LABEL = r"(?<![A-Za-z])(OPEN|OP|START|ST|开场|入场|检票|开演|演出开始)(?![A-Za-z])(?:时间)?"
+LABEL_BEFORE = re.compile(rf"{TIME_LABEL}\s*[:：]?\s*$", re.I)
+LABEL_AFTER = re.compile(rf"\s*{TIME_LABEL}", re.I)
+OPEN_LABELS = ("open", "op", "开场", "入场", "检票")
+# 时间表中的一格: 18:00～18:25 / 19.30-19.50 / 1200-1220
+SLOT = re.compile(
+    r"(?<![\d:：.])(?:(\d{1,2})[:：.](\d{2})\s*[-~～〜—–至]+\s*(\d{1,2})[:：.](\d{2})"
+    r"|(\d{2})(\d{2})\s*[-~～〜—–]\s*(\d{2})(\d{2}))(?![\d:：])")
+# 连写的时间: START12:001200-1220 / 1200-12201220-1240, 匹配时间表前先断开
+GLUED_TIME = re.compile(
+    r"((?<![\d:：.])\d{1,2}[:：.]\d{2}|(?<!\d)\d{4}\s*[-~～〜—–]\s*\d{4})"
+    r"(?=\d{1,2}[:：.]\d{2}|\d{4}\s*[-~～〜—–])")
+# 时间表前后可以忽略的文字: 带标签的开场/开演时间、时间表的标题
+TIMETABLE_NOISE = re.compile(
+    rf"{TIME_LABEL}\s*[:：]?\s*(?:\d{{1,2}}\s*[:：]\s*\d{{2}})?|\d{{1,2}}\s*[:：]\s*\d{{2}}\s*{TIME_LABEL}"
+    r"|时间表|出演顺序|演出顺序|TIME\s*TABLE|\bTT\b", re.I)
+# 团体名中还留着时间, 说明时间表没有切分完整
+TIME_IN_NAME = re.compile(r"\d{1,2}[:：.]\d{2}|\d{4}\s*[-~～〜—–]")
+# 时间表中不是团体的格子
+NON_GROUP_SLOT = re.compile(r"检票|入场|开场|特典|物贩|休息|合影|抽奖|转场|散场|结束")
+# 团体名前后的分隔: 表情、冒号、括号等
+NAME_DELIMITER = re.compile(rf"[{EMOJI}：:】「」|｜■#』]|\s{{2,}}|-{{3,}}")
+NAME_END = re.compile(rf"[{EMOJI}】「|｜■#【\[※『]|\s{{2,}}|-{{3,}}|票务|门票|票价|特典|注意|TICKET", re.I)
+
+LOCATION_LABEL = re.compile(
+    r"(?:📍\s*)?(?:(?:活动|演出)?(?:场地名称|地[点址]|会场|场地|场馆)\s*[｜|:：]\s*|[📍🎤]\s*[｜|:：]?\s*)")
+LOCATION_END = re.compile(
+    rf"[{EMOJI}■【#\n]|票|预售|当日|场地地址|演出团|出演|\s{{2,}}"
+    r"|(?<![A-Za-z])(?:OPEN|START)(?![A-Za-z])\s*[:：]?\s*\d", re.I)
+MAX_LOCATION = 60
+GROUP_LABEL = re.compile(
+    r"(?:演出团体|出演团体|参演团体|演出阵容|出演阵容|LINE\s*UP|GUEST|特邀嘉宾)"
+    r"(?:[^\w@（(]{1,12}(?:[（(][^（()）]{0,20}[)）])?|[（(][^（()）]{0,20}[)）])", re.I)
+GROUP_END = re.compile(
+    rf"[{EMOJI}■【#\[※\n]|票务|门票|票价|TICKET|——|抽奖|注意事项|开演|开场|时间|地点|地址"
+    r"|\d{1,2}[:：]\d{2}|\s{3,}", re.I)
+MENTION = re.compile(r"@([^\s@，,、/／|｜]+)")
+TRAILER = re.compile(r"\s*(?:抽奖详情)?\s*(?:\[组图共\d+张\])?\s*原图\s*$")
+
+
+def infer_year(month: int, day: int, published: date):
+    """没写年份的日期: 取离发布时间最近的一年, 太久以前的日期视为明年"""
+    try:
+        candidate = date(published.year, month, day)
+        if candidate < published - timedelta(days=90):
+            candidate = date(published.year + 1, month, day)
+        elif candidate > published + timedelta(days=275):
+            candidate = date(published.year - 1, month, day)
+    except ValueError:
+        return None
+    return candidate
+
+
+def find_dates(text: str, published: date) -> list:
+    """正文中的演出日期, 按出现顺序去重, 不含开票时间"""
+    found = []
+    for m in DATE.finditer(text):
+        day = m.group("d1") or m.group("d2") or m.group("d3")
+        # 8.31 / 8-31 这种写法容易和时间、价格混淆, 要求带年份或星期
+        if m.group("sep") and not m.group("year") and not WEEKDAY.match(text, m.end()):
+            continue
+        if SALE_AFTER.match(text, m.end()):
+            continue
+        month, day = int(m.group("month")), int(day)
+        if not (1 <= month <= 12 and 1 <= day <= 31):
+            continue
+        if m.group("year"):
+            try:
+                found.append(date(int(m.group("year")), month, day))
+            except ValueError:
+                pass
+        else:
+            candidate = infer_year(month, day, published)
+            if candidate is not None:
+                found.append(candidate)
+    return list(dict.fromkeys(found))
+
+
+def find_times(text: str) -> dict:
+    """{"open": "HH:MM", "start": "HH:MM"}, 时间前后的标签优先看前面的"""
+    times = {}
+    for m in TIME.finditer(text):
+        label = LABEL_BEFORE.search(text, max(0, m.start() - 12), m.start()) or LABEL_AFTER.match(text, m.end())
+        if label is None:
+            continue
+        kind = "open" if label.group(1).lower() in OPEN_LABELS else "start"
+        times.setdefault(kind, f"{int(m.group(1)):02d}:{m.group(2)}")
+    return times
+
+
+def split_times(text: str) -> str:
+    """在连写的时间之间加空格"""
+    return GLUED_TIME.sub(r"\1 ", text)
+
+
+def clean_name(name: str) -> str:
+    return name.strip(" \t　,，、/／.。·-—~～@")
+
+
+def is_closing(text: str, pos: int) -> bool:
+    """pos 处的表情是否与前面几个字符内的表情相同, 即标签的后半个"""
+    return text[pos] in text[max(0, pos - 8):pos]
+
+
+class RuleExtractor:
+    """按固定格式解析演出情报, 返回与 LLM 相同的字段和 confidence"""
+
+    def __init__(self, normalizer, known_groups=()):
+        self.normalizer = normalizer
+        self.known_groups = {name for name in known_groups if name}
+        self.tokenizer = None
+
+    def cut(self, text: str) -> list:
+        """用已知团体名作为词典切分连写的团体名"""
+        if self.tokenizer is None:
+            jieba.setLogLevel(logging.WARNING)
+            self.tokenizer = jieba.Tokenizer()
+            for name in self.known_groups:
+                self.tokenizer.add_word(name, freq=10 ** 6)
+        return [token for token in self.tokenizer.cut(text, HMM=False) if clean_name(token)]
+
+    def location(self, text: str):
+        """返回 (地点, 得分): 标注了地点且能匹配到已知场地时满分"""
+        for m in LOCATION_LABEL.finditer(text):
+            end = LOCATION_END.search(text, m.end())
+            value = clean_name(text[m.end():end.start() if end else m.end() + 80])
+            if not value:
+                continue
+            matches = [v for v in self.normalizer.venue_matcher.find(value) if v["kind"] == "venue"]
+            if not matches:
+                return value[:MAX_LOCATION * 2], WEIGHTS["location"] / 2
+            if len(value) > MAX_LOCATION:
+                # 地址后面没有分隔符, 截到最后一个场地名为止
+                value = value[:max(v["start"] + len(v["keyword"]) for v in matches)]
+            return value, WEIGHTS["location"]
+        venues = self.normalizer.venues(text)
+        if len(venues) == 1:
+            return venues[0], WEIGHTS["location"] * 5 / 6
+        if venues:
+            return "、".join(venues), WEIGHTS["location"] / 3
+        return "", 0.0
+
+    def timetable(self, text: str):
+        """解析出演时间表, 团体名写在时间前 (带括号) 或时间后两种格式都支持
+
+        返回 (时间表, 团体名是否写在时间前, 是否完整)。有的格子没取到团体名,
+        或第一格之前、最后一格之后还有没解析的文字 (可能是漏掉的格子或团体)
+        时不完整。
+        """
+        slots = []
+        for m in SLOT.finditer(text):
+            h1, m1, h2, m2 = (int(g) for g in (m.groups()[:4] if m.group(1) else m.groups()[4:]))
+            if h1 < 30 and h2 < 30 and m1 < 60 and m2 < 60 and (h1, m1) < (h2, m2):
+                slots.append((m, f"{h1:02d}:{m1:02d}", f"{h2:02d}:{m2:02d}"))
+        if len(slots) < 2:
+            return [], False, False
+        wrapped = [text[:m.start()].rstrip()[-1:] in "（(" and text[m.end():].lstrip()[:1] in ")）"
+                   for m, _, _ in slots]
+        name_before = sum(wrapped) * 2 > len(slots)
+        entries = []
+        for i, (m, start, end) in enumerate(slots):
+            if name_before:
+                segment = text[slots[i - 1][0].end() if i else max(0, m.start() - 40):m.start()]
+                segment = segment.rstrip().rstrip("（(").lstrip(" ）)")
+                cuts = list(NAME_DELIMITER.finditer(segment))
+                name = segment[cuts[-1].end():] if cuts else segment
+            else:
+                segment = text[m.end():slots[i + 1][0].start() if i + 1 < len(slots) else m.end() + 40]
+                cut = NAME_END.search(segment)
+                name = segment[:cut.start()] if cut else segment
+                # StarHoney(无特典) 在 "特典" 处截断后去掉没闭合的括号
+                name = re.sub(r"[（(][^)）]*$", "", name)
+            entries.append({"start": start, "end": end, "name": clean_name(name)})
+        # 每格都取到了团体名, 且第一格之前、最后一格之后没有剩下的名称
+        complete = all(e["name"] and not TIME_IN_NAME.search(e["name"]) for e in entries)
+        first, last = slots[0][0], slots[-1][0]
+        if name_before:
+            head = text[max(0, first.start() - 40):first.start()]
+            tail = text[last.end():last.end() + 40].lstrip(" ）)")
+            cut = NAME_END.search(tail)
+            complete = (complete and (first.start() <= 40 or bool(NAME_DELIMITER.search(head)))
+                        and not clean_name(tail[:cut.start()] if cut else tail))
+        else:
+            head = TIMETABLE_NOISE.sub("  ", text[max(0, first.start() - 40):first.start()])
+            cuts = list(NAME_DELIMITER.finditer(head))
+            head = head[cuts[-1].end():] if cuts else head
+            tail = text[last.end():last.end() + 40]
+            complete = (complete and not clean_name(head)
+                        and (last.end() + 40 >= len(text) or bool(NAME_END.search(tail))))
+        return entries, name_before, complete
+
+    def group_section(self, text: str):
+        """返回 (团体名列表, 是否可靠): 团体名连写且含未知名称时不可靠"""
+        m = GROUP_LABEL.search(text)
+        if m is None:
+            return [], False
+        end = GROUP_END.search(text, m.end())
+        section = text[m.end():end.start() if end else m.end() + 300][:300].strip()
+        if GROUP_SEPARATORS.search(section):
+            return [clean_name(s) for s in GROUP_SEPARATORS.split(section)], True
+        if "@" in section:
+            return MENTION.findall(section), True
+        tokens = self.cut(section)
+        return tokens, bool(tokens) and all(t in self.known_groups for t in tokens)
+
+    def plausible(self, groups: list) -> bool:
+        """团体名过长或含场地名时, 多半把正文也当成了团体名"""
+        return all(len(name) <= MAX_GROUP_NAME and not self.normalizer.venues(name) for name in groups)
+
+    def layout(self, text: str, name_before: bool) -> str:
+        """按标签和时间表分行, 作为 main_text"""
+        text = TRAILER.sub("", text)
+        text = re.sub(r"\s{3,}", "\n", text)
+        if name_before:
+            text = re.sub(r"([（(]\s*\d{1,2}[:：.]\d{2}\s*[-~～〜—–至]+\s*\d{1,2}[:：.]\d{2}\s*[)）])", r"\1\n", text)
+        else:
+            text = SLOT.sub(lambda m: "\n" + m.group(), text)
+        text = re.sub(r"(?<=[^\n])(?=[■【])", "\n", text)
+        # 在每组表情前换行, 但 🎫门票🎫 这种首尾同一个表情的标签不拆开
+        text = re.sub(rf"(?<=[^\n{EMOJI}️])(?=[{EMOJI}])",
+                      lambda m: "" if is_closing(text, m.start()) else "\n", text)
+        return "\n".join(line.strip() for line in text.split("\n") if line.strip())
+
+    def extract(self, record: dict):
+        """返回 (字段, confidence)"""
+        content = split_times(record.get("content", ""))
+        try:
+            published = datetime.strptime(record.get("date", "")[:10], "%Y-%m-%d").date()
+        except ValueError:
+            published = date.today()
+
+        dates = find_dates(content, published)
+        score = 0.0
+        if len(dates) == 1:
+            score += WEIGHTS["date"]
+        elif dates:
+            # 多个日期时和 LLM 一样取最早的一天, 但可能是巡演或开票日期
+            score += WEIGHTS["date"] / 2
+
+        live_location, location_score = self.location(content)
+        score += location_score
+
+        timetable, name_before, complete = self.timetable(content)
+        groups = [e["name"] for e in timetable if e["name"] and not NON_GROUP_SLOT.search(e["name"])]
+        # 时间表不完整时可能漏了团体, 不能直接采用
+        reliable = bool(groups) and complete
+        if not groups:
+            groups, reliable = self.group_section(content)
+        groups = [name for _, name in self.normalizer.groups(groups)]
+        if groups:
+            reliable = reliable and self.plausible(groups)
+            score += WEIGHTS["groups"] if reliable else WEIGHTS["groups"] * 0.4
+
+        times = find_times(content)
+        if times or timetable:
+            score += WEIGHTS["time"]
+
+        score = round(score, 2)
+        fields = {
+            "live_date": str(min(dates)) if dates else "",
+            "live_location": live_location,
+            "groups": groups,
+            "main_text": self.layout(content, name_before),
+            "open_time": times.get("open", ""),
+            "start_time": times.get("start", ""),
+            "timetable": timetable,
+            "extractor": f"rules/{RULES_VERSION}",
+            "confidence": score,
+        }
+        return fields, score
@@ -0,0 +1,91 @@
+// 站内搜索, 读取 render.py 生成的 search/terms.json 与按月份的分片, 格式见 python/search.py
+//
+//   <script src="/search/search.js"></script>
+//   const search = new LiveSearch("/search/");
+//   await search.next("某团体");        // 今天及之后的演出: [[日期, 地点, [团体], 链接], ...]
+//   await search.next("育音堂", "venues");
+//   await search.terms("某团")          // 名称中包含输入的团体: [[key, 名称], ...]
+(function (global) {
+  "use strict";
+
+  // 与 search.py 的 search_key 相同: NFKC、Unicode 小写、去掉分隔符。
+  // JS 没有 casefold, 两边都用小写映射, ß/ss、ς/σ 这类写法不视为相同
+  function termKey(name) {
+    return name.normalize("NFKC").toLowerCase().replace(/[\s._\-·・]+/gu, "");
+  }
+
+  function LiveSearch(base) {
+    this.base = base || "search/";
+    this.dict = null;
+    this.shards = {};
+  }
+
+  LiveSearch.prototype.load = function () {
+    if (!this.dict) {
+      this.dict = fetch(this.base + "terms.json").then(function (r) { return r.json(); });
+    }
+    return this.dict;
+  };
+
+  LiveSearch.prototype.shard = function (month) {
+    if (!this.shards[month]) {
+      this.shards[month] = fetch(this.base + month + ".json").then(function (r) { return r.json(); });
+    }
+    return this.shards[month];
+  };
+
+  // 名称包含 query 的词, 完全相同的排在前面
+  LiveSearch.prototype.terms = function (query, kind) {
+    var key = termKey(query);
+    return this.load().then(function (dict) {
+      var entries = dict[kind || "groups"];
+      var found = [];
+      Object.keys(entries).forEach(function (k) {
+        if (key && k.indexOf(key) >= 0) found.push([k, entries[k][0]]);
+      });
+      return found.sort(function (a, b) { return (a[0] !== key) - (b[0] !== key) || a[0].length - b[0].length; });
+    });
+  };
+
+  // 今天 (或 since) 及之后的演出, 只加载月份掩码中出现该词的分片, 最多 limit 场
+  LiveSearch.prototype.next = function (name, kind, since, limit) {
+    var self = this;
+    kind = kind || "groups";
+    since = since || new Date(Date.now() - new Date().getTimezoneOffset() * 60000).toISOString().slice(0, 10);
+    limit = limit || 10;
+    return this.terms(name, kind).then(function (found) {
+      if (!found.length) return [];
+      var key = found[0][0];
+      return self.load().then(function (dict) {
+        var mask = BigInt("0x" + dict[kind][key][1]);
+        var months = dict.months.filter(function (m, i) {
+          return m >= since.slice(0, 7) && (mask >> BigInt(i)) & 1n;
+        });
+        var prefix = (kind === "groups" ? "g:" : "v:") + key;
+        var result = [];
+        // 逐月加载, 凑够 limit 场就不再请求后面的分片
+        function step(i) {
+          if (i >= months.length || result.length >= limit) return result.slice(0, limit);
+          return self.shard(months[i]).then(function (shard) {
+            (shard.postings[prefix] || []).forEach(function (n) {
+              if (shard.events[n][0] >= since) result.push(shard.events[n]);
+            });
+            return step(i + 1);
+          });
+        }
+        return step(0);
+      });
+    });
+  };
+
+  // 某一天的全部演出
+  LiveSearch.prototype.day = function (day) {
+    return this.shard(day.slice(0, 7)).then(function (shard) {
+      var span = shard.postings["d:" + day];
+      return span ? shard.events.slice(span[0], span[1]) : [];
+    }, function () { return []; });
+  };
+
+  LiveSearch.termKey = termKey;
+  global.LiveSearch = LiveSearch;
+})(typeof window !== "undefined" ? window : this);
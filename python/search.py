@@ -0,0 +1,116 @@
+"""站内搜索用的静态索引
+
+render.py 生成页面后调用 build_index, 把库中全部演出 (包括过去的) 按月份写成
+分片, 浏览器端由 search.js 查询, 不需要后端:
+
+    search/terms.json    词典, 每次都要加载, 只含团体/场地名称和它们出现的月份:
+        {"version": 2, "months": ["2025-08", "2025-09", ...],
+         "groups": {key: [名称, 月份掩码]}, "venues": {key: [名称, 月份掩码]}}
+    search/2025-09.json  一个月的分片:
+        {"month": "2025-09",
+         "events": [[日期, 地点, [团体, ...], 原文链接], ...],   按日期排序
+         "postings": {"g:key": [序号, ...], "v:key": [...], "d:2025-09-06": [起, 止)}}
+
+key 为 search_key 规范化后的名称 (大小写、全半角、分隔符不同的写法视为同一个),
+search.js 的 termKey 对输入做完全相同的处理后在词典中做子串匹配。与
+normalize.group_key 的区别是大小写用 lower() 而不是 casefold(): 浏览器没有
+casefold, 两边都用 Unicode 的小写映射才能保证 key 一致。因此 ß 与 ss、
+ς 与 σ 这类只有 casefold 才等同的写法在搜索中视为不同。月份掩码是
+十六进制的整数, 第 i 位为 1 表示该词在 months[i] 中出现, 查询 "团体 X 下一场
+在哪" 时只需加载掩码中今天及之后的头一个月份分片。
+
+词典的大小只随团体、场地的数量增长, 每多一个月每个词只多一位; 分片只在该月
+的记录变化时重写, 过去的月份基本不会再变。
+"""
+import hashlib
+import json
+import os
+import shutil
+import unicodedata
+
+from normalize import KEY_PUNCTUATION
+
+# 索引格式或 key 规则改变时加一, 全部分片重新生成
+INDEX_VERSION = 2
+SEARCH_DIR = "search"
+LOADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search.js")
+
+
+def search_key(name: str) -> str:
+    """与 search.js 的 termKey 一致: NFKC、Unicode 小写、去掉分隔符"""
+    return KEY_PUNCTUATION.sub("", unicodedata.normalize("NFKC", name).lower())
+
+
+def build_shard(month: str, events: list) -> dict:
+    """一个月的演出列表与倒排表, events 为 store 中的记录"""
+    events = sorted(events, key=lambda e: e.get("live_date", ""))
+    rows, postings = [], {}
+    for i, event in enumerate(events):
+        day = str(event.get("live_date", ""))[:10]
+        groups = event.get("groups") or []
+        rows.append([day, event.get("live_location", "") or "", groups, event.get("url", "")])
+        for prefix, names in (("g", groups), ("v", event.get("venues") or [])):
+            for name in names:
+                postings.setdefault(f"{prefix}:{search_key(name)}", []).append(i)
+        span = postings.setdefault(f"d:{day}", [i, i])
+        span[1] = i + 1
+    return {"month": month, "events": rows, "postings": postings}
+
+
+def build_terms(months: list, occurrences) -> dict:
+    """occurrences 为 [(类别, 名称, 月份), ...], 类别为 groups 或 venues"""
+    position = {month: i for i, month in enumerate(months)}
+    masks = {"groups": {}, "venues": {}}
+    for kind, name, month in occurrences:
+        if month not in position:
+            continue
+        entry = masks[kind].setdefault(search_key(name), [name, 0])
+        entry[1] |= 1 << position[month]
+    return {
+        "version": INDEX_VERSION,
+        "months": months,
+        **{kind: {key: [name, format(mask, "x")] for key, (name, mask) in sorted(entries.items())}
+           for kind, entries in masks.items()},
+    }
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def build_index(store, html_dir: str, manifest: dict) -> int:
+    """按月份增量生成搜索索引, manifest["search"] 记录各月份上次的哈希, 返回重写的分片数"""
+    out_dir = os.path.join(html_dir, SEARCH_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    # 哈希带上索引版本, 版本变化时全部重建
+    digests = {month: f"{INDEX_VERSION}:{digest}" for month, digest in store.month_digests().items()}
+    old = manifest.get("search", {})
+    rebuilt = 0
+    for month, digest in digests.items():
+        path = os.path.join(out_dir, f"{month}.json")
+        if old.get(month) == digest and os.path.isfile(path):
+            continue
+        events = store.events_between(f"{month}-01", f"{month}-31")
+        write_json(path, build_shard(month, events))
+        rebuilt += 1
+    # 库中已经没有记录的月份删除分片
+    for month in set(old) - set(digests):
+        path = os.path.join(out_dir, f"{month}.json")
+        if os.path.isfile(path):
+            os.remove(path)
+
+    terms_path = os.path.join(out_dir, "terms.json")
+    if rebuilt or set(old) != set(digests) or not os.path.isfile(terms_path):
+        write_json(terms_path, build_terms(list(digests), store.term_months()))
+    loader_path = os.path.join(out_dir, "search.js")
+    if not os.path.isfile(loader_path) or file_hash(loader_path) != file_hash(LOADER):
+        shutil.copyfile(LOADER, loader_path)
+    manifest["search"] = digests
+    return rebuilt
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,324 @@
+"""演出信息库
+
+llm.py 提取出的演出统一存放在一个 SQLite 文件中 (WAL 模式), 每条微博一行,
+完整记录以 JSON 保存在 doc 列, 常用的查询条件单独成列并建索引:
+
+    events(weibo_id, day, live_date, venue, live_location, doc)
+    groups(id, key, name)            venues(id, name)
+    group_events(group_id, weibo_id) venue_events(venue_id, weibo_id)
+
+day 为 live_date 中可解析的日期 (YYYY-MM-DD), 解析不了时为 special,
+与原来按日期分的 TinyDB 文件一一对应。
+
+写入时先经 normalize.py 规范化: doc 中的 groups 统一为规范名称列表,
+并新增 venues 列表。团体和场地第一次出现时分配 ID, 之后不再变化, 团体的
+展示名称取第一次出现时的写法 (别名表中指定了名称的除外)。group_events 与
+venue_events 是从团体/场地到微博的倒排索引, 按团体、场地查询只需一次索引查找。
+别名表或场地表的版本变化时, 打开数据库会按新规则重建倒排索引。
+
+从 database/tinydb 迁移 (可重复执行, 按 weibo_id 覆盖):
+    python python/store.py migrate --tinydb database/tinydb --db database/events.db
+修改别名表后手动重建:
+    python python/store.py reindex
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from normalize import load_normalizer
+
+DB_PATH = "database/events.db"
+SPECIAL_DAY = "special"
+# 表结构版本, 存在 PRAGMA user_version 中
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    weibo_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    live_date TEXT NOT NULL DEFAULT '',
+    venue TEXT NOT NULL DEFAULT '',
+    live_location TEXT NOT NULL DEFAULT '',
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_day ON events(day, live_date);
+CREATE INDEX IF NOT EXISTS events_venue ON events(venue, day);
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS venues (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS group_events (
+    group_id INTEGER NOT NULL REFERENCES groups(id),
+    weibo_id TEXT NOT NULL REFERENCES events(weibo_id) ON DELETE CASCADE,
+    PRIMARY KEY (group_id, weibo_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS group_events_weibo ON group_events(weibo_id);
+CREATE TABLE IF NOT EXISTS venue_events (
+    venue_id INTEGER NOT NULL REFERENCES venues(id),
+    weibo_id TEXT NOT NULL REFERENCES events(weibo_id) ON DELETE CASCADE,
+    PRIMARY KEY (venue_id, weibo_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS venue_events_weibo ON venue_events(weibo_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def day_for(record: dict) -> str:
+    """记录所属的日期, 规则同原来的 llm.db_path_for"""
+    try:
+        return datetime.strptime(record.get("live_date", ""), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except Exception:
+        return SPECIAL_DAY
+
+
+class EventStore:
+    """演出信息库, 写入在 commit() 或 close() 时一次提交"""
+
+    def __init__(self, path: str = DB_PATH, normalizer=None):
+        self.path = path
+        self.normalizer = normalizer or load_normalizer()
+        # 规范化 key/名称 -> (ID, 名称) 的内存缓存, 同一团体只查一次库
+        self.group_ids = {}
+        self.venue_ids = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            # 版本 1 的 event_groups 只保存了拆分后的原始团体名
+            self.conn.execute("DROP TABLE IF EXISTS event_groups")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if version < SCHEMA_VERSION or self.get_meta("normalizer") != self.normalizer.version:
+            self.reindex()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def group_ref(self, key: str, name: str):
+        """团体的 (ID, 展示名称), 第一次出现时分配 ID"""
+        ref = self.group_ids.get(key)
+        if ref is None:
+            self.conn.execute("INSERT OR IGNORE INTO groups (key, name) VALUES (?, ?)", (key, name))
+            if self.normalizer.aliases.get(key) == name:
+                # 别名表指定的名称优先于第一次出现时的写法
+                self.conn.execute("UPDATE groups SET name = ? WHERE key = ?", (name, key))
+            ref = self.conn.execute("SELECT id, name FROM groups WHERE key = ?", (key,)).fetchone()
+            self.group_ids[key] = ref
+        return ref
+
+    def venue_ref(self, name: str):
+        ref = self.venue_ids.get(name)
+        if ref is None:
+            self.conn.execute("INSERT OR IGNORE INTO venues (name) VALUES (?)", (name,))
+            ref = self.conn.execute("SELECT id, name FROM venues WHERE name = ?", (name,)).fetchone()
+            self.venue_ids[name] = ref
+        return ref
+
+    def normalize(self, record: dict):
+        """返回 (规范化后的记录, 团体 ID 列表, 场地 ID 列表)"""
+        groups = [self.group_ref(key, name) for key, name in self.normalizer.groups(record.get("groups"))]
+        venues = [self.venue_ref(name) for name in self.normalizer.venues(record.get("live_location", ""))]
+        record = dict(record, groups=[name for _, name in groups], venues=[name for _, name in venues])
+        return record, [gid for gid, _ in groups], [vid for vid, _ in venues]
+
+    def upsert(self, record: dict) -> bool:
+        """如果已存在则覆盖，否则插入; 返回是否覆盖了已有记录"""
+        weibo_id = record.get("weibo_id", "")
+        existed = self.conn.execute("SELECT 1 FROM events WHERE weibo_id = ?", (weibo_id,)).fetchone()
+        record, group_ids, venue_ids = self.normalize(record)
+        # ON CONFLICT DO UPDATE 保留原来的 rowid, 同一天内仍按首次插入的顺序排列
+        self.conn.execute(
+            "INSERT INTO events (weibo_id, day, live_date, venue, live_location, doc) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(weibo_id) DO UPDATE SET day = excluded.day, live_date = excluded.live_date, "
+            "venue = excluded.venue, live_location = excluded.live_location, doc = excluded.doc",
+            (weibo_id, day_for(record), str(record.get("live_date", "") or ""),
+             record["venues"][0] if record["venues"] else "",
+             str(record.get("live_location", "") or ""), json.dumps(record, ensure_ascii=False)),
+        )
+        self.conn.execute("DELETE FROM group_events WHERE weibo_id = ?", (weibo_id,))
+        self.conn.execute("DELETE FROM venue_events WHERE weibo_id = ?", (weibo_id,))
+        self.conn.executemany("INSERT OR IGNORE INTO group_events (group_id, weibo_id) VALUES (?, ?)",
+                              [(gid, weibo_id) for gid in group_ids])
+        self.conn.executemany("INSERT OR IGNORE INTO venue_events (venue_id, weibo_id) VALUES (?, ?)",
+                              [(vid, weibo_id) for vid in venue_ids])
+        return existed is not None
+
+    def reindex(self):
+        """按当前的别名表重新规范化全部记录并重建倒排索引, 已分配的 ID 保持不变"""
+        rows = self.conn.execute("SELECT doc FROM events ORDER BY rowid").fetchall()
+        for doc, in rows:
+            self.upsert(json.loads(doc))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('normalizer', ?)",
+                          (self.normalizer.version,))
+        self.conn.commit()
+        return len(rows)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def query(self, where: str = "1", params=()) -> list:
+        rows = self.conn.execute(
+            f"SELECT doc FROM events WHERE {where} ORDER BY live_date, rowid", params)
+        return [json.loads(doc) for doc, in rows]
+
+    def days(self, since: str = "") -> list:
+        """有演出的日期 (不含 special), 升序"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT day FROM events WHERE day >= ? AND day != ? ORDER BY day", (since, SPECIAL_DAY))
+        return [day for day, in rows]
+
+    def events_on(self, day: str) -> list:
+        """某一天的演出, 按 live_date 排序"""
+        return self.query("day = ?", (day,))
+
+    def events_between(self, start: str, end: str) -> list:
+        """start <= 日期 <= end 的演出"""
+        return self.query("day >= ? AND day <= ? AND day != ?", (start, end, SPECIAL_DAY))
+
+    def group_id(self, group: str):
+        """任意写法的团体名对应的 ID, 不存在时为 None"""
+        keys = self.normalizer.groups([group])
+        if not keys:
+            return None
+        row = self.conn.execute("SELECT id FROM groups WHERE key = ?", (keys[0][0],)).fetchone()
+        return row[0] if row else None
+
+    def venue_id(self, venue: str):
+        names = self.normalizer.venues(venue) or [venue]
+        row = self.conn.execute("SELECT id FROM venues WHERE name = ?", (names[0],)).fetchone()
+        return row[0] if row else None
+
+    def group_names(self) -> list:
+        """库中已有的全部团体规范名称"""
+        return [name for name, in self.conn.execute("SELECT name FROM groups ORDER BY id")]
+
+    def events_at_venue(self, venue: str, since: str = "") -> list:
+        """某个场地 since 之后的演出"""
+        return self.query(
+            "weibo_id IN (SELECT weibo_id FROM venue_events WHERE venue_id = ?) AND day >= ? AND day != ?",
+            (self.venue_id(venue), since, SPECIAL_DAY))
+
+    def events_for_group(self, group: str, since: str = "") -> list:
+        """某个团体 since 之后的演出, 即团体的日程"""
+        return self.query(
+            "weibo_id IN (SELECT weibo_id FROM group_events WHERE group_id = ?) AND day >= ? AND day != ?",
+            (self.group_id(group), since, SPECIAL_DAY))
+
+    def venues_for_group(self, group: str, since: str = "") -> list:
+        """某个团体在哪些场地演出: [(场地, 场次), ...], 场次多的在前"""
+        return self.conn.execute(
+            "SELECT v.name, COUNT(*) AS n FROM group_events g "
+            "JOIN venue_events ve ON ve.weibo_id = g.weibo_id JOIN venues v ON v.id = ve.venue_id "
+            "JOIN events e ON e.weibo_id = g.weibo_id "
+            "WHERE g.group_id = ? AND e.day >= ? AND e.day != ? GROUP BY v.id ORDER BY n DESC, v.name",
+            (self.group_id(group), since, SPECIAL_DAY)).fetchall()
+
+    def groups_at_venue(self, venue: str, since: str = "") -> list:
+        """某个场地有哪些团体演出: [(团体, 场次), ...], 场次多的在前"""
+        return self.conn.execute(
+            "SELECT gr.name, COUNT(*) AS n FROM venue_events ve "
+            "JOIN group_events g ON g.weibo_id = ve.weibo_id JOIN groups gr ON gr.id = g.group_id "
+            "JOIN events e ON e.weibo_id = ve.weibo_id "
+            "WHERE ve.venue_id = ? AND e.day >= ? AND e.day != ? GROUP BY gr.id ORDER BY n DESC, gr.name",
+            (self.venue_id(venue), since, SPECIAL_DAY)).fetchall()
+
+    def day_digest(self, day: str) -> str:
+        """某一天全部记录的哈希, 渲染时据此判断是否需要重新生成"""
+        digest = hashlib.sha256()
+        for doc, in self.conn.execute("SELECT doc FROM events WHERE day = ? ORDER BY rowid", (day,)):
+            digest.update(doc.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    def month_digests(self) -> dict:
+        """每个月 (YYYY-MM) 全部记录的哈希, 升序, 搜索索引据此只重写有变化的月份"""
+        digests = {}
+        rows = self.conn.execute(
+            "SELECT substr(day, 1, 7), doc FROM events WHERE day != ? ORDER BY day, rowid", (SPECIAL_DAY,))
+        for month, doc in rows:
+            digest = digests.get(month)
+            if digest is None:
+                digest = digests[month] = hashlib.sha256()
+            digest.update(doc.encode("utf-8"))
+            digest.update(b"\0")
+        return {month: digest.hexdigest()[:16] for month, digest in digests.items()}
+
+    def term_months(self) -> list:
+        """团体、场地出现过的月份: [("groups" 或 "venues", 名称, YYYY-MM), ...]"""
+        return self.conn.execute(
+            "SELECT DISTINCT 'groups', gr.name, substr(e.day, 1, 7) FROM group_events g "
+            "JOIN groups gr ON gr.id = g.group_id JOIN events e ON e.weibo_id = g.weibo_id WHERE e.day != ? "
+            "UNION ALL "
+            "SELECT DISTINCT 'venues', v.name, substr(e.day, 1, 7) FROM venue_events ve "
+            "JOIN venues v ON v.id = ve.venue_id JOIN events e ON e.weibo_id = ve.weibo_id WHERE e.day != ?",
+            (SPECIAL_DAY, SPECIAL_DAY)).fetchall()
+
+
+def migrate(tinydb_dir: str, store: EventStore) -> dict:
+    """把 tinydb_dir 下按日期分的 TinyDB 文件导入 store, 返回 {文件名: 条数}"""
+    counts = {}
+    for fname in sorted(os.listdir(tinydb_dir)):
+        if not fname.endswith(".json"):
+            continue
+        with open(os.path.join(tinydb_dir, fname), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        docs = data.get("_default", {})
+        for doc_id in sorted(docs, key=int):
+            store.upsert(docs[doc_id])
+        counts[fname] = len(docs)
+    store.commit()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="演出信息库工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="从按日期分的 TinyDB 文件导入")
+    p.add_argument("--tinydb", default="database/tinydb")
+    p.add_argument("--db", default=DB_PATH)
+    p = sub.add_parser("reindex", help="按当前别名表重新规范化并重建倒排索引")
+    p.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    with EventStore(args.db) as store:
+        if args.command == "migrate":
+            counts = migrate(args.tinydb, store)
+            print(f"导入 {len(counts)} 个文件共 {sum(counts.values())} 条记录", end=", ")
+        else:
+            print(f"重建 {store.reindex()} 条记录的索引", end=", ")
+        total, groups, venues = store.conn.execute(
+            "SELECT (SELECT COUNT(*) FROM events), (SELECT COUNT(*) FROM groups), (SELECT COUNT(*) FROM venues)"
+        ).fetchone()
+    print(f"库中现有 {total} 条演出、{groups} 个团体、{venues} 个场地: {args.db}")
+
+
+if __name__ == "__main__":
+    main()
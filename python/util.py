@@ -1,50 +1,235 @@
+import atexit
 import hashlib
+import io
 import json
 import logging
+import os
+import random
 import sys
+import threading
+import time
+from contextlib import nullcontext
+from urllib.parse import urlsplit
 
 import requests
 from lxml import etree
+from requests.adapters import HTTPAdapter
+
+from . import metrics
 
 # Set GENERATE_TEST_DATA to True when generating test data.
 GENERATE_TEST_DATA = False
+# 为 True 时不访问网络, 所有请求按url哈希从 TEST_DATA_DIR 读取录制好的响应
+REPLAY_TEST_DATA = False
 TEST_DATA_DIR = 'tests/testdata'
 URL_MAP_FILE = 'url_map.json'
+# 增量抓取的断点目录, 每个 user_uri 一个文件, 相对于爬虫运行目录
+CHECKPOINT_DIR = 'checkpoint'
+MAX_CHECKPOINT_IDS = 2000
+# HTTP 连接池与重试策略
+CONNECT_TIMEOUT = 10  # 建立连接超时(秒)
+READ_TIMEOUT = 30  # 读取响应超时(秒)
+POOL_MAXSIZE = 4  # 每个host最多同时保持的连接数, 超出时排队等待
+MAX_RETRIES = 3  # 连接失败或遇到 RETRY_STATUS 时的最大重试次数
+BACKOFF_BASE = 2  # 第n次重试前等待 BACKOFF_BASE * 2**n 秒, 再乘以 0.5~1.5 的随机抖动
+RETRY_STATUS = (418, 429, 500, 502, 503, 504)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36'
 logger = logging.getLogger('spider.util')
 
+_session = None
+_session_lock = threading.Lock()
+# 按host统计的请求次数、失败/重试次数和总耗时
+request_stats = {}
+_stats_lock = threading.Lock()
+_record_lock = threading.Lock()
+# host -> 信号量, 限制同一host同时进行的请求数。多账号并行抓取时由 crawl.py
+# 设为跨进程共享的信号量, 各工作进程合计不超过上限; 为空时只受 POOL_MAXSIZE 限制
+host_slots = {}
+
 
 def hash_url(url):
     return hashlib.sha224(url.encode('utf8')).hexdigest()
 
 
+def get_session():
+    """返回全局共享的 requests.Session, 所有解析器复用同一个连接池"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8,
+                                  pool_maxsize=POOL_MAXSIZE,
+                                  pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def _record_request(host, seconds, retries, failed):
+    with _stats_lock:
+        stats = request_stats.setdefault(host, {
+            'count': 0,
+            'retries': 0,
+            'errors': 0,
+            'seconds': 0.0,
+            'max_seconds': 0.0
+        })
+        stats['count'] += 1
+        stats['retries'] += retries
+        stats['errors'] += failed
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+    metrics.add_time('http.fetch', seconds)
+    metrics.count('http.requests')
+    metrics.count('http.retries', retries)
+    metrics.count('http.errors', failed)
+
+
+def log_request_stats():
+    """输出各host的请求次数与平均耗时"""
+    for host, stats in sorted(request_stats.items()):
+        logger.info(u'%s: 请求%d次, 重试%d次, 失败%d次, 平均耗时%.3f秒, 最长%.3f秒',
+                    host, stats['count'], stats['retries'], stats['errors'],
+                    stats['seconds'] / stats['count'], stats['max_seconds'])
+
+
+def write_run_report(path=''):
+    """写入爬虫阶段的运行报告, 由 crawl.py 在抓取结束后调用
+
+    不在退出时自动写入, 只是导入了本模块的进程 (benchmark.py、watch.py 等)
+    不会留下爬虫的报告。
+    """
+    return metrics.write_report('spider', path, hosts=request_stats)
+
+
+atexit.register(log_request_stats)
+
+
+def _retry_delay(attempt, resp=None):
+    if resp is not None:
+        retry_after = resp.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return int(retry_after)
+    return BACKOFF_BASE * (2**attempt) * (0.5 + random.random())
+
+
+def record_response(url, resp):
+    """录制响应, 文件名为url的哈希, url_map.json 记录url与文件的对应关系"""
+    resp_file = os.path.join(TEST_DATA_DIR, '%s.html' % hash_url(url))
+    with _record_lock:
+        if not os.path.isdir(TEST_DATA_DIR):
+            os.makedirs(TEST_DATA_DIR)
+        with io.open(resp_file, 'w', encoding='utf-8') as f:
+            f.write(resp.text)
+
+        url_map_file = os.path.join(TEST_DATA_DIR, URL_MAP_FILE)
+        if not os.path.isfile(url_map_file):
+            with io.open(url_map_file, 'w', encoding='utf-8') as f:
+                f.write('{}')
+        with io.open(url_map_file, 'r+', encoding='utf-8') as f:
+            url_map = json.loads(f.read())
+            url_map[url] = resp_file
+            f.seek(0)
+            f.write(json.dumps(url_map, indent=4, ensure_ascii=False))
+            f.truncate()
+
+
+def replay_response(url):
+    """从 TEST_DATA_DIR 读取录制的响应, 没有录制过时抛出 ConnectionError"""
+    resp_file = os.path.join(TEST_DATA_DIR, '%s.html' % hash_url(url))
+    if not os.path.isfile(resp_file):
+        raise requests.ConnectionError(u'回放数据中没有%s' % url)
+    resp = requests.Response()
+    with io.open(resp_file, 'rb') as f:
+        resp._content = f.read()
+    resp.status_code = 200
+    resp.encoding = 'utf-8'
+    resp.url = url
+    return resp
+
+
+def fetch(url, cookie='', headers=None):
+    """通过共享连接池发起GET请求
+
+    连接失败、超时或状态码属于 RETRY_STATUS 时按指数退避加随机抖动重试,
+    最终失败时抛出异常。REPLAY_TEST_DATA 为 True 时改为读取录制的响应。
+    """
+    if headers is None:
+        headers = {'User-Agent': USER_AGENT, 'Cookie': cookie}
+    host = urlsplit(url).netloc
+    start = time.perf_counter()
+    retries = 0
+    try:
+        if REPLAY_TEST_DATA:
+            resp = replay_response(url)
+            _record_request(host, time.perf_counter() - start, 0, 0)
+            return resp
+        while True:
+            try:
+                # 只在请求期间占用名额, 重试前的退避等待不占用
+                with host_slots.get(host) or nullcontext():
+                    resp = get_session().get(url,
+                                             headers=headers,
+                                             timeout=(CONNECT_TIMEOUT,
+                                                      READ_TIMEOUT))
+            except (requests.ConnectionError, requests.Timeout):
+                if retries >= MAX_RETRIES:
+                    raise
+                resp = None
+            if resp is not None and (resp.status_code not in RETRY_STATUS
+                                     or retries >= MAX_RETRIES):
+                resp.raise_for_status()
+                _record_request(host, time.perf_counter() - start, retries, 0)
+                if GENERATE_TEST_DATA:
+                    record_response(url, resp)
+                return resp
+            delay = _retry_delay(retries, resp)
+            logger.warning(u'请求%s失败(%s), %.1f秒后重试', url,
+                           resp.status_code if resp is not None else u'网络错误',
+                           delay)
+            time.sleep(delay)
+            retries += 1
+    except Exception:
+        _record_request(host, time.perf_counter() - start, retries, 1)
+        raise
+
+
 def handle_html(cookie, url):
     """处理html"""
     try:
-        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36'
-        headers = {'User-Agent': user_agent, 'Cookie': cookie}
-        resp = requests.get(url, headers=headers)
-
-        if GENERATE_TEST_DATA:
-            import io
-            import os
-
-            resp_file = os.path.join(TEST_DATA_DIR, '%s.html' % hash_url(url))
-            with io.open(resp_file, 'w', encoding='utf-8') as f:
-                f.write(resp.text)
-
-            with io.open(os.path.join(TEST_DATA_DIR, URL_MAP_FILE), 'r+') as f:
-                url_map = json.loads(f.read())
-                url_map[url] = resp_file
-                f.seek(0)
-                f.write(json.dumps(url_map, indent=4, ensure_ascii=False))
-                f.truncate()
-
-        selector = etree.HTML(resp.content)
+        resp = fetch(url, cookie)
+        with metrics.timer('http.parse_html'):
+            selector = etree.HTML(resp.content)
         return selector
     except Exception as e:
         logger.exception(e)
 
 
+def load_checkpoint(user_uri):
+    """读取用户的抓取断点: 最新微博id/发布时间及已处理过的微博id"""
+    checkpoint = {'newest_id': '', 'newest_time': '', 'seen_ids': []}
+    path = os.path.join(CHECKPOINT_DIR, '%s.json' % user_uri)
+    try:
+        if os.path.isfile(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                checkpoint.update(json.load(f))
+    except Exception as e:
+        logger.exception(e)
+    return checkpoint
+
+
+def save_checkpoint(user_uri, checkpoint):
+    """写回用户的抓取断点, 只保留最近 MAX_CHECKPOINT_IDS 个微博id"""
+    checkpoint['seen_ids'] = checkpoint['seen_ids'][:MAX_CHECKPOINT_IDS]
+    if not os.path.isdir(CHECKPOINT_DIR):
+        os.makedirs(CHECKPOINT_DIR)
+    path = os.path.join(CHECKPOINT_DIR, '%s.json' % user_uri)
+    with io.open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(checkpoint, indent=4, ensure_ascii=False))
+    os.replace(path + '.tmp', path)
+
+
 def handle_garbled(info):
     """处理乱码"""
     try:
@@ -89,10 +274,9 @@ def to_video_download_url(cookie, video_page_url):
 
     video_object_url = video_page_url.replace('m.weibo.cn/s/video/show',
                                               'm.weibo.cn/s/video/object')
+    video_url = ''
     try:
-        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36'
-        headers = {'User_Agent': user_agent, 'Cookie': cookie}
-        wb_info = requests.get(video_object_url, headers=headers).json()
+        wb_info = fetch(video_object_url, cookie).json()
         video_url = wb_info['data']['object']['stream'].get('hd_url')
         if not video_url:
             video_url = wb_info['data']['object']['stream']['url']
@@ -100,6 +284,8 @@ def to_video_download_url(cookie, video_page_url):
                 video_url = ''
     except json.decoder.JSONDecodeError:
         logger.warning(u'当前账号没有浏览该视频的权限')
+    except Exception as e:
+        logger.exception(e)
 
     return video_url
 
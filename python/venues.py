@@ -0,0 +1,111 @@
+"""演出场地匹配
+
+场地列表保存在 config/venues.json, 每个场地有名称、所在城市、类型和别名:
+
+    {"version": 1, "case_fold": "ascii",
+     "venues": [{"name": "THE BOXX", "city": "上海", "kind": "venue",
+                 "aliases": ["theboxx"]}, ...]}
+
+case_fold 为 "ascii" 时只把英文字母转为小写后再匹配 (MAO/mao/Mao 视为同一个),
+中文和全角字符保持原样, 因此匹配位置与原文一一对应; 为 "none" 时区分大小写。
+名称与全部别名编译成一个 Aho-Corasick 自动机, 对每条文本只扫描一遍,
+场地再多耗时也只和文本长度、命中数有关。回到根状态时用正则跳到下一个
+可能开始关键词的字符, 不相关的正文不进入 Python 循环。
+"""
+import json
+import os
+import re
+
+VENUES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "venues.json")
+CASE_FOLDS = ("none", "ascii")
+ASCII_UPPER = re.compile("[A-Z]+")
+
+
+class VenueMatcher:
+    """多模式匹配自动机, 一次扫描找出文本中出现的全部场地"""
+
+    def __init__(self, venues, case_fold="ascii", version=None):
+        if case_fold not in CASE_FOLDS:
+            raise ValueError(f"不支持的 case_fold: {case_fold}")
+        self.version = version
+        self.case_fold = case_fold
+        self.venues = venues
+        # goto[state] 为 {字符: 下一状态}, output[state] 为 [(关键词, 场地序号), ...]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, venue in enumerate(venues):
+            for keyword in [venue["name"], *venue.get("aliases", [])]:
+                self.add(keyword, index)
+        self.build()
+
+    def add(self, keyword, index):
+        state = 0
+        for char in self.fold(keyword):
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((keyword, index))
+
+    def build(self):
+        """按层计算失败指针, 并把失败链上的输出合并进来"""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.output[next_state] = self.output[next_state] + self.output[fail]
+                queue.append(next_state)
+        self.root_chars = re.compile("[%s]" % "".join(re.escape(c) for c in self.goto[0]))
+
+    def fold(self, text):
+        """按 case_fold 规则转换大小写, 不改变长度"""
+        if self.case_fold == "none":
+            return text
+        if text.isascii():
+            return text.lower()
+        return ASCII_UPPER.sub(lambda m: m.group().lower(), text)
+
+    def find(self, text):
+        """返回文本中每一处命中: {"venue", "city", "kind", "keyword", "start"}"""
+        matches = []
+        goto, fail, output = self.goto, self.fail, self.output
+        text = self.fold(text)
+        state = pos = 0
+        while pos < len(text):
+            if not state:
+                next_root = self.root_chars.search(text, pos)
+                if next_root is None:
+                    break
+                pos = next_root.start()
+            char = text[pos]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, index in output[state]:
+                venue = self.venues[index]
+                matches.append({
+                    "venue": venue["name"],
+                    "city": venue.get("city", ""),
+                    "kind": venue.get("kind", "venue"),
+                    "keyword": keyword,
+                    "start": pos - len(keyword) + 1,
+                })
+            pos += 1
+        matches.sort(key=lambda m: (m["start"], -len(m["keyword"])))
+        return matches
+
+
+def load_matcher(path=VENUES_FILE):
+    """读取场地数据文件并编译自动机"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return VenueMatcher(data["venues"], data.get("case_fold", "ascii"), data.get("version"))
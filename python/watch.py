@@ -0,0 +1,321 @@
+"""常驻进程: 定时轮询关注的账号, 新微博在进程内走完 筛选 → 提取 → 入库 → 渲染
+
+用法 (在仓库根目录运行, 与 llm.py、render.py 相同):
+    python python/watch.py --apikey xxx --interval 600 --jitter 0.3
+
+与 workflow 中每天一次的批处理相比, 以下状态在进程内一直保留, 不再每轮重建:
+- weibo_spider 的 Spider 与账号信息, util.py 的连接池 (weibo.cn 保持长连接);
+- 场地自动机、团体别名表、规则提取用的 jieba 分词器;
+- 已入库微博的索引 (generate_json.EmittedIndex) 与 LLM 结果缓存;
+- 演出信息库的连接, 以及 render.py 的渲染清单 (只重建有变化的日期)。
+
+每个账号按 interval 轮询, 每次的间隔乘以 1±jitter 的随机系数, 各账号的请求
+不会集中在同一时刻。util.py 的断点记录着已处理的微博, 没有新微博时一次轮询
+只请求个人主页第一页。一轮中抓到的新微博会追加到当天的 result_*.jsonl 与
+压缩归档 (archive.py), 与批处理的输出相同, 然后立刻入库并重新渲染; 入库之后
+才记入断点。成功入库的微博才记入去重索引, 提取失败的微博留到下一轮重新提取,
+启动时也会找回最近的结果文件中还没有入库的记录。
+
+config/accounts.json 改动后下一轮自动生效。收到 SIGINT/SIGTERM 时处理完
+当前一轮再退出。
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+import generate_json
+import llm
+import metrics
+import render
+from accounts import ACCOUNTS_FILE, load_accounts
+from archive import ARCHIVE_DIR, archive_records
+from rules import CONFIDENCE_THRESHOLD, RuleExtractor
+from store import DB_PATH, EventStore
+
+# 爬虫的 config.json 与断点目录, 与 crawl.py 共用
+SPIDER_DIR = "python/config"
+OUTPUT_DIR = "database/json"
+EMITTED_INDEX = "database/emitted_index.json"
+LLM_CACHE = "database/llm_cache.json"
+METRICS_FILE = "database/metrics.jsonl"
+# 每个账号的轮询间隔(秒)与随机抖动比例
+INTERVAL = 600
+JITTER = 0.3
+# 轮询时只看这么多天内发布的微博, 断点之前的微博本来也会停止翻页
+LOOKBACK_DAYS = 2
+# 运行报告的写入间隔(秒), 每次写入后重新累计
+REPORT_INTERVAL = 3600
+
+
+class Watcher:
+    """持有各阶段常驻内存的状态, run_once 处理一轮到期的账号"""
+
+    def __init__(self, args):
+        from absl import flags
+        from weibo_spider.parser import page_parser, util
+
+        self.args = args
+        self.stop = threading.Event()
+        self.accounts_mtime = None
+        self.accounts = {}
+        self.due = {}
+        self.spiders = {}
+        with open(os.path.join(args.spider_dir, "config.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        # Spider 从命令行参数读取配置, 这里不写结果文件, 只需标记为已解析
+        if not flags.FLAGS.is_parsed():
+            flags.FLAGS(["watch"])
+        util.CHECKPOINT_DIR = os.path.join(args.spider_dir, util.CHECKPOINT_DIR)
+        page_parser.FIELDS = generate_json.SPIDER_FIELDS
+
+        llm.API_KEY = args.apikey
+        llm.API_URL = args.api_url
+        llm.configure_pool(args.workers, args.rps)
+        llm.cache = llm.LLMCache("" if args.no_cache else args.cache)
+        self.index = generate_json.EmittedIndex(args.index).load(seed_dir=args.output_dir)
+        # 已写入结果文件但还没有入库的记录, weibo_id -> 记录, 随新记录一起重新提取,
+        # 没有新记录时每隔 interval 秒单独重试一次
+        self.pending = {r["weibo_id"]: r for r in generate_json.unstored_records(args.output_dir, self.index)}
+        self.retried = float("-inf")
+        self.store = EventStore(args.db)
+        self.extractor = None
+        self.extractor_groups = None
+        self.reported = time.monotonic()
+
+    # -------- 账号与调度 --------
+    def reload_accounts(self):
+        """accounts.json 有改动时重新读取, 新账号立刻轮询, 删除的账号不再轮询"""
+        mtime = os.path.getmtime(self.args.accounts)
+        if mtime == self.accounts_mtime:
+            return
+        self.accounts_mtime = mtime
+        self.accounts = {a["id"]: a for a in load_accounts(self.args.accounts)}
+        self.due = {uid: self.due.get(uid, 0.0) for uid in self.accounts}
+        self.spiders = {uid: s for uid, s in self.spiders.items() if uid in self.accounts}
+        print(f"关注 {len(self.accounts)} 个账号")
+
+    def schedule(self, uid):
+        interval = self.args.interval * random.uniform(1 - self.args.jitter, 1 + self.args.jitter)
+        self.due[uid] = time.monotonic() + interval
+
+    def due_accounts(self):
+        now = time.monotonic()
+        return [self.accounts[uid] for uid, due in sorted(self.due.items(), key=lambda kv: kv[1]) if due <= now]
+
+    # -------- 抓取 --------
+    def spider_for(self, account):
+        """每个账号一个常驻的 Spider, 账号信息只在第一次轮询时抓取"""
+        from weibo_spider.spider import Spider
+
+        spider = self.spiders.get(account["id"])
+        if spider is None:
+            spider = Spider({**self.config, "user_id_list": [{"id": account["id"]}], "write_mode": [],
+                             "pic_download": 0, "video_download": 0})
+            spider.get_user_info(account["id"])
+            if not spider.user:
+                raise RuntimeError("获取账号信息失败")
+            self.spiders[account["id"]] = spider
+        return spider
+
+    def poll(self, account):
+        """抓取账号自上次轮询以来的新微博, 返回 Weibo 列表"""
+        spider = self.spider_for(account)
+        since = datetime.now() - timedelta(days=LOOKBACK_DAYS)
+        spider.initialize_info({"user_uri": account["id"], "since_date": since.strftime("%Y-%m-%d"),
+                                "end_date": "now"})
+        weibos = []
+        with metrics.timer("watch.poll"):
+            for page in spider.get_weibo_info():
+                weibos += page
+        return weibos
+
+    # -------- 筛选 → 提取 → 入库 → 渲染 --------
+    def rule_extractor(self):
+        """团体名单变了才重建规则提取器 (jieba 分词器的构建较慢)"""
+        if self.args.no_rules:
+            return None
+        groups = self.store.group_names()
+        if groups != self.extractor_groups:
+            self.extractor = RuleExtractor(self.store.normalizer, groups)
+            self.extractor_groups = groups
+        return self.extractor
+
+    def filter(self, weibos, account, seen):
+        """筛选出新的演出情报; 入库之前不改动索引, seen 为本轮已选出的内容哈希"""
+        records = []
+        for weibo in weibos:
+            record, _ = generate_json.to_record(weibo.__dict__, account)
+            if record is None or self.index.check(record) is None:
+                continue
+            digest = generate_json.content_hash(record["content"])
+            if digest in seen:
+                continue
+            seen.add(digest)
+            self.pending.pop(record["weibo_id"], None)
+            records.append(record)
+        return records
+
+    def process(self, records):
+        """新记录追加到当天的结果文件, 连同之前未入库的记录一起入库并重新渲染, 返回写入的条数"""
+        output_file = os.path.join(self.args.output_dir, f"result_{datetime.now():%Y-%m-%d}.jsonl")
+        os.makedirs(self.args.output_dir, exist_ok=True)
+        with open(output_file, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        archive_records("raw", records, self.args.archive)
+
+        records = records + list(self.pending.values())
+        with metrics.timer("watch.extract"):
+            new_records, _ = llm.process_records(records, self.store, self.rule_extractor(),
+                                                 self.args.rule_threshold, self.args.workers,
+                                                 self.args.batch_size)
+        with metrics.timer("store.commit"):
+            self.store.commit()
+        # 入库之后才记入索引, 没有入库的下一轮重新提取
+        llm.mark_stored(self.index, records, new_records)
+        self.index.save()
+        self.pending = {r["weibo_id"]: r for r in records if self.index.check(r) is not None}
+        archive_records("events", new_records, self.args.archive)
+        llm.cache.save()
+        with metrics.timer("watch.render"):
+            render.render(self.store)
+        return len(new_records)
+
+    def commit_checkpoints(self, polled):
+        """本轮的微博都已处理, 记入各账号的断点"""
+        from weibo_spider.parser import page_parser
+
+        for uid, weibos in polled:
+            page_parser.commit_checkpoint(uid, weibos)
+
+    def run_once(self):
+        """轮询到期的账号, 有新微博时走完整条流水线, 返回写入的记录数
+
+        断点在整条流水线完成后才更新, 中途出错时只计入 watch.errors, 这些微博
+        下一轮会重新抓取。
+        """
+        self.reload_accounts()
+        records = []
+        polled = []
+        seen = set()
+        wait = self.config.get("random_wait_seconds", [0, 0])
+        for i, account in enumerate(self.due_accounts()):
+            # 与 Spider.start 一样在账号之间随机等待
+            if self.stop.is_set() or (i and self.stop.wait(random.uniform(min(wait), max(wait)))):
+                break
+            try:
+                weibos = self.poll(account)
+                polled.append((account["id"], weibos))
+                metrics.count("watch.polls")
+                metrics.count("watch.weibos", len(weibos))
+                found = self.filter(weibos, account, seen)
+                records += found
+                if found:
+                    print(f"{account['id']} {account.get('name', '')}: 新微博 {len(weibos)} 条, 演出情报 {len(found)} 条")
+            except Exception as e:
+                metrics.count("watch.errors")
+                print(f"轮询账号 {account['id']} 出错:", e)
+            self.schedule(account["id"])
+        if not records and (not self.pending or time.monotonic() - self.retried < self.args.interval):
+            self.commit_checkpoints(polled)
+            return 0
+        start = time.perf_counter()
+        retried = len(self.pending)
+        self.retried = time.monotonic()
+        try:
+            written = self.process(records)
+        except Exception as e:
+            metrics.count("watch.errors")
+            print(f"{datetime.now():%H:%M:%S} 处理 {len(records)} 条演出情报出错, 下一轮重新抓取:", e)
+            return 0
+        self.commit_checkpoints(polled)
+        print(f"{datetime.now():%H:%M:%S} 处理 {len(records)} 条演出情报, 重新提取 {retried} 条, 入库 {written} 条, "
+              f"耗时 {time.perf_counter() - start:.1f}s")
+        metrics.count("watch.records", written)
+        return written
+
+    def report(self, force=False):
+        from weibo_spider.parser import metrics as spider_metrics
+
+        if force or time.monotonic() - self.reported >= REPORT_INTERVAL:
+            # 爬虫模块的指标 (http.fetch 等) 记在 weibo_spider.parser.metrics 中, 一并写入
+            metrics.merge(spider_metrics.export())
+            spider_metrics.reset()
+            metrics.write_report("watch", self.args.metrics, accounts=len(self.accounts))
+            metrics.reset()
+            self.reported = time.monotonic()
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                # 如 accounts.json 写到一半, 下一轮再试, 不让常驻进程退出
+                metrics.count("watch.errors")
+                print("本轮轮询出错:", e)
+            self.report()
+            if not self.due:
+                self.stop.wait(self.args.interval)
+                continue
+            # 等到下一个账号到期, 收到退出信号时立即醒来
+            self.stop.wait(max(0.0, min(self.due.values()) - time.monotonic()))
+        self.report(force=True)
+
+    def close(self):
+        self.index.save()
+        llm.cache.save()
+        self.store.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="常驻轮询关注的账号, 新微博即时入库并渲染")
+    parser.add_argument("--apikey", required=True, help="百度 LLM API Key")
+    parser.add_argument("--api_url", default=llm.API_URL)
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE, help="账号列表, 见 accounts.py")
+    parser.add_argument("--spider_dir", default=SPIDER_DIR, help="爬虫 config.json 与断点所在目录")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="每个账号的轮询间隔(秒)")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="轮询间隔的随机抖动比例")
+    parser.add_argument("--once", action="store_true", help="只轮询一轮全部账号后退出")
+    parser.add_argument("--db", default=DB_PATH, help="演出信息库 (SQLite) 路径")
+    parser.add_argument("--output_dir", default=OUTPUT_DIR, help="筛选结果 result_*.jsonl 的目录")
+    parser.add_argument("--index", default=EMITTED_INDEX, help="跨天去重索引文件")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="压缩归档目录, 为空时不归档")
+    parser.add_argument("--cache", default=LLM_CACHE, help="LLM 结果缓存文件")
+    parser.add_argument("--no_cache", action="store_true", help="不读写 LLM 缓存")
+    parser.add_argument("--workers", type=int, default=2, help="同时在途的 LLM 请求数")
+    parser.add_argument("--rps", type=float, default=2, help="每秒最多发起的 LLM 请求数")
+    parser.add_argument("--batch_size", type=int, default=1, help="每次 LLM 请求最多打包的微博条数")
+    parser.add_argument("--no_rules", action="store_true", help="不做规则预提取, 全部交给 LLM")
+    parser.add_argument("--rule_threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--metrics", default=METRICS_FILE, help="运行报告 (JSONL) 路径, 为空时不写")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.reset()
+    watcher = Watcher(args)
+
+    def request_stop(signum, frame):
+        print("收到退出信号, 处理完当前一轮后退出")
+        watcher.stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    try:
+        if args.once:
+            watcher.run_once()
+            watcher.report(force=True)
+        else:
+            watcher.run()
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()